@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+export_benchmark.py - 导出吞吐量和内存基准测试
+
+生成指定尺寸的8位和16位测试图片，用 export_jobs.export_image 反复导出，
+输出每种情况的吞吐量（百万像素/秒）和处理时进程的内存峰值增量。
+测试图片的生成和每种情况都在新启动的进程中运行，主进程保持很小，
+子进程从父进程继承的内存峰值不会掩盖导出时的增量。
+
+--startup 改为测量界面的启动耗时：反复启动 main.py 的主窗口，
+记录从启动进程到窗口第一次显示完成的时间（包括解释器启动和模块导入），
+以及程序自己统计的 startup_ms。没有显示器时使用 Qt 的 offscreen 平台。
+
+示例:
+    python export_benchmark.py --size 6000x4000 -n 5
+    python export_benchmark.py --cases rgb48-tiff gray16-png
+    python export_benchmark.py --startup 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 测试情况：名称 -> (源图片类型, 导出格式)
+CASES = {
+    "rgb8-tiff": ("rgb8", "tiff"),
+    "rgb8-jpeg": ("rgb8", "jpeg"),
+    "gray16-tiff": ("gray16", "tiff"),
+    "gray16-png": ("gray16", "png"),
+    "rgb48-tiff": ("rgb48", "tiff"),
+    "rgb48-png": ("rgb48", "png"),
+    "rgb48-jpeg": ("rgb48", "jpeg"),
+}
+
+# 测试使用的水印设置（模板字段）
+BENCHMARK_TEMPLATE = {"type": "text", "text": "SAMPLE 样片", "font_size": 160, "opacity": 60, "rotation": 30}
+
+
+# 启动测量使用的子进程脚本：窗口第一次显示完成后输出启动用时并立即退出
+STARTUP_SCRIPT = """
+import os, sys
+import main
+from PyQt5.QtWidgets import QApplication
+
+finish_startup = main.WatermarkApp.finish_startup
+
+def report_startup(self):
+    finish_startup(self)
+    print("STARTUP", self.startup_ms, flush=True)
+    # 不保存设置、不等待后台线程，直接结束
+    os._exit(0)
+
+main.WatermarkApp.finish_startup = report_startup
+app = QApplication(sys.argv)
+app.setStyle("Fusion")
+window = main.WatermarkApp()
+window.show()
+app.exec_()
+"""
+
+# 单次启动的超时时间（秒）
+STARTUP_TIMEOUT = 60
+
+
+def write_source(kind, size, path):
+    """生成渐变测试图片（16位彩色图片需要 OpenCV）"""
+    import numpy as np
+    from PIL import Image
+
+    width, height = size
+    ramp = np.linspace(0, 65535, width, dtype=np.float64)[None, :] * np.ones((height, 1))
+    gray = ramp.astype(np.uint16)
+    if kind == "gray16":
+        Image.fromarray(gray).save(path, "TIFF")
+    elif kind == "rgb48":
+        import cv2
+        rgb = np.stack([gray, gray[:, ::-1], np.full_like(gray, 20000)], axis=2)
+        ok, data = cv2.imencode(".tiff", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+        if not ok:
+            raise RuntimeError("无法生成48位测试图片")
+        data.tofile(path)
+    else:
+        rgb = np.stack([gray >> 8, gray[:, ::-1] >> 8, np.full_like(gray, 80)], axis=2).astype(np.uint8)
+        Image.fromarray(rgb).save(path, "TIFF")
+
+
+def run_case(source_path, export_format, repeat, output_dir):
+    """
+    在当前（新启动的）进程中反复导出同一张图片
+
+    Returns:
+        (每张耗时列表（秒）, 内存峰值增量（字节），无法获取时为None)
+    """
+    import export_jobs
+    from memory_governor import process_peak_rss
+    from template_store import template_to_settings
+    from worker_pool import warm_worker
+
+    settings = template_to_settings(BENCHMARK_TEMPLATE)
+    options = {"format": export_format, "naming_rule": {"type": "original", "value": ""},
+               "quality": 90, "resize_option": None}
+    output_path = os.path.join(output_dir, f"benchmark.{export_format}")
+
+    # 字体加载等一次性的内存和耗时不计入
+    warm_worker(settings)
+    baseline = process_peak_rss()
+    export_jobs.export_image(source_path, settings, output_path, options)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        export_jobs.export_image(source_path, settings, output_path, options)
+        timings.append(time.perf_counter() - start)
+
+    peak = process_peak_rss()
+    return timings, (peak - baseline if peak is not None and baseline is not None else None)
+
+
+def measure_startup(work_dir):
+    """
+    启动一次主窗口
+
+    Returns:
+        (从启动进程到窗口显示完成的毫秒数, 程序统计的 startup_ms)
+    """
+    env = dict(os.environ)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [repo_dir, env.get("PYTHONPATH")]))
+    if sys.platform.startswith("linux") and not (env.get("DISPLAY") or env.get("WAYLAND_DISPLAY")):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    # 在临时目录中运行，配置文件和字体索引不写入程序目录
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", STARTUP_SCRIPT], cwd=work_dir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in process.stdout:
+            if line.startswith("STARTUP "):
+                launch_ms = (time.perf_counter() - start) * 1000
+                return launch_ms, float(line.split()[1])
+        raise RuntimeError("窗口没有显示")
+    finally:
+        try:
+            process.wait(timeout=STARTUP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_startup(runs):
+    """反复启动主窗口并输出每次的启动耗时"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"启动 {runs} 次（第1次没有配置文件和字体索引）")
+        print(f"{'次数':<8}{'启动到显示(ms)':>16}{'startup_ms':>14}")
+        launches = []
+        for run in range(1, runs + 1):
+            try:
+                launch_ms, startup_ms = measure_startup(work_dir)
+            except Exception as e:
+                print(f"{run:<8}失败: {e}")
+                continue
+            launches.append(launch_ms)
+            print(f"{run:<8}{launch_ms:>16.0f}{startup_ms:>14.0f}")
+        if launches:
+            print(f"{'中位数':<8}{sorted(launches)[len(launches) // 2]:>16.0f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出吞吐量和内存基准测试")
+    parser.add_argument("--size", default="6000x4000", help="测试图片尺寸，格式为 宽x高")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="每种情况导出的次数")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES), help="要运行的测试情况")
+    parser.add_argument("--startup", type=int, metavar="N", default=None, help="改为测量界面启动耗时，启动N次")
+    args = parser.parse_args()
+
+    if args.startup is not None:
+        return run_startup(max(1, args.startup))
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    megapixels = width * height / 1e6
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        sources = {}
+        print(f"图片尺寸 {width}x{height}（{megapixels:.1f} 百万像素），每种情况 {args.repeat} 次")
+        print(f"{'情况':<14}{'百万像素/秒':>12}{'每张(ms)':>12}{'内存峰值增量(MB)':>20}")
+        for case in args.cases:
+            kind, export_format = CASES[case]
+            try:
+                if kind not in sources:
+                    sources[kind] = os.path.join(work_dir, f"{kind}.tiff")
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        executor.submit(write_source, kind, (width, height), sources[kind]).result()
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    timings, peak_delta = executor.submit(
+                        run_case, sources[kind], export_format, args.repeat, work_dir
+                    ).result()
+            except Exception as e:
+                print(f"{case:<14}失败: {e}")
+                continue
+
+            per_image = sorted(timings)[len(timings) // 2]
+            memory = f"{peak_delta / (1024 * 1024):.0f}" if peak_delta is not None else "-"
+            print(f"{case:<14}{megapixels / per_image:>12.1f}{per_image * 1000:>12.0f}{memory:>20}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,11 +32,13 @@ class ExportDialog(QDialog):
         format_layout = QVBoxLayout(format_group)
         
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["PNG", "JPEG"])
+        self.format_combo.addItems(["PNG", "JPEG", "TIFF"])
         self.format_combo.currentTextChanged.connect(self.on_format_changed)
         
         format_layout.addWidget(QLabel("选择格式:"))
         format_layout.addWidget(self.format_combo)
+        # 16位图片只有PNG和TIFF能保留原位深
+        format_layout.addWidget(QLabel("16位图片导出为PNG或TIFF时保持16位，导出为JPEG时转换为8位"))
         
         # 文件名设置
         naming_group = QGroupBox("文件命名")
@@ -69,6 +71,10 @@ class ExportDialog(QDialog):
         naming_layout.addWidget(self.radio_suffix)
         naming_layout.addWidget(self.suffix_input)
         
+        # 保持原文件夹结构
+        self.mirror_check = QCheckBox("保持原文件夹结构（在导出文件夹中重建子文件夹）")
+        naming_layout.addWidget(self.mirror_check)
+        
         # JPEG质量设置
         quality_group = QGroupBox("JPEG 质量")
         quality_layout = QVBoxLayout(quality_group)
@@ -221,6 +227,10 @@ class ExportDialog(QDialog):
         # 默认返回原始名称
         return {"type": "original", "value": ""}
     
+    def is_mirror_tree(self):
+        """是否在导出文件夹中重建原文件夹结构"""
+        return self.mirror_check.isChecked()
+    
     def get_resize_option(self):
         """获取尺寸调整选项"""
         if not self.resize_check.isChecked():
@@ -0,0 +1,754 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+export_jobs.py - 后台导出任务队列
+
+每个导出任务保存自己的设置快照和导出目录，按顺序在后台线程中执行，
+支持暂停、继续、取消，并收集错误列表，不会阻塞界面事件循环。
+图片在常驻的进程池中并行处理（见 worker_pool.py），
+执行前只读取文件头按图片尺寸分组，同组图片共用预渲染的水印。
+可以在导出目录中重建原文件夹结构，所有目录在开始处理图片前一次性创建。
+输出文件名冲突或与导出目录中已有文件同名时按确定的顺序添加序号，文件先写入临时文件再原子替换。
+正在处理的图片按尺寸估算内存并登记到全局内存预算，超出预算时先等已提交的图片完成再提交新的。
+16位图片导出为PNG/TIFF时按16位合成和保存（见 high_bit_depth.py），导出为JPEG时明确缩减为8位。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PIL import Image
+
+import watermark_renderer
+from memory_governor import estimate_export_bytes, process_peak_rss
+from worker_pool import WarmWorkerPool, warm_worker
+
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+
+# 导出清单文件名
+MANIFEST_NAME = "watermark_manifest.json"
+
+# 并行创建输出目录的线程数
+MAKEDIRS_WORKERS = 8
+
+# 工作进程中最多缓存的预渲染水印数量
+PREPARED_CACHE_LIMIT = 8
+
+# Windows 和 macOS 的文件系统默认不区分文件名大小写
+CASE_INSENSITIVE_PATHS = sys.platform.startswith("win") or sys.platform == "darwin"
+
+
+class ExportJob:
+    """一次导出任务（一批图片 + 设置快照 + 导出目录）"""
+
+    _next_id = 1
+
+    def __init__(self, image_paths, settings, overrides, export_dir, options, image_sizes=None):
+        """
+        初始化导出任务
+
+        Args:
+            image_paths: 要导出的图片路径列表
+            settings: 全局水印设置快照
+            overrides: 单张图片覆盖设置的快照 {图片路径: {字段: 值}}
+            export_dir: 导出目录
+            options: 导出选项字典，包含 format、naming_rule、quality、resize_option
+            image_sizes: 导出前检查已读到的图片尺寸 {图片路径: 尺寸}，没有时执行时再读取文件头
+        """
+        self.job_id = ExportJob._next_id
+        ExportJob._next_id += 1
+
+        self.image_paths = list(image_paths)
+        self.settings = dict(settings)
+        self.overrides = {path: dict(fields) for path, fields in overrides.items()}
+        self.export_dir = export_dir
+        self.options = dict(options)
+        self.image_sizes = dict(image_sizes) if image_sizes else {}
+        self.total_pixels = 0  # 已处理图片的总像素数，用于校准耗时估算
+
+        self.status = JOB_PENDING
+        self.done_count = 0
+        self.errors = []  # [(图片路径, 错误信息)]
+        self.dir_errors = []  # [(无法创建的输出目录, 错误信息, 因此跳过的图片数)]
+        self.manifest = []
+        self.started_at = None
+        self.finished_at = None
+        self.busy_seconds = 0.0  # 实际处理耗时（不含暂停时间）
+        self.group_stats = []  # 每个尺寸分组的吞吐量和水印复用统计
+        self.memory_budget = None  # 执行时的内存预算（字节），没有内存预算时为None
+        self.peak_memory_bytes = 0  # 执行期间估算的内存占用峰值
+        self.memory_waits = 0  # 因内存预算而推迟提交的图片数
+
+    @property
+    def total(self):
+        """任务中的图片数量"""
+        return len(self.image_paths)
+
+    @property
+    def failed_count(self):
+        """导出失败的图片数（包括输出目录无法创建而跳过的图片）"""
+        return len(self.errors) + sum(count for _, _, count in self.dir_errors)
+
+    def eta_seconds(self):
+        """根据已测得的吞吐量估算剩余时间（秒），尚无数据时返回None"""
+        if self.done_count == 0:
+            return None
+        per_item = self.busy_seconds / self.done_count
+        return per_item * (self.total - self.done_count)
+
+    def settings_for_image(self, image_path):
+        """获取任务中某张图片的有效水印设置"""
+        return watermark_renderer.settings_with_overrides(self.settings, self.overrides.get(image_path))
+
+    def group_summary(self):
+        """各尺寸分组的统计，每组一行文字"""
+        lines = []
+        for stats in self.group_stats:
+            size = stats["size"]
+            if size is None:
+                label = "无法读取尺寸"
+            else:
+                orientation = "横向" if size[0] > size[1] else "纵向" if size[0] < size[1] else "方形"
+                label = f"{size[0]}x{size[1]} {orientation}"
+            # 各进程并行处理，这里是单个进程的处理速度
+            rate = stats["count"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+            lines.append(
+                f"{label}: {stats['count']} 张，每进程 {rate:.1f} 张/秒，"
+                f"水印复用 {stats['sprite_hits']} 次，重新渲染 {stats['sprite_misses']} 次"
+            )
+        return lines
+
+    def memory_summary(self):
+        """内存预算和占用峰值，没有内存预算时返回空字符串"""
+        if self.memory_budget is None:
+            return ""
+        mb = 1024 * 1024
+        text = f"估算占用峰值 {self.peak_memory_bytes / mb:.0f} MB / 预算 {self.memory_budget / mb:.0f} MB"
+        rss = process_peak_rss()
+        if rss is not None:
+            text += f"，界面进程内存峰值 {rss / mb:.0f} MB"
+        if self.memory_waits:
+            text += f"，{self.memory_waits} 张图片因内存预算推迟提交"
+        return text
+
+
+def read_image_size(image_path):
+    """只读取文件头获取图片尺寸（不解码像素），无法读取时返回None"""
+    try:
+        with Image.open(image_path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def group_by_size(image_paths, known_sizes=None):
+    """
+    按图片尺寸（同时区分横竖方向）分组
+
+    Args:
+        image_paths: 图片路径列表
+        known_sizes: 已知的图片尺寸 {图片路径: 尺寸}，其余图片读取文件头
+
+    Returns:
+        [(尺寸或None, 图片路径列表)]，按各尺寸首次出现的顺序排列
+    """
+    known_sizes = known_sizes or {}
+    groups = {}
+    for image_path in image_paths:
+        size = known_sizes.get(image_path)
+        if size is None:
+            size = read_image_size(image_path)
+        groups.setdefault(size, []).append(image_path)
+    return list(groups.items())
+
+
+def build_output_name(image_path, export_format, naming_rule):
+    """按命名规则生成输出文件名"""
+    base_name = os.path.basename(image_path)
+    name_without_ext = os.path.splitext(base_name)[0]
+
+    if naming_rule["type"] == "original":
+        return f"{name_without_ext}.{export_format}"
+    elif naming_rule["type"] == "prefix":
+        return f"{naming_rule['value']}{name_without_ext}.{export_format}"
+    else:  # suffix
+        return f"{name_without_ext}{naming_rule['value']}.{export_format}"
+
+
+def common_source_root(image_paths):
+    """所有图片所在文件夹的公共上级目录，没有公共目录（如位于不同磁盘）时返回None"""
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in image_paths])
+    except ValueError:
+        return None
+
+
+def output_relative_path(image_path, export_format, naming_rule, source_root=None):
+    """
+    输出文件相对于导出目录的路径
+
+    Args:
+        source_root: 重建原文件夹结构时的源根目录，为None时所有文件直接放在导出目录下
+    """
+    name = build_output_name(image_path, export_format, naming_rule)
+    if source_root is None:
+        return name
+    relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(image_path)), source_root)
+    return os.path.normpath(os.path.join(relative_dir, name))
+
+
+def output_name_key(name):
+    """比较输出文件名是否冲突时使用的键（不区分大小写的文件系统上忽略大小写）"""
+    name = os.path.normcase(name)
+    return name.lower() if CASE_INSENSITIVE_PATHS else name
+
+
+def existing_output_names(export_dir, relative_dirs):
+    """
+    导出目录中已存在的文件名（每个目录只列出一次，不对每个文件单独stat）
+
+    Args:
+        relative_dirs: 要检查的目录（相对导出目录），不存在的目录跳过
+
+    Returns:
+        {output_name_key(相对导出目录的路径)}
+    """
+    existing = set()
+    for relative_dir in relative_dirs:
+        try:
+            entries = os.listdir(os.path.join(export_dir, relative_dir))
+        except OSError:
+            continue
+        existing.update(output_name_key(os.path.join(relative_dir, entry)) for entry in entries)
+    return existing
+
+
+def assign_output_paths(image_paths, export_dir, export_format, naming_rule, source_root=None,
+                        skip_existing=False):
+    """
+    为一批图片分配输出路径，解决文件名冲突
+
+    不同文件夹中的同名图片会得到相同的输出文件名。冲突时按源路径排序，
+    第一张保留原名，其余依次添加 _2、_3 … 序号；已占用的文件名记录在内存中，
+    不需要逐个检查磁盘上的文件。在不区分大小写的文件系统上只有大小写不同的文件名也算冲突。
+
+    Args:
+        source_root: 重建原文件夹结构时的源根目录，见 output_relative_path
+        skip_existing: 导出目录中已存在的文件也算已占用（之前的任务、监视文件夹的前几批），
+            不会被覆盖，每个输出目录只列出一次
+
+    Returns:
+        {图片路径: 输出文件路径}
+    """
+    by_key = {}  # {比较用的键: (第一个输出文件名, [源图片路径])}
+    for image_path in image_paths:
+        name = output_relative_path(image_path, export_format, naming_rule, source_root)
+        by_key.setdefault(output_name_key(name), (name, []))[1].append(image_path)
+
+    existing = set()
+    if skip_existing:
+        existing = existing_output_names(export_dir, {os.path.dirname(name) for name, _ in by_key.values()})
+
+    reserved = set(by_key) | existing
+    output_paths = {}
+    for key, (name, sources) in by_key.items():
+        stem, ext = os.path.splitext(name)
+        counter = 2
+        for i, image_path in enumerate(sorted(sources)):
+            if i == 0 and key not in existing:
+                output_paths[image_path] = os.path.join(export_dir, name)
+                continue
+            while output_name_key(f"{stem}_{counter}{ext}") in reserved:
+                counter += 1
+            unique_name = f"{stem}_{counter}{ext}"
+            reserved.add(output_name_key(unique_name))
+            output_paths[image_path] = os.path.join(export_dir, unique_name)
+    return output_paths
+
+
+def create_output_dirs(output_paths):
+    """
+    并行创建所有输出文件所在的目录
+
+    在开始处理图片之前一次性完成，处理过程中不再需要创建目录。
+
+    Returns:
+        [(目录, 错误信息)]，全部成功时为空列表
+    """
+    directories = sorted({os.path.dirname(path) for path in output_paths})
+
+    def make_dir(directory):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            return directory, str(e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=MAKEDIRS_WORKERS) as executor:
+        return [error for error in executor.map(make_dir, directories) if error is not None]
+
+
+def save_atomic(image, output_path, image_format, **params):
+    """
+    先写入同目录下的临时文件，完成后再替换为目标文件
+
+    写入中途出错或程序崩溃时不会留下不完整的输出文件。
+    """
+    _replace_atomic(output_path, lambda temp_path: image.save(temp_path, image_format, **params))
+
+
+def write_atomic(data, output_path):
+    """把已编码的文件数据原子地写入目标文件（与 save_atomic 相同的临时文件规则）"""
+    def write(temp_path):
+        with open(temp_path, "wb") as f:
+            f.write(data)
+
+    _replace_atomic(output_path, write)
+
+
+def _replace_atomic(output_path, write):
+    """调用 write(临时文件路径) 写入同目录下的临时文件，成功后替换为目标文件"""
+    directory, name = os.path.split(output_path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_image(image_path, settings, output_path, options, report=None, prepared=None):
+    """
+    为单张图片添加水印并保存
+
+    Args:
+        output_path: 输出文件路径（由 assign_output_paths 分配）
+        prepared: 同尺寸图片共用的预渲染水印（watermark_renderer.prepare_watermark 的结果），没有时为None
+
+    Returns:
+        输出文件路径
+    """
+    export_format = options["format"]
+    resize_option = options.get("resize_option")
+
+    # 在工作进程中才导入（会同时导入NumPy），不拖慢界面启动
+    import high_bit_depth
+
+    # 打开图片
+    image = Image.open(image_path)
+
+    # 16位图片：PNG/TIFF 按16位合成和保存，JPEG 只支持8位，先明确地缩减为8位
+    if high_bit_depth.is_high_bit_depth(image):
+        if export_format in high_bit_depth.HIGH_BIT_DEPTH_FORMATS:
+            array = high_bit_depth.decode(image, image_path)
+            array = high_bit_depth.apply_watermark(array, settings, report, prepared)
+            if resize_option:
+                array = high_bit_depth.resize(array, resized_size(image.size, resize_option))
+            write_atomic(high_bit_depth.encode(array, export_format), output_path)
+            return output_path
+        image = high_bit_depth.to_8bit_image(image)
+
+    # 应用水印
+    if prepared is not None:
+        watermarked_image = watermark_renderer.apply_prepared_watermark(image, settings, prepared)
+    else:
+        watermarked_image = watermark_renderer.apply_watermark(image, settings, report)
+
+    # 调整尺寸（如果需要）
+    if resize_option:
+        watermarked_image = watermarked_image.resize(resized_size(image.size, resize_option), Image.LANCZOS)
+
+    # 根据格式保存
+    if export_format == "jpeg":
+        # 确保是RGB模式
+        if watermarked_image.mode == "RGBA":
+            background = Image.new("RGB", watermarked_image.size, (255, 255, 255))
+            background.paste(watermarked_image, mask=watermarked_image.split()[3])
+            watermarked_image = background
+        save_atomic(watermarked_image, output_path, "JPEG", quality=options.get("quality", 90))
+    elif export_format == "tiff":
+        save_atomic(watermarked_image, output_path, "TIFF", compression=high_bit_depth.TIFF_COMPRESSION)
+    else:  # png
+        save_atomic(watermarked_image, output_path, "PNG")
+
+    return output_path
+
+
+def resized_size(size, resize_option):
+    """按导出选项中的尺寸调整方式计算输出尺寸"""
+    image_width, image_height = size
+    option_type, value = resize_option
+    if option_type == "width":
+        width = value
+        height = int(image_height * (width / image_width))
+    elif option_type == "height":
+        height = value
+        width = int(image_width * (height / image_height))
+    else:  # percentage
+        width = int(image_width * value / 100)
+        height = int(image_height * value / 100)
+    return width, height
+
+
+# 工作进程中缓存的预渲染水印 {(图片尺寸, 设置): prepare_watermark 的结果}
+_prepared_cache = OrderedDict()
+
+
+def export_task(image_path, settings, output_path, options, size):
+    """
+    在工作进程中导出一张图片
+
+    同尺寸、同设置的图片复用本进程中缓存的预渲染水印。
+
+    Args:
+        size: 文件头中读到的图片尺寸，未知时为None
+
+    Returns:
+        (输出文件路径, 自动定位/自适应颜色的报告, 是否复用了预渲染水印（不能复用时为None）, 处理耗时)
+    """
+    start = time.perf_counter()
+    warm_worker(settings)
+
+    prepared = None
+    reused = None
+    if size is not None and watermark_renderer.is_content_independent(settings):
+        key = (size, watermark_renderer.settings_key(settings))
+        prepared = _prepared_cache.get(key)
+        reused = prepared is not None
+        if prepared is None:
+            prepared = watermark_renderer.prepare_watermark(size, settings)
+            _prepared_cache[key] = prepared
+            while len(_prepared_cache) > PREPARED_CACHE_LIMIT:
+                _prepared_cache.popitem(last=False)
+        else:
+            _prepared_cache.move_to_end(key)
+
+    report = {}
+    output_path = export_image(image_path, settings, output_path, options, report, prepared)
+    return output_path, report, reused, time.perf_counter() - start
+
+
+def read_manifest(manifest_path):
+    """读取已有的清单文件，不存在或无法解析时返回空列表"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [entry for entry in manifest if isinstance(entry, dict)] if isinstance(manifest, list) else []
+
+
+def write_manifest(export_dir, manifest):
+    """
+    把每张图片自动选择的水印位置、颜色等写入导出目录下的清单文件
+
+    同一目录的多次导出（监视文件夹的每一批、连续的导出任务）合并到同一个清单中：
+    输出文件相同的记录用新的替换，其余记录保留。
+    """
+    manifest_path = os.path.join(export_dir, MANIFEST_NAME)
+    outputs = {entry.get("output") for entry in manifest}
+    merged = [entry for entry in read_manifest(manifest_path) if entry.get("output") not in outputs]
+    merged.extend(manifest)
+    data = json.dumps(merged, ensure_ascii=False, indent=2).encode("utf-8")
+    write_atomic(data, manifest_path)
+
+
+class ExportWorker(QThread):
+    """依次执行队列中导出任务的后台线程"""
+
+    job_started = pyqtSignal(object)
+    item_finished = pyqtSignal(object)  # 参数为任务对象，进度从任务中读取
+    job_finished = pyqtSignal(object)
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+
+    def run(self):
+        """从队列中取出任务并执行，直到队列为空"""
+        while True:
+            job = self.queue.take_next_job()
+            if job is None:
+                break
+            self.run_job(job)
+
+    def run_job(self, job):
+        """执行单个导出任务"""
+        # 暂停中开始的任务（前一个任务在暂停时被取消）在提交第一张图片前停下
+        job.status = JOB_PAUSED if self.queue.is_paused() else JOB_RUNNING
+        job.started_at = time.time()
+        self.job_started.emit(job)
+
+        # 自动定位或自适应颜色时，记录每张图片实际使用的位置和颜色
+        need_manifest = job.settings.get("auto_position") or job.settings.get("adaptive_color")
+
+        # 一次分配好所有输出路径，同名图片不会互相覆盖，也不覆盖导出目录中已有的文件
+        output_paths = assign_output_paths(
+            job.image_paths, job.export_dir, job.options["format"], job.options["naming_rule"],
+            job.options.get("source_root"), skip_existing=True
+        )
+        # 输出目录无法创建时，其中的图片不再提交，每个目录只报告一次错误
+        failed_dirs = dict(create_output_dirs(output_paths.values()))
+        image_paths = job.image_paths
+        if failed_dirs:
+            skipped = Counter(
+                os.path.dirname(output_paths[path]) for path in image_paths
+                if os.path.dirname(output_paths[path]) in failed_dirs
+            )
+            job.dir_errors = [
+                (directory, failed_dirs[directory], skipped[directory]) for directory in sorted(failed_dirs)
+            ]
+            image_paths = [path for path in image_paths if os.path.dirname(output_paths[path]) not in failed_dirs]
+            job.done_count += sum(skipped.values())
+            self.item_finished.emit(job)
+
+        pool = self.queue.pool
+        pool.warm(job.settings)
+        governor = self.queue.governor
+        if governor is not None:
+            job.memory_budget = governor.budget_bytes
+        # 提交到进程池但尚未完成的图片 {future: (图片路径, 尺寸, 分组统计, 估算内存)}
+        in_flight = {}
+        max_in_flight = pool.workers * 2
+        # 实际处理耗时 = 暂停前累计的耗时 + 本轮开始以来的时间
+        self._busy_before = 0.0
+        self._active_start = time.perf_counter()
+
+        # 先只读文件头按尺寸分组，同组图片连续处理，水印只需渲染一次
+        for size, group_paths in group_by_size(image_paths, job.image_sizes):
+            stats = {"size": size, "count": 0, "seconds": 0.0, "sprite_hits": 0, "sprite_misses": 0}
+            job.group_stats.append(stats)
+
+            for image_path in group_paths:
+                while len(in_flight) >= max_in_flight:
+                    self._collect(job, in_flight, need_manifest)
+
+                # 暂停时先等已提交的图片完成再停下，取消时立即结束
+                if self.queue.is_paused():
+                    while in_flight:
+                        self._collect(job, in_flight, need_manifest)
+                    self._busy_before += time.perf_counter() - self._active_start
+                    self.queue.wait_if_paused(job)
+                    self._active_start = time.perf_counter()
+                if self.queue.is_cancelled(job):
+                    break
+
+                # 超出内存预算时先等已提交的图片完成（至少有一张在处理，不会卡住）
+                nbytes = estimate_export_bytes(size)
+                if governor is not None:
+                    if in_flight and not governor.can_reserve(nbytes):
+                        job.memory_waits += 1
+                        while in_flight and not governor.can_reserve(nbytes):
+                            self._collect(job, in_flight, need_manifest)
+                    governor.reserve("exports", nbytes)
+                    job.peak_memory_bytes = max(job.peak_memory_bytes, governor.current_bytes())
+
+                future = pool.submit(
+                    export_task, image_path, job.settings_for_image(image_path),
+                    output_paths[image_path], job.options, size
+                )
+                in_flight[future] = (image_path, size, stats, nbytes)
+
+            if self.queue.is_cancelled(job):
+                break
+
+        # 取消时丢弃尚未开始的图片，等待已开始的图片完成
+        if self.queue.is_cancelled(job):
+            for future in list(in_flight):
+                if future.cancel():
+                    self._release_memory(in_flight.pop(future)[3])
+        while in_flight:
+            self._collect(job, in_flight, need_manifest)
+
+        if need_manifest and job.manifest:
+            try:
+                write_manifest(job.export_dir, job.manifest)
+            except OSError as e:
+                job.errors.append((os.path.join(job.export_dir, MANIFEST_NAME), str(e)))
+
+        job.status = JOB_CANCELLED if self.queue.is_cancelled(job) else JOB_DONE
+        job.finished_at = time.time()
+        self.job_finished.emit(job)
+
+    def _collect(self, job, in_flight, need_manifest):
+        """等待至少一张图片处理完成并记录结果"""
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            image_path, size, stats, nbytes = in_flight.pop(future)
+            self._release_memory(nbytes)
+            try:
+                output_path, report, reused, elapsed = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    # 工作进程崩溃（例如内存不足），重建进程池后继续处理其余图片
+                    self.queue.pool.reset()
+                job.errors.append((image_path, str(e) or type(e).__name__))
+                elapsed = 0.0
+            else:
+                if need_manifest:
+                    report["source"] = image_path
+                    report["output"] = output_path
+                    job.manifest.append(report)
+                if reused is not None:
+                    stats["sprite_hits" if reused else "sprite_misses"] += 1
+
+            if size is not None:
+                job.total_pixels += size[0] * size[1]
+            stats["count"] += 1
+            stats["seconds"] += elapsed
+            job.busy_seconds = self._busy_before + time.perf_counter() - self._active_start
+            job.done_count += 1
+            self.item_finished.emit(job)
+
+    def _release_memory(self, nbytes):
+        """图片处理完成（或被取消）后释放登记的内存"""
+        if self.queue.governor is not None:
+            self.queue.governor.release("exports", nbytes)
+
+
+class ExportQueue(QObject):
+    """导出任务队列，负责排队、暂停/继续和取消"""
+
+    job_started = pyqtSignal(object)
+    item_finished = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    queue_changed = pyqtSignal()
+
+    def __init__(self, parent=None, pool=None, governor=None):
+        """
+        初始化导出队列
+
+        Args:
+            parent: 父对象
+            pool: 执行导出的进程池，为None时创建一个 WarmWorkerPool
+            governor: 全局内存预算（MemoryGovernor），为None时不限制同时处理的图片占用的内存
+        """
+        super().__init__(parent)
+        self.pool = pool if pool is not None else WarmWorkerPool()
+        self.governor = governor
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._cancelled_ids = set()
+        self._paused = False
+        # 继续或取消时唤醒暂停中的工作线程
+        self._state_changed = threading.Condition(self._lock)
+        self._worker_active = False
+        self.current_job = None
+
+        self.worker = ExportWorker(self)
+        self.worker.job_started.connect(self.job_started)
+        self.worker.item_finished.connect(self.item_finished)
+        self.worker.job_finished.connect(self._on_job_finished)
+        self.worker.finished.connect(self.queue_changed)
+
+    def add_job(self, job):
+        """添加任务到队列末尾，工作线程空闲时自动启动"""
+        with self._lock:
+            self._pending.append(job)
+            start_worker = not self._worker_active
+            self._worker_active = True
+        self.queue_changed.emit()
+        if start_worker:
+            # 上一轮的线程可能刚取完最后一个任务、正在退出
+            self.worker.wait()
+            self.worker.start()
+
+    def take_next_job(self):
+        """取出下一个任务（在工作线程中调用）"""
+        with self._lock:
+            if not self._pending:
+                self.current_job = None
+                self._worker_active = False
+                return None
+            self.current_job = self._pending.popleft()
+            return self.current_job
+
+    def pending_count(self):
+        """排队中（尚未开始）的任务数"""
+        with self._lock:
+            return len(self._pending)
+
+    def is_paused(self):
+        """队列是否处于暂停状态"""
+        with self._lock:
+            return self._paused
+
+    def pause(self):
+        """暂停：当前图片处理完后停下"""
+        with self._lock:
+            self._paused = True
+        if self.current_job is not None:
+            self.current_job.status = JOB_PAUSED
+        self.queue_changed.emit()
+
+    def resume(self):
+        """继续执行"""
+        if self.current_job is not None:
+            self.current_job.status = JOB_RUNNING
+        with self._lock:
+            self._paused = False
+            self._state_changed.notify_all()
+        self.queue_changed.emit()
+
+    def wait_if_paused(self, job=None):
+        """暂停时阻塞调用线程，直到继续或 job 被取消"""
+        with self._lock:
+            while self._paused and (job is None or job.job_id not in self._cancelled_ids):
+                self._state_changed.wait()
+
+    def cancel_current(self):
+        """
+        取消正在执行的任务，队列中的后续任务继续执行
+
+        暂停中取消时只唤醒工作线程结束当前任务，队列保持暂停，后续任务等继续后才开始。
+        """
+        job = self.current_job
+        with self._lock:
+            if job is not None:
+                self._cancelled_ids.add(job.job_id)
+            self._state_changed.notify_all()
+        self.queue_changed.emit()
+
+    def cancel_all(self):
+        """取消正在执行的任务并清空队列"""
+        with self._lock:
+            self._pending.clear()
+        self.cancel_current()
+
+    def is_cancelled(self, job):
+        """任务是否已被取消"""
+        with self._lock:
+            return job.job_id in self._cancelled_ids
+
+    def wait_for_finish(self):
+        """等待工作线程退出（用于关闭程序时）"""
+        self.worker.wait()
+
+    def shutdown(self):
+        """等待工作线程退出并关闭进程池（用于关闭程序时）"""
+        self.worker.wait()
+        self.pool.shutdown()
+
+    def _on_job_finished(self, job):
+        """任务结束后清理取消标记并转发信号"""
+        with self._lock:
+            self._cancelled_ids.discard(job.job_id)
+        self.job_finished.emit(job)
+        self.queue_changed.emit()
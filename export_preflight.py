@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+export_preflight.py - 导出前检查
+
+导出开始前并行读取所有图片的文件头（尺寸、模式、格式、EXIF方向），不解码像素，
+提前发现无法读取的文件、输出文件名冲突和超大图片，并估算总像素数、内存和耗时，
+让用户在真正处理图片之前就能取消或调整一个上万张图片的导出任务。
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PIL import Image
+
+from export_jobs import existing_output_names, output_name_key, output_relative_path
+
+
+# 并行读取文件头的线程数（主要受I/O延迟限制）
+PROBE_WORKERS = 8
+
+# 每批提交的文件数（每批结束后报告进度、检查是否取消）
+PROBE_CHUNK = 256
+
+# 没有历史导出数据时使用的处理速度（百万像素/秒，包含解码、合成和编码）
+DEFAULT_MEGAPIXELS_PER_SECOND = 40.0
+
+# 处理一张图片时同时存在的图片副本数（原图、RGBA副本、合成结果）
+WORKING_COPIES = 3
+
+# EXIF方向标签
+EXIF_ORIENTATION = 274
+
+
+def probe_image(image_path):
+    """
+    只读取文件头获取图片信息
+
+    Returns:
+        字典，包含 path、size、mode、format、high_bit_depth、orientation，无法读取时包含 error
+    """
+    # 导出前检查时才导入（会同时导入NumPy），不拖慢界面启动
+    import high_bit_depth
+
+    info = {"path": image_path}
+    try:
+        with Image.open(image_path) as image:
+            info["size"] = image.size
+            info["mode"] = image.mode
+            info["format"] = image.format
+            info["high_bit_depth"] = high_bit_depth.is_high_bit_depth(image)
+            try:
+                info["orientation"] = image.getexif().get(EXIF_ORIENTATION, 1)
+            except Exception:
+                info["orientation"] = 1
+    except Exception as e:
+        info["error"] = str(e)
+    return info
+
+
+class PreflightReport:
+    """导出前检查的结果"""
+
+    def __init__(self, infos, export_dir, options, megapixels_per_second=DEFAULT_MEGAPIXELS_PER_SECOND):
+        """
+        汇总文件头信息
+
+        Args:
+            infos: probe_image 的结果列表（与图片顺序一致）
+            export_dir: 导出目录
+            options: 导出选项字典（format、naming_rule 等）
+            megapixels_per_second: 用于估算耗时的处理速度
+        """
+        self.infos = infos
+        self.readable = [info for info in infos if "error" not in info]
+        self.unreadable = [info for info in infos if "error" in info]
+
+        # 超过PIL解压炸弹阈值的图片，导出时会被拒绝或占用大量内存
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        self.oversized = [
+            info for info in self.readable
+            if max_pixels and info["size"][0] * info["size"][1] > max_pixels
+        ]
+        self.rotated = [info for info in self.readable if info.get("orientation", 1) != 1]
+        self.high_bit_depth = [info for info in self.readable if info.get("high_bit_depth")]
+        self.export_format = options["format"]
+
+        self.total_pixels = sum(info["size"][0] * info["size"][1] for info in self.readable)
+        largest = max((info["size"][0] * info["size"][1] for info in self.readable), default=0)
+        self.peak_memory_bytes = largest * 4 * WORKING_COPIES
+        self.estimated_seconds = self.total_pixels / 1e6 / megapixels_per_second
+
+        self.collisions, self.existing = self._find_collisions(export_dir, options)
+
+    def _find_collisions(self, export_dir, options):
+        """
+        按命名规则找出输出文件名冲突（与 assign_output_paths 一样按 output_name_key 比较）
+
+        Returns:
+            ({输出文件名: [多个源图片路径]}, [导出目录中已存在的输出文件名])
+        """
+        by_key = {}  # {比较用的键: (第一个输出文件名, [源图片路径])}
+        for info in self.readable:
+            name = output_relative_path(
+                info["path"], options["format"], options["naming_rule"], options.get("source_root")
+            )
+            by_key.setdefault(output_name_key(name), (name, []))[1].append(info["path"])
+
+        existing_keys = existing_output_names(export_dir, {os.path.dirname(name) for name, _ in by_key.values()})
+
+        collisions = {name: paths for name, paths in by_key.values() if len(paths) > 1}
+        existing = sorted(name for key, (name, _) in by_key.items() if key in existing_keys)
+        return collisions, existing
+
+    def image_sizes(self):
+        """{图片路径: 尺寸}，供导出任务分组时使用，避免再次读取文件头"""
+        return {info["path"]: info["size"] for info in self.readable}
+
+    def has_problems(self):
+        """是否有需要用户注意的问题"""
+        return bool(self.unreadable or self.oversized or self.collisions or self.existing)
+
+    def summary_lines(self):
+        """概要信息，每项一行"""
+        minutes, seconds = divmod(int(round(self.estimated_seconds)), 60)
+        lines = [
+            f"可读取图片: {len(self.readable)} 张，共 {self.total_pixels / 1e6:.1f} 百万像素",
+            f"单张图片最大内存占用: 约 {self.peak_memory_bytes / (1024 * 1024):.0f} MB",
+            f"预计耗时: 约 {minutes:02d}:{seconds:02d}",
+        ]
+        if self.unreadable:
+            lines.append(f"无法读取（将被跳过）: {len(self.unreadable)} 张")
+        if self.oversized:
+            lines.append(f"超大图片: {len(self.oversized)} 张")
+        if self.collisions:
+            count = sum(len(paths) for paths in self.collisions.values())
+            lines.append(f"输出文件名冲突: {len(self.collisions)} 个文件名，涉及 {count} 张图片（将自动添加序号）")
+        if self.existing:
+            lines.append(f"导出目录中已存在同名文件: {len(self.existing)} 个（不会覆盖，将自动添加序号）")
+        if self.rotated:
+            lines.append(f"带EXIF旋转标记的图片: {len(self.rotated)} 张（按存储方向处理）")
+        if self.high_bit_depth:
+            if self.export_format == "jpeg":
+                lines.append(f"16位图片: {len(self.high_bit_depth)} 张（JPEG只支持8位，将转换为8位）")
+            else:
+                lines.append(f"16位图片: {len(self.high_bit_depth)} 张（按16位合成并保存）")
+        return lines
+
+    def detail_lines(self):
+        """问题明细，每项一行"""
+        lines = []
+        for info in self.unreadable:
+            lines.append(f"无法读取 {os.path.basename(info['path'])}: {info['error']}")
+        for info in self.oversized:
+            width, height = info["size"]
+            lines.append(f"超大图片 {os.path.basename(info['path'])}: {width}x{height}")
+        for name, paths in sorted(self.collisions.items()):
+            lines.append(f"文件名冲突 {name}: " + ", ".join(paths))
+        for name in self.existing:
+            lines.append(f"已存在 {name}")
+        return lines
+
+
+class PreflightProbe(QThread):
+    """在后台线程中并行读取所有图片的文件头"""
+
+    progress = pyqtSignal(int, int)  # 已读取数, 总数
+    probe_finished = pyqtSignal(object)  # PreflightReport，被取消时为None
+
+    def __init__(self, image_paths, export_dir, options, megapixels_per_second=DEFAULT_MEGAPIXELS_PER_SECOND,
+                 parent=None):
+        super().__init__(parent)
+        self.image_paths = list(image_paths)
+        self.export_dir = export_dir
+        self.options = dict(options)
+        self.megapixels_per_second = megapixels_per_second
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """请求取消检查"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        """检查是否已被取消"""
+        return self._cancel_event.is_set()
+
+    def run(self):
+        """执行检查"""
+        total = len(self.image_paths)
+        infos = []
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+            for start in range(0, total, PROBE_CHUNK):
+                if self.is_cancelled():
+                    break
+                infos.extend(executor.map(probe_image, self.image_paths[start:start + PROBE_CHUNK]))
+                self.progress.emit(len(infos), total)
+
+        if self.is_cancelled():
+            self.probe_finished.emit(None)
+            return
+        self.probe_finished.emit(
+            PreflightReport(infos, self.export_dir, self.options, self.megapixels_per_second)
+        )
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+folder_watcher.py - 监视文件夹
+
+监视一个文件夹（热文件夹），新图片写入完成后自动交给导出流程处理。
+优先使用 QFileSystemWatcher（Linux 下基于 inotify）获得变化通知，
+同时定时轮询作为补充，在网络共享等不支持通知的位置自动退化为纯轮询。
+文件大小和修改时间连续多次检查不变才认为写入完成，处理过的文件不会重复处理。
+"""
+
+import os
+
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal
+
+from image_scanner import is_supported_image
+
+
+# 有变化通知时的补充轮询间隔，以及只能轮询时的间隔（毫秒）
+WATCH_POLL_INTERVAL = 10000
+WATCH_POLL_FALLBACK_INTERVAL = 1000
+
+# 检查文件是否写入完成的间隔（毫秒），以及需要连续不变的次数
+STABILITY_INTERVAL = 500
+STABLE_CHECKS = 2
+
+# 每批最多交给导出流程的文件数
+WATCH_BATCH_SIZE = 50
+
+
+class FolderWatcher(QObject):
+    """监视文件夹中新出现的图片（不递归子文件夹）"""
+
+    files_ready = pyqtSignal(list)  # 一批已写入完成的新图片路径
+
+    def __init__(self, directory, process_existing=False, parent=None):
+        """
+        初始化监视器
+
+        Args:
+            directory: 要监视的文件夹
+            process_existing: 是否处理开始监视时文件夹中已有的图片
+            parent: 父对象
+        """
+        super().__init__(parent)
+        self.directory = directory
+        self.processed_count = 0
+        self._seen = set()  # 已交给导出流程的文件，不再重复处理
+        self._candidates = {}  # {路径: (上次的(大小, 修改时间), 连续不变次数)}
+
+        if not process_existing:
+            self._seen.update(self._list_images())
+
+        # 变化通知（目录内容变化时稍等片刻再扫描，合并连续的通知）
+        self._watcher = QFileSystemWatcher(self)
+        self.using_notifications = self._watcher.addPath(directory)
+        self._watcher.directoryChanged.connect(lambda path: self._scan_timer.start())
+        self._scan_timer = QTimer(self)
+        self._scan_timer.setSingleShot(True)
+        self._scan_timer.setInterval(100)
+        self._scan_timer.timeout.connect(self.scan)
+
+        # 定时轮询，防止漏掉通知
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(
+            WATCH_POLL_INTERVAL if self.using_notifications else WATCH_POLL_FALLBACK_INTERVAL
+        )
+        self._poll_timer.timeout.connect(self.scan)
+
+        # 检查新文件是否写入完成
+        self._stability_timer = QTimer(self)
+        self._stability_timer.setInterval(STABILITY_INTERVAL)
+        self._stability_timer.timeout.connect(self._check_candidates)
+
+    def start(self):
+        """开始监视"""
+        self._poll_timer.start()
+        self.scan()
+
+    def stop(self):
+        """停止监视"""
+        self._poll_timer.stop()
+        self._scan_timer.stop()
+        self._stability_timer.stop()
+        if self._watcher.directories():
+            self._watcher.removePaths(self._watcher.directories())
+        self._candidates.clear()
+
+    def pending_count(self):
+        """正在等待写入完成的文件数"""
+        return len(self._candidates)
+
+    def scan(self):
+        """扫描文件夹，记录新出现的图片"""
+        for path in self._list_images():
+            if path not in self._seen and path not in self._candidates:
+                self._candidates[path] = (None, 0)
+        if self._candidates and not self._stability_timer.isActive():
+            self._stability_timer.start()
+
+    def _list_images(self):
+        """文件夹中的图片文件（跳过隐藏文件和临时文件）"""
+        paths = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_file() and is_supported_image(entry.name):
+                            paths.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return paths
+
+    def _check_candidates(self):
+        """大小和修改时间连续多次不变的文件视为写入完成"""
+        ready = []
+        for path, (last_stamp, stable) in list(self._candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # 文件在写入完成前被删除或改名
+                del self._candidates[path]
+                continue
+
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            stable = stable + 1 if stamp == last_stamp and stat.st_size > 0 else 0
+            if stable >= STABLE_CHECKS:
+                del self._candidates[path]
+                self._seen.add(path)
+                ready.append(path)
+            else:
+                self._candidates[path] = (stamp, stable)
+
+        if not self._candidates:
+            self._stability_timer.stop()
+
+        ready.sort()
+        self.processed_count += len(ready)
+        for start in range(0, len(ready), WATCH_BATCH_SIZE):
+            self.files_ready.emit(ready[start:start + WATCH_BATCH_SIZE])
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+font_index.py - 字体索引
+
+扫描系统字体目录一次，记录每个字体族的常规、粗体、斜体、粗斜体分别对应的
+字体文件和TTC集合中的字体序号，保存在配置目录下的JSON文件中，之后的运行直接读取。
+字体目录（包括子目录）的修改时间发生变化时才重新扫描。
+
+界面的字体下拉列表和渲染时查找字体使用同一份索引，
+列表中能选到的字体在渲染时一定能按名称找到对应的文件。
+"""
+
+import os
+import sys
+import json
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PIL import ImageFont
+
+
+# 索引文件格式版本，格式变化时旧文件自动重建
+INDEX_VERSION = 1
+
+# 字体文件扩展名
+FONT_EXTENSIONS = frozenset({".ttf", ".otf", ".ttc", ".otc"})
+
+# 单个TTC/OTC文件中最多读取的字体数
+MAX_COLLECTION_FACES = 64
+
+# 样式槽位：(粗体, 斜体) -> 索引文件中的键
+STYLE_SLOTS = {
+    (False, False): "regular",
+    (True, False): "bold",
+    (False, True): "italic",
+    (True, True): "bold_italic",
+}
+
+# 表示常规字重的样式名，同一槽位有多个候选时优先选择
+REGULAR_STYLE_NAMES = ("regular", "normal", "book", "roman", "plain")
+
+
+def default_index_path():
+    """默认的索引文件位置（与其他配置文件一样放在当前目录）"""
+    return os.path.join(os.getcwd(), "font_index.json")
+
+
+def system_font_dirs():
+    """当前平台的字体目录（包括用户字体目录，不存在的也列出，用于发现新建的目录）"""
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        dirs = [os.path.join(windir, "Fonts")]
+        local_appdata = os.environ.get("LOCALAPPDATA")
+        if local_appdata:
+            dirs.append(os.path.join(local_appdata, "Microsoft", "Windows", "Fonts"))
+        return dirs
+    if sys.platform == "darwin":
+        return [
+            "/System/Library/Fonts", "/Library/Fonts",
+            os.path.join(home, "Library", "Fonts"),
+        ]
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(home, ".local", "share")
+    return [
+        "/usr/share/fonts", "/usr/local/share/fonts",
+        os.path.join(data_home, "fonts"), os.path.join(home, ".fonts"),
+    ]
+
+
+def _dir_mtime(path):
+    """目录的修改时间，不存在时为None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _style_flags(style):
+    """根据样式名判断是否为粗体、斜体"""
+    style = style.lower()
+    bold = any(word in style for word in ("bold", "black", "heavy"))
+    italic = "italic" in style or "oblique" in style
+    return bold, italic
+
+
+def _style_rank(style):
+    """同一槽位的候选排序：常规字重在前，样式名越短越靠前"""
+    words = style.lower().replace("-", " ").split()
+    extra = [word for word in words if word not in REGULAR_STYLE_NAMES + ("bold", "italic", "oblique")]
+    return (len(extra), len(style))
+
+
+def _read_faces(path):
+    """
+    读取字体文件中每个字体的族名和样式名
+
+    Returns:
+        [(族名, 样式名, 字体序号)]，无法读取时返回空列表
+    """
+    faces = []
+    is_collection = os.path.splitext(path)[1].lower() in (".ttc", ".otc")
+    for index in range(MAX_COLLECTION_FACES if is_collection else 1):
+        try:
+            font = ImageFont.truetype(path, 12, index=index)
+        except Exception:
+            break
+        family, style = font.getname()
+        if family:
+            faces.append((family, style or "Regular", index))
+    return faces
+
+
+def scan_font_dirs(font_dirs):
+    """
+    扫描字体目录
+
+    Returns:
+        ({族名: {样式槽位: [文件路径, 字体序号]}}, {目录: 修改时间})
+    """
+    candidates = {}  # {族名: {样式槽位: [(排序键, 路径, 序号)]}}
+    stamps = {}
+
+    pending = list(font_dirs)
+    while pending:
+        directory = pending.pop()
+        stamps[directory] = _dir_mtime(directory)
+        try:
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except OSError:
+            continue
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in FONT_EXTENSIONS:
+                    continue
+            except OSError:
+                continue
+
+            for family, style, index in _read_faces(entry.path):
+                slot = STYLE_SLOTS[_style_flags(style)]
+                candidates.setdefault(family, {}).setdefault(slot, []).append(
+                    (_style_rank(style), entry.path, index)
+                )
+
+    families = {}
+    for family, slots in candidates.items():
+        families[family] = {
+            slot: [path, index] for slot, (_, path, index) in
+            ((slot, min(faces)) for slot, faces in slots.items())
+        }
+    return families, stamps
+
+
+class FontIndex:
+    """持久化的字体索引（线程安全，首次使用时加载）"""
+
+    def __init__(self, path=None, font_dirs=None):
+        """
+        初始化字体索引
+
+        Args:
+            path: 索引文件路径，为None时使用 default_index_path()
+            font_dirs: 要扫描的字体目录，为None时使用 system_font_dirs()
+        """
+        self.path = path or default_index_path()
+        self.font_dirs = list(font_dirs) if font_dirs is not None else system_font_dirs()
+        self._lock = threading.Lock()
+        self._loaded = threading.Condition(self._lock)  # 加载完成时通知等待的线程
+        self._loading = False  # 是否有线程正在加载（扫描字体目录不持有锁）
+        self._families = None
+        self._folded = {}  # {小写族名: 族名}
+
+    def ensure(self, wait=True):
+        """
+        加载索引文件，文件不存在、版本不符或字体目录有变化时重新扫描
+
+        扫描期间不持有锁，完成后再替换已加载的索引。
+
+        Args:
+            wait: 其他线程正在加载时是否等待，为False时直接返回None
+
+        Returns:
+            {族名: {样式槽位: [文件路径, 字体序号]}}
+        """
+        with self._lock:
+            while self._families is None and self._loading:
+                if not wait:
+                    return None
+                self._loaded.wait()
+            if self._families is not None:
+                return self._families
+            self._loading = True
+        return self.load()
+
+    def begin_load(self):
+        """
+        丢弃已加载的索引并标记为正在加载，由随后调用 load() 的线程完成加载
+
+        在启动后台加载线程之前（界面线程中）调用，
+        这样加载完成前界面线程的 lookup 直接返回None，不会自己去扫描字体目录。
+
+        Returns:
+            是否由调用者负责加载（已有线程在加载时返回False）
+        """
+        with self._lock:
+            if self._loading:
+                return False
+            self._families = None
+            self._loading = True
+            return True
+
+    def load(self):
+        """执行加载（调用前必须已标记为正在加载），返回加载的索引"""
+        families = None
+        try:
+            data = self._read()
+            if data is None or not self._is_current(data):
+                scanned, stamps = scan_font_dirs(self.font_dirs)
+                data = {"version": INDEX_VERSION, "font_dirs": self.font_dirs,
+                        "stamps": stamps, "families": scanned}
+                self._write(data)
+            families = data["families"]
+        finally:
+            with self._lock:
+                if families is not None:
+                    self._families = families
+                    self._folded = {name.lower(): name for name in families}
+                self._loading = False
+                self._loaded.notify_all()
+        return families
+
+    def refresh(self):
+        """丢弃已加载的索引，下次使用时重新检查字体目录"""
+        with self._lock:
+            self._families = None
+
+    def families(self):
+        """所有字体族名（已排序）"""
+        return sorted(self.ensure(), key=str.lower)
+
+    def lookup(self, family, bold=False, italic=False):
+        """
+        查找字体文件
+
+        没有对应样式时依次退回到只保留粗体、只保留斜体、常规样式。
+
+        其他线程正在加载索引时不等待，直接返回None（调用者使用后备的查找方式）。
+
+        Returns:
+            (文件路径, 字体序号)，索引中没有这个字体族或索引正在加载时返回None
+        """
+        families = self.ensure(wait=False)
+        if families is None:
+            return None
+        styles = families.get(family)
+        if styles is None:
+            styles = families.get(self._folded.get(family.lower()))
+        if not styles:
+            return None
+
+        for slot in ((bold, italic), (bold, False), (False, italic), (False, False)):
+            face = styles.get(STYLE_SLOTS[slot])
+            if face is not None:
+                return face[0], face[1]
+        # 只有不常见的样式组合时使用任意一个
+        path, index = next(iter(styles.values()))
+        return path, index
+
+    def _is_current(self, data):
+        """索引文件是否仍与字体目录一致"""
+        if data.get("version") != INDEX_VERSION or data.get("font_dirs") != self.font_dirs:
+            return False
+        stamps = data.get("stamps", {})
+        return all(_dir_mtime(directory) == mtime for directory, mtime in stamps.items())
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) and isinstance(data.get("families"), dict) else None
+
+    def _write(self, data):
+        """先写临时文件再原子替换（多个进程同时重建时不会读到写了一半的文件）"""
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError:
+            # 配置目录不可写时只在内存中使用
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# 进程内共用的字体索引
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def default_index():
+    """进程内共用的字体索引（使用当前目录下的索引文件）"""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = FontIndex()
+        return _default_index
+
+
+class FontIndexLoader(QThread):
+    """在后台加载（必要时重建）字体索引，避免阻塞界面"""
+
+    loaded = pyqtSignal(list)  # 字体族名列表
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+        # 在创建线程时就标记为正在加载，加载完成前界面线程查找字体不会被阻塞
+        self._owns_load = index.begin_load()
+
+    def run(self):
+        try:
+            if self._owns_load:
+                self.index.load()
+            families = self.index.families()
+        except Exception:
+            families = []
+        self.loaded.emit(families)
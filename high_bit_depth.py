@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+high_bit_depth.py - 16位图片的读取、合成和保存
+
+扫描仪输出的TIFF/PNG常为16位灰度（PIL模式 "I;16"）或48/64位的RGB(A)。
+PIL 读取16位RGB时直接截断为8位，把16位灰度转换为RGBA时也会截断，
+因此这类图片不走普通的PIL合成流程：像素解码为 NumPy uint16 数组（通道顺序RGB/RGBA），
+水印仍按8位渲染，只在水印覆盖的区域内按16位精度混合，最后保存为16位TIFF或PNG。
+预览只需要8位的缩小图（见 to_8bit_image）。
+
+16位彩色图片的读写使用 OpenCV（已列在 requirements.txt 中），
+未安装时报错，而不是悄悄输出8位图片。
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+import watermark_renderer
+
+
+# 能保存16位数据的导出格式
+HIGH_BIT_DEPTH_FORMATS = ("png", "tiff")
+
+# PIL 读取16位（以及32位整数）灰度图片时使用的模式
+GRAY_HIGH_BIT_DEPTH_MODES = frozenset({"I;16", "I;16L", "I;16B", "I;16N", "I"})
+
+# 导出16位TIFF时的压缩方式（与 OpenCV 默认的一致）
+TIFF_COMPRESSION = "tiff_lzw"
+
+
+def _raw_mode(image):
+    """文件中像素的原始格式（只在像素加载前可用，之后返回空字符串）"""
+    if not image.tile:
+        return ""
+    args = image.tile[0][3]
+    return args if isinstance(args, str) else args[0]
+
+
+def is_high_bit_depth(image):
+    """
+    图片每个通道是否超过8位
+
+    需要在 image.load() 之前调用（打开文件后只读取了文件头时）。
+    """
+    return image.mode in GRAY_HIGH_BIT_DEPTH_MODES or ";16" in _raw_mode(image)
+
+
+def _opencv():
+    """按需导入 OpenCV"""
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("读取和保存16位彩色图片需要安装 OpenCV（opencv-python）") from None
+    return cv2
+
+
+def decode(image, source):
+    """
+    把16位图片解码为 uint16 数组
+
+    Args:
+        image: 已打开（尚未加载像素）的PIL图片
+        source: 图片文件路径或文件数据（bytes），16位彩色图片由 OpenCV 重新解码
+
+    Returns:
+        形状为 (高, 宽)、(高, 宽, 3) 或 (高, 宽, 4) 的 uint16 数组，通道顺序为RGB/RGBA
+    """
+    if image.mode in GRAY_HIGH_BIT_DEPTH_MODES:
+        array = _gray_array(image)
+        # 合成时直接修改数组，不能是PIL数据的只读视图
+        return array if array.flags.writeable else array.copy()
+
+    cv2 = _opencv()
+    if isinstance(source, (bytes, bytearray)):
+        data = np.frombuffer(source, dtype=np.uint8)
+    else:
+        # 先读出文件数据再解码，cv2.imread 在Windows上不支持中文路径
+        data = np.fromfile(source, dtype=np.uint8)
+    array = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+    if array is None:
+        raise ValueError("无法解码16位图片")
+    if array.dtype != np.uint16:
+        # OpenCV 解码出8位数据时按比例扩展，保持后续处理一致
+        array = array.astype(np.uint16) * 257
+    if array.ndim == 3 and array.shape[2] == 4:
+        return cv2.cvtColor(array, cv2.COLOR_BGRA2RGBA)
+    if array.ndim == 3:
+        return cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+    return array
+
+
+def _gray_array(image):
+    """16位（或32位整数）灰度PIL图片的 uint16 数组"""
+    array = np.asarray(image)
+    if array.dtype == np.uint16:
+        return array
+    # 大端的 "I;16B" 和32位整数的 "I"
+    return np.clip(array, 0, 65535).astype(np.uint16)
+
+
+def to_8bit(array):
+    """uint16 数组取高8位（与 PIL 把16位RGB读为8位的方式相同）"""
+    return (array >> 8).astype(np.uint8)
+
+
+def array_to_image(array):
+    """把 uint8 数组包装为PIL图片（L、RGB 或 RGBA）"""
+    return Image.fromarray(array)
+
+
+def to_8bit_image(image, max_size=None):
+    """
+    预览和8位导出使用的图片
+
+    16位灰度图片按比例缩减为8位；PIL 读取16位彩色图片时已经是8位，原样返回。
+
+    Args:
+        max_size: 最长边的上限，先在16位数据上抽样缩小再转换，不需要完整的8位副本
+    """
+    if image.mode not in GRAY_HIGH_BIT_DEPTH_MODES:
+        return image
+    array = _gray_array(image)
+    if max_size is not None:
+        step = max(1, max(image.size) // max_size)
+        array = array[::step, ::step]
+    return array_to_image(to_8bit(array))
+
+
+def composite(array, sprite, offset):
+    """
+    按16位精度把8位RGBA水印混合到数组上（直接修改数组）
+
+    只处理水印与图片重叠的区域；灰度图片使用水印颜色的亮度，
+    RGBA图片的alpha通道与 Image.paste(layer, offset, layer) 一样也按水印alpha混合。
+
+    Args:
+        array: decode 得到的 uint16 数组
+        sprite: RGBA水印，为None时不做任何事
+        offset: 水印左上角在图片上的坐标，可以超出图片范围
+
+    Returns:
+        array
+    """
+    if sprite is None:
+        return array
+
+    height, width = array.shape[:2]
+    x, y = offset
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + sprite.width), min(height, y + sprite.height)
+    if x0 >= x1 or y0 >= y1:
+        return array
+
+    window = (x0 - x, y0 - y, x1 - x, y1 - y)
+    layer = np.asarray(sprite.crop(window))
+    alpha = layer[..., 3:4].astype(np.float32) / 255
+
+    channels = array.shape[2] if array.ndim == 3 else 1
+    if channels == 1:
+        color = np.asarray(sprite.crop(window).convert("L"))[..., None]
+    elif channels == 3:
+        color = layer[..., :3]
+    else:
+        color = layer
+
+    region = array[y0:y1, x0:x1]
+    if channels == 1:
+        region = region[..., None]
+    blended = region * (1 - alpha) + color.astype(np.float32) * (257 * alpha)
+    region[...] = np.clip(np.rint(blended), 0, 65535).astype(np.uint16)
+    return array
+
+
+def apply_watermark(array, settings, report=None, prepared=None):
+    """
+    给16位图片加水印，水印位置、外观与8位图片的 apply_watermark 一致
+
+    Args:
+        array: decode 得到的 uint16 数组（会被直接修改）
+        settings: 水印设置字典
+        report: 可选的字典，记录自动选择的位置、颜色和不透明度
+        prepared: 同尺寸图片共用的预渲染水印（watermark_renderer.prepare_watermark 的结果）
+
+    Returns:
+        添加水印后的数组
+    """
+    if prepared is None:
+        size = (array.shape[1], array.shape[0])
+        if watermark_renderer.is_content_independent(settings):
+            prepared = watermark_renderer.prepare_watermark(size, settings)
+        else:
+            # 自动定位和自适应颜色只需要分析8位的内容
+            prepared = watermark_renderer.watermark_layer(array_to_image(to_8bit(array)), settings, report)
+    sprite, offset = prepared
+    return composite(array, sprite, offset)
+
+
+def resize(array, size):
+    """按16位精度缩放（每个通道单独用 LANCZOS 插值）"""
+    if array.ndim == 2:
+        planes = [array]
+    else:
+        planes = [array[..., channel] for channel in range(array.shape[2])]
+
+    resized = []
+    for plane in planes:
+        scaled = Image.fromarray(plane.astype(np.float32), "F").resize(size, Image.LANCZOS)
+        resized.append(np.clip(np.rint(np.asarray(scaled)), 0, 65535).astype(np.uint16))
+    return resized[0] if array.ndim == 2 else np.stack(resized, axis=2)
+
+
+def encode(array, export_format):
+    """
+    把 uint16 数组编码为16位PNG或TIFF文件数据
+
+    Args:
+        export_format: "png" 或 "tiff"
+    """
+    if export_format not in HIGH_BIT_DEPTH_FORMATS:
+        raise ValueError(f"{export_format} 格式不支持16位图片")
+
+    if array.ndim == 2:
+        # 16位灰度PIL可以直接保存
+        buffer = io.BytesIO()
+        image = Image.fromarray(array)
+        if export_format == "png":
+            image.save(buffer, "PNG")
+        else:
+            image.save(buffer, "TIFF", compression=TIFF_COMPRESSION)
+        return buffer.getvalue()
+
+    cv2 = _opencv()
+    code = cv2.COLOR_RGBA2BGRA if array.shape[2] == 4 else cv2.COLOR_RGB2BGR
+    ok, data = cv2.imencode(f".{export_format}", cv2.cvtColor(array, code))
+    if not ok:
+        raise ValueError(f"无法编码16位{export_format.upper()}图片")
+    return data.tobytes()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+image_list_model.py - 图片列表模型
+
+用 QAbstractListModel + QListView 代替每张图片一个 QListWidgetItem 的做法，
+路径保存在紧凑的 ImagePathStore 中，
+缩略图只在视图请求可见行时才在后台线程中生成，并保存在有上限的缓存中，
+可以支撑十万级别的图片列表。
+"""
+
+import os
+from array import array
+from collections import OrderedDict
+
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool,
+    pyqtSignal
+)
+from PyQt5.QtGui import QImageReader, QPixmap, QIcon
+
+
+# 缩略图尺寸
+THUMBNAIL_SIZE = 100
+
+# 最多缓存的缩略图数量（只覆盖可见区域附近的图片即可）
+THUMBNAIL_CACHE_LIMIT = 500
+
+# 删除的行分散成超过这么多段时改为整体重置模型（逐段删除的总耗时随段数增长）
+REMOVE_RANGES_LIMIT = 256
+
+
+class ImagePathStore:
+    """
+    紧凑的图片路径存储
+
+    所有路径按UTF-8编码依次追加到一个 bytearray 中，另用两个 array 记录每条路径的起始位置和长度，
+    每条路径只占编码后的字节数加12字节，不为每条路径保留一个Python字符串对象。
+    删除时只从两个 array 中删掉对应项，废弃的字节超过一半时再整体压缩。
+    去重使用路径哈希值的集合（64位哈希，十万条路径时发生冲突的概率可以忽略）。
+    支持按下标访问、迭代和 in 判断，可以直接当作路径列表使用。
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._starts = array("Q")
+        self._lengths = array("I")
+        self._hashes = set()
+        self._garbage = 0  # 已删除路径仍占用的字节数
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start = self._starts[index]
+        return self._data[start:start + self._lengths[index]].decode("utf-8", "surrogateescape")
+
+    def __iter__(self):
+        for index in range(len(self._starts)):
+            yield self[index]
+
+    def __contains__(self, path):
+        return hash(path) in self._hashes
+
+    def extend(self, paths):
+        """
+        追加路径，已存在的路径会被跳过
+
+        Returns:
+            实际追加的路径列表
+        """
+        added = []
+        for path in paths:
+            key = hash(path)
+            if key in self._hashes:
+                continue
+            self._hashes.add(key)
+            encoded = path.encode("utf-8", "surrogateescape")
+            self._starts.append(len(self._data))
+            self._lengths.append(len(encoded))
+            self._data += encoded
+            added.append(path)
+        return added
+
+    def remove_range(self, first, last):
+        """
+        删除 first 到 last（包括）的连续多行
+
+        Returns:
+            被删除的路径列表
+        """
+        removed = self[first:last + 1]
+        self._garbage += sum(self._lengths[first:last + 1])
+        del self._starts[first:last + 1]
+        del self._lengths[first:last + 1]
+        self._forget(removed)
+        return removed
+
+    def remove_rows(self, rows):
+        """
+        一次性删除多行，总耗时O(n)
+
+        Returns:
+            被删除的路径列表
+        """
+        rows = {row for row in rows if 0 <= row < len(self._starts)}
+        removed = [self[row] for row in sorted(rows)]
+        self._starts = array("Q", (start for row, start in enumerate(self._starts) if row not in rows))
+        self._lengths = array("I", (length for row, length in enumerate(self._lengths) if row not in rows))
+        self._garbage += sum(len(path.encode("utf-8", "surrogateescape")) for path in removed)
+        self._forget(removed)
+        return removed
+
+    def _forget(self, removed):
+        """删除后更新去重集合，废弃的字节过多时压缩"""
+        for path in removed:
+            self._hashes.discard(hash(path))
+        if self._garbage > len(self._data) // 2:
+            self._compact()
+
+    def _compact(self):
+        """只保留仍在使用的路径数据"""
+        data = bytearray()
+        starts = array("Q")
+        for start, length in zip(self._starts, self._lengths):
+            starts.append(len(data))
+            data += self._data[start:start + length]
+        self._data = data
+        self._starts = starts
+        self._garbage = 0
+
+
+class _ThumbnailSignals(QObject):
+    """缩略图任务的信号（QRunnable本身不能发信号）"""
+
+    loaded = pyqtSignal(int, str, object)  # 行号, 路径, QImage（加载失败时为None）
+
+
+class _ThumbnailTask(QRunnable):
+    """在后台线程中读取并缩小一张图片"""
+
+    def __init__(self, row, path, signals):
+        super().__init__()
+        self.row = row
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        reader = QImageReader(self.path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            # 让解码器直接按缩略图尺寸解码（JPEG可以跳过大部分像素）
+            reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio))
+        image = reader.read()
+        try:
+            self.signals.loaded.emit(self.row, self.path, None if image.isNull() else image)
+        except RuntimeError:
+            # 程序退出时信号对象可能已被销毁
+            pass
+
+
+class ImageListModel(QAbstractListModel):
+    """图片列表模型，缩略图按需加载"""
+
+    PathRole = Qt.UserRole + 1
+
+    def __init__(self, store, parent=None, governor=None):
+        super().__init__(parent)
+        self.store = store
+
+        # 缩略图缓存：{路径: (QIcon, 字节数)}，加载失败的图片记为 (None, 0)
+        self._thumbnails = OrderedDict()
+        self._thumbnail_bytes = 0
+        self._pending = set()
+
+        # 缩略图只在界面线程中访问，占用也很小，只登记占用、不参与全局淘汰
+        self.governor = governor
+        if governor is not None:
+            governor.add_consumer("thumbnails", lambda: self._thumbnail_bytes)
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(2)
+        self._signals = _ThumbnailSignals(self)
+        self._signals.loaded.connect(self._on_thumbnail_loaded)
+
+        # 缩略图加载完成前显示的透明占位图标
+        self._placeholder_pixmap = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self._placeholder_pixmap.fill(Qt.transparent)
+        self._placeholder = QIcon(self._placeholder_pixmap)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.store):
+            return None
+
+        path = self.store[index.row()]
+        if role == Qt.DisplayRole:
+            name = os.path.basename(path)
+            if path in self._thumbnails and self._thumbnails[path][0] is None:
+                return f"{name} (无法加载)"
+            return name
+        elif role == Qt.DecorationRole:
+            return self._thumbnail(index.row(), path)
+        elif role == Qt.ToolTipRole or role == self.PathRole:
+            return path
+        return None
+
+    def add_paths(self, paths):
+        """
+        追加图片路径（自动去重）
+
+        Returns:
+            实际追加的数量
+        """
+        first = len(self.store)
+        new_paths = [path for path in dict.fromkeys(paths) if path not in self.store]
+        if not new_paths:
+            return 0
+
+        self.beginInsertRows(QModelIndex(), first, first + len(new_paths) - 1)
+        self.store.extend(new_paths)
+        self.endInsertRows()
+        return len(new_paths)
+
+    def remove_rows(self, rows):
+        """
+        一次性删除多行
+
+        连续的行合并为一段，从后往前逐段通知视图，视图保留选择、当前项和已加载的缩略图；
+        分散成很多段时改为整体重置模型，总耗时保持O(n)。
+
+        Returns:
+            被删除的路径列表
+        """
+        ranges = []
+        for row in sorted({row for row in rows if 0 <= row < len(self.store)}):
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        if not ranges:
+            return []
+
+        if len(ranges) > REMOVE_RANGES_LIMIT:
+            self.beginResetModel()
+            removed = self.store.remove_rows(rows)
+            self.endResetModel()
+        else:
+            removed = []
+            for first, last in reversed(ranges):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                removed[:0] = self.store.remove_range(first, last)
+                self.endRemoveRows()
+
+        for path in removed:
+            entry = self._thumbnails.pop(path, None)
+            if entry is not None:
+                self._thumbnail_bytes -= entry[1]
+        return removed
+
+    def cached_thumbnail(self, path):
+        """已加载的缩略图（QPixmap，不触发加载），没有时返回None"""
+        entry = self._thumbnails.get(path)
+        if entry is None or entry[0] is None:
+            return None
+        return entry[0].pixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+
+    def _thumbnail(self, row, path):
+        """获取缩略图，不在缓存中时安排后台加载并先返回占位图标"""
+        if path in self._thumbnails:
+            self._thumbnails.move_to_end(path)
+            icon = self._thumbnails[path][0]
+            return self._placeholder if icon is None else icon
+
+        if path not in self._pending:
+            self._pending.add(path)
+            self._thread_pool.start(_ThumbnailTask(row, path, self._signals))
+        return self._placeholder
+
+    def _on_thumbnail_loaded(self, row, path, image):
+        """后台缩略图加载完成"""
+        self._pending.discard(path)
+        if path not in self.store:
+            return
+
+        old = self._thumbnails.pop(path, None)
+        if old is not None:
+            self._thumbnail_bytes -= old[1]
+        if image is not None:
+            self._thumbnails[path] = (QIcon(QPixmap.fromImage(image)), image.sizeInBytes())
+        else:
+            self._thumbnails[path] = (None, 0)
+        self._thumbnail_bytes += self._thumbnails[path][1]
+        while len(self._thumbnails) > THUMBNAIL_CACHE_LIMIT:
+            _, evicted = self._thumbnails.popitem(last=False)
+            self._thumbnail_bytes -= evicted[1]
+        if self.governor is not None:
+            self.governor.notify()
+
+        # 加载期间行号可能因删除而变化，只在行号仍然对应时通知视图
+        if row < len(self.store) and self.store[row] == path:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.DecorationRole])
@@ -9,24 +9,49 @@
 import sys
 import os
 import math
+import time
+
+# 程序开始加载的时间，用于统计启动耗时
+STARTUP_BEGIN = time.perf_counter()
+
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-    QPushButton, QLabel, QFileDialog, QListWidget, QListWidgetItem, 
+    QPushButton, QLabel, QFileDialog, QListWidget, QListView, QAbstractItemView, 
     QTabWidget, QLineEdit, QSlider, QComboBox, QGroupBox, QRadioButton,
     QGridLayout, QColorDialog, QSpinBox, QDoubleSpinBox, QCheckBox,
-    QMessageBox, QSplitter
+    QMessageBox, QSplitter, QProgressBar, QProgressDialog
 )
 from PyQt5.QtGui import (
     QPixmap, QImage, QFont, QFontDatabase, QPainter, QColor, 
-    QIcon, QCursor
+    QCursor
 )
 from PyQt5.QtCore import (
-    Qt, QSize, QPoint, QRect, QSettings, QDir, 
+    Qt, QSize, QPoint, QRect, QSettings, QDir, QTimer,
     pyqtSignal, pyqtSlot
 )
 
-from PIL import Image, ImageDraw, ImageFont, ImageQt
-import numpy as np
+from PIL import Image
+
+import watermark_renderer
+from export_jobs import ExportJob, ExportQueue, JOB_CANCELLED, common_source_root
+from export_preflight import PreflightProbe, DEFAULT_MEGAPIXELS_PER_SECOND
+from folder_watcher import FolderWatcher
+from font_index import FontIndexLoader, default_index
+from template_store import TemplateStore
+from image_list_model import ImagePathStore, ImageListModel
+from image_scanner import DirectoryScanner
+from memory_governor import memory_governor, process_peak_rss, DEFAULT_MEMORY_BUDGET
+from preview_cache import DecodedImageCache, PreviewRenderer, PreviewPrefetcher
+
+
+# 快速预览使用的代理图最长边（像素）
+PREVIEW_PROXY_SIZE = 384
+
+# 预取当前图片前后各多少张
+PREFETCH_NEIGHBOURS = 2
+
+# 内存状态的刷新间隔（毫秒）
+MEMORY_STATUS_INTERVAL = 1000
 
 
 class WatermarkApp(QMainWindow):
@@ -40,25 +65,70 @@ class WatermarkApp(QMainWindow):
         self.setGeometry(100, 100, 1200, 800)
         
         # 初始化数据
-        self.image_paths = []  # 存储导入的图片路径
+        self.image_paths = ImagePathStore()  # 存储导入的图片路径
         self.current_index = -1  # 当前选中的图片索引
         self.watermark_type = "text"  # 默认水印类型
         self.watermark_text = "水印文字"  # 默认水印文本
         self.watermark_image_path = ""  # 水印图片路径
         self.watermark_opacity = 100  # 默认透明度（0-100）
         self.watermark_position = (0.5, 0.5)  # 默认位置（中心点）
+        self.watermark_auto_position = False  # 是否自动选择最空白的区域放置水印
         self.watermark_size = 100  # 默认水印大小占原图百分比
         self.watermark_rotation = 0  # 默认旋转角度
+        self.watermark_resample = "bicubic"  # 旋转和斜体变换的插值方式
         self.watermark_color = QColor(0, 0, 0)  # 默认颜色（完全不透明黑色）
+        self.watermark_adaptive_color = False  # 是否按背景亮度自动选择深浅颜色
         self.watermark_font = QFont("SimHei", 256)  # 默认字体
+        # 单张图片的水印覆盖设置：{图片路径: {字段: 值}}，只保存被单独修改的字段
+        self.image_overrides = {}
         self.is_dragging = False  # 是否正在拖拽水印
         self.drag_start_pos = QPoint()  # 拖拽起始位置
+        self.drag_preview = None  # 拖拽时缓存的预览底图和水印精灵
+        self.preflight_probe = None  # 正在运行的导出前检查
+        self.folder_watcher = None  # 监视文件夹模式的监视器
+        self.watch_stats = {"done": 0, "errors": 0}  # 监视文件夹模式已导出和失败的图片数
+        self.scanners = []  # 正在运行的文件夹扫描器
+        self.startup_ms = None  # 从开始加载到窗口第一次显示完成的耗时
+        self.font_index_loader = None  # 正在后台加载的字体索引
         
         # 初始化设置对象
         # 使用同目录下的配置文件存储设置，而不是注册表
         config_path = QDir.currentPath() + "/watermark_config.ini"
         self.settings = QSettings(config_path, QSettings.IniFormat)
         
+        # 模板和上次设置保存在单独的JSON文件中，首次运行时从INI迁移
+        templates_path = QDir.currentPath() + "/watermark_templates.json"
+        self.template_store = TemplateStore(templates_path, self.settings, parent=self)
+        self.template_store.save_failed.connect(lambda message: self.statusBar().showMessage(message, 10000))
+        
+        # 全局内存预算：解码缓存、缩略图和正在导出的图片共用
+        self.memory_governor = memory_governor
+        budget_mb = self.settings.value("memory/budget_mb", DEFAULT_MEMORY_BUDGET // (1024 * 1024), type=int)
+        self.memory_governor.budget_bytes = budget_mb * 1024 * 1024
+        
+        # 解码缓存和后台预览渲染：先显示小尺寸代理图，完整质量的预览在后台完成后替换
+        self.image_cache = DecodedImageCache(governor=self.memory_governor)
+        self.preview_renderer = PreviewRenderer(
+            self.image_cache, self.pil_to_qimage, self, proxy_size=PREVIEW_PROXY_SIZE
+        )
+        self.preview_renderer.frame_ready.connect(self.on_preview_frame_ready)
+        self.preview_renderer.failed.connect(self.on_preview_failed)
+        self.preview_metrics = {"first_frame_ms": None, "full_frame_ms": None}
+        
+        # 空闲时预取相邻和可见的图片，切换图片时无需等待解码
+        self.prefetcher = PreviewPrefetcher(self.image_cache, PREVIEW_PROXY_SIZE, self)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(200)
+        self.prefetch_timer.timeout.connect(self.prefetch_nearby_images)
+        
+        # 后台导出任务队列
+        self.export_queue = ExportQueue(self, governor=self.memory_governor)
+        self.export_queue.item_finished.connect(self.on_export_progress)
+        self.export_queue.job_finished.connect(self.on_export_job_finished)
+        self.export_queue.job_started.connect(self.on_export_progress)
+        self.export_queue.queue_changed.connect(self.update_export_status)
+        
         # 创建UI
         self.init_ui()
         
@@ -94,18 +164,41 @@ class WatermarkApp(QMainWindow):
         btn_layout.addWidget(self.btn_add_folder)
         btn_layout.addWidget(self.btn_remove_files)
         
+        # 文件夹扫描进度
+        scan_layout = QHBoxLayout()
+        self.sniff_check = QCheckBox("检查文件头")
+        self.sniff_check.setToolTip("扫描文件夹时读取文件头，排除扩展名正确但内容不是图片的文件")
+        self.scan_status_label = QLabel("")
+        self.btn_cancel_scan = QPushButton("取消扫描")
+        self.btn_cancel_scan.clicked.connect(self.cancel_scans)
+        self.btn_cancel_scan.setVisible(False)
+        scan_layout.addWidget(self.sniff_check)
+        scan_layout.addWidget(self.scan_status_label, 1)
+        scan_layout.addWidget(self.btn_cancel_scan)
+        
         # 图片列表
-        self.image_list = QListWidget()
-        self.image_list.setViewMode(QListWidget.IconMode)
+        # 使用模型/视图结构，缩略图只为可见行按需加载
+        self.image_model = ImageListModel(self.image_paths, self, governor=self.memory_governor)
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setViewMode(QListView.IconMode)
         self.image_list.setIconSize(QSize(100, 100))
         # 设置网格大小以确保所有项目对齐
         self.image_list.setGridSize(QSize(120, 120))
-        self.image_list.setResizeMode(QListWidget.Adjust)
-        self.image_list.setMovement(QListWidget.Static)
-        self.image_list.itemClicked.connect(self.on_image_selected)
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setLayoutMode(QListView.Batched)
+        self.image_list.setResizeMode(QListView.Adjust)
+        self.image_list.setMovement(QListView.Static)
+        self.image_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        # 鼠标点击和方向键切换都会改变当前项
+        self.image_list.selectionModel().currentChanged.connect(
+            lambda current, previous: self.on_image_selected(current)
+        )
+        # 滚动列表后预取可见的图片
+        self.image_list.verticalScrollBar().valueChanged.connect(lambda value: self.prefetch_timer.start())
         # 设置为接受拖放模式
         self.image_list.setAcceptDrops(True)
-        self.image_list.setDragDropMode(QListWidget.DragDropMode.DropOnly)
+        self.image_list.setDragDropMode(QAbstractItemView.DropOnly)
         # 设置viewport接受拖放
         self.image_list.viewport().setAcceptDrops(True)
         # 为image_list安装事件过滤器
@@ -116,10 +209,58 @@ class WatermarkApp(QMainWindow):
         self.btn_export.clicked.connect(self.export_images)
         self.btn_export.setDisabled(True)
         
+        # 导出进度
+        self.export_progress = QProgressBar()
+        self.export_status_label = QLabel("没有正在进行的导出任务")
+        self.export_status_label.setWordWrap(True)
+        export_control_layout = QHBoxLayout()
+        self.btn_pause_export = QPushButton("暂停")
+        self.btn_pause_export.clicked.connect(self.toggle_export_pause)
+        self.btn_pause_export.setEnabled(False)
+        self.btn_cancel_export = QPushButton("取消导出")
+        self.btn_cancel_export.clicked.connect(self.cancel_export)
+        self.btn_cancel_export.setEnabled(False)
+        export_control_layout.addWidget(self.btn_pause_export)
+        export_control_layout.addWidget(self.btn_cancel_export)
+        
+        # 监视文件夹：新图片写入完成后自动添加水印并导出
+        watch_layout = QHBoxLayout()
+        self.btn_watch = QPushButton("监视文件夹...")
+        self.btn_watch.clicked.connect(self.toggle_watch_folder)
+        self.watch_status_label = QLabel("")
+        self.watch_status_label.setWordWrap(True)
+        watch_layout.addWidget(self.btn_watch)
+        watch_layout.addWidget(self.watch_status_label, 1)
+        
+        # 内存预算和当前/峰值占用
+        memory_layout = QHBoxLayout()
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(256, 65536)
+        self.memory_budget_spin.setSingleStep(256)
+        self.memory_budget_spin.setSuffix(" MB")
+        self.memory_budget_spin.setValue(self.memory_governor.budget_bytes // (1024 * 1024))
+        self.memory_budget_spin.setToolTip("解码缓存、缩略图和正在导出的图片共用的内存预算")
+        self.memory_budget_spin.valueChanged.connect(self.update_memory_budget)
+        self.memory_status_label = QLabel("")
+        self.memory_status_label.setWordWrap(True)
+        memory_layout.addWidget(QLabel("内存预算:"))
+        memory_layout.addWidget(self.memory_budget_spin)
+        memory_layout.addWidget(self.memory_status_label, 1)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(MEMORY_STATUS_INTERVAL)
+        self.memory_timer.timeout.connect(self.update_memory_status)
+        self.memory_timer.start()
+        
         left_layout.addLayout(btn_layout)
+        left_layout.addLayout(scan_layout)
         left_layout.addWidget(QLabel("图片列表:"))
         left_layout.addWidget(self.image_list)
         left_layout.addWidget(self.btn_export)
+        left_layout.addWidget(self.export_progress)
+        left_layout.addWidget(self.export_status_label)
+        left_layout.addLayout(export_control_layout)
+        left_layout.addLayout(watch_layout)
+        left_layout.addLayout(memory_layout)
         
         # ===== 右侧面板：预览和设置 =====
         right_panel = QWidget()
@@ -187,10 +328,8 @@ class WatermarkApp(QMainWindow):
         # 字体下拉列表
         font_group_layout.addWidget(QLabel("字体:"), 0, 0)
         self.font_combo = QComboBox()
-        # QFontDatabase().families()直接返回字符串列表，不需要再调用family()方法
-        fonts = QFontDatabase().families()
-        self.font_combo.addItems(fonts)
-        self.font_combo.setCurrentText(self.watermark_font.family())
+        # 启动时先使用上次缓存的字体列表，窗口显示后再读取系统字体（字体很多时读取较慢）
+        self.set_font_families(self.settings.value("fonts/families", [], type=list))
         self.font_combo.currentTextChanged.connect(self.update_font)
         font_group_layout.addWidget(self.font_combo, 0, 1)
         
@@ -221,6 +360,12 @@ class WatermarkApp(QMainWindow):
         self.color_button.clicked.connect(self.select_color)
         font_group_layout.addWidget(self.color_button, 1, 3)
         
+        # 自适应颜色
+        self.adaptive_color_check = QCheckBox("自适应颜色（按背景亮度自动选择深色或浅色）")
+        self.adaptive_color_check.setChecked(self.watermark_adaptive_color)
+        self.adaptive_color_check.toggled.connect(self.update_adaptive_color)
+        font_group_layout.addWidget(self.adaptive_color_check, 2, 0, 1, 4)
+        
         layout.addWidget(text_group)
         layout.addWidget(font_group)
         layout.addStretch()
@@ -296,6 +441,16 @@ class WatermarkApp(QMainWindow):
         
         rotation_layout.addLayout(rotation_sub_layout)
         
+        # 旋转和斜体变换的插值方式
+        resample_sub_layout = QHBoxLayout()
+        resample_sub_layout.addWidget(QLabel("插值方式:"))
+        self.resample_combo = QComboBox()
+        for label, name in (("双三次（平滑）", "bicubic"), ("双线性", "bilinear"), ("最近邻（锐利）", "nearest")):
+            self.resample_combo.addItem(label, name)
+        self.resample_combo.currentIndexChanged.connect(self.update_resample)
+        resample_sub_layout.addWidget(self.resample_combo, 1)
+        rotation_layout.addLayout(resample_sub_layout)
+        
         # 预设位置
         position_group = QGroupBox("预设位置")
         position_layout = QGridLayout(position_group)
@@ -317,10 +472,27 @@ class WatermarkApp(QMainWindow):
             btn.clicked.connect(lambda checked, x=x, y=y: self.set_watermark_position(x, y))
             position_layout.addWidget(btn, row, col)
         
+        # 自动定位：每张图片分别选择纹理最少的区域
+        self.auto_position_check = QCheckBox("自动选择空白区域")
+        self.auto_position_check.setChecked(self.watermark_auto_position)
+        self.auto_position_check.toggled.connect(self.update_auto_position)
+        position_layout.addWidget(self.auto_position_check, 3, 0, 1, 3)
+        
+        # 单张图片设置
+        override_group = QGroupBox("单张图片设置")
+        override_layout = QHBoxLayout(override_group)
+        self.override_check = QCheckBox("位置、透明度、大小仅应用于当前图片")
+        self.btn_clear_override = QPushButton("恢复为全局设置")
+        self.btn_clear_override.clicked.connect(self.clear_current_override)
+        self.btn_clear_override.setEnabled(False)
+        override_layout.addWidget(self.override_check)
+        override_layout.addWidget(self.btn_clear_override)
+        
         layout.addWidget(opacity_group)
         layout.addWidget(size_group)
         layout.addWidget(rotation_group)
         layout.addWidget(position_group)
+        layout.addWidget(override_group)
         layout.addStretch()
     
     def init_template_tab(self):
@@ -368,456 +540,250 @@ class WatermarkApp(QMainWindow):
         )
         
         if folder:
-            # 获取文件夹中所有支持的图片文件
-            supported_formats = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif']
-            files = []
-            for root, _, filenames in os.walk(folder):
-                for filename in filenames:
-                    if any(filename.lower().endswith(ext) for ext in supported_formats):
-                        files.append(os.path.join(root, filename))
-            
-            if files:
-                self.add_images(files)
-            else:
-                QMessageBox.information(self, "提示", "所选文件夹中没有找到支持的图片文件")
+            # 在后台扫描文件夹，找到的图片分批加入列表
+            self.scan_paths([folder], notify_empty=True)
+    
+    def scan_paths(self, paths, notify_empty=False):
+        """
+        在后台扫描文件和文件夹，并把找到的图片添加到列表
+        
+        Args:
+            paths: 文件或文件夹路径列表
+            notify_empty: 没有找到图片时是否提示用户
+        """
+        scanner = DirectoryScanner(paths, self.sniff_check.isChecked(), self)
+        scanner.files_found.connect(self.add_images)
+        scanner.progress.connect(self.on_scan_progress)
+        scanner.scan_finished.connect(
+            lambda found, rejected, cancelled: self.on_scan_finished(found, rejected, cancelled, notify_empty)
+        )
+        scanner.finished.connect(lambda: self.on_scanner_stopped(scanner))
+        
+        self.scanners.append(scanner)
+        self.btn_cancel_scan.setVisible(True)
+        self.scan_status_label.setText("正在扫描...")
+        scanner.start()
+    
+    def on_scan_progress(self, dirs_scanned, files_found):
+        """扫描进度更新"""
+        self.scan_status_label.setText(f"正在扫描：{dirs_scanned} 个文件夹，找到 {files_found} 张图片")
+    
+    def on_scan_finished(self, found, rejected, cancelled, notify_empty):
+        """扫描结束"""
+        if cancelled:
+            text = f"扫描已取消，已添加 {found} 张图片"
+        else:
+            text = f"扫描完成，找到 {found} 张图片"
+        if rejected:
+            text += f"，排除 {rejected} 个内容不是图片的文件"
+        self.scan_status_label.setText(text)
+        
+        if notify_empty and found == 0 and not cancelled:
+            QMessageBox.information(self, "提示", "所选文件夹中没有找到支持的图片文件")
+    
+    def on_scanner_stopped(self, scanner):
+        """扫描线程退出后清理"""
+        if scanner in self.scanners:
+            self.scanners.remove(scanner)
+        scanner.deleteLater()
+        self.btn_cancel_scan.setVisible(bool(self.scanners))
+    
+    def cancel_scans(self):
+        """取消所有正在进行的扫描"""
+        for scanner in self.scanners:
+            scanner.cancel()
     
     def add_images(self, files):
         """添加图片到列表"""
-        for file_path in files:
-            if file_path not in self.image_paths:
-                self.image_paths.append(file_path)
-                
-                # 创建列表项
-                item = QListWidgetItem(os.path.basename(file_path))
-                
-                # 创建缩略图，添加错误处理
-                pixmap = QPixmap(file_path)
-                if not pixmap.isNull():
-                    scaled_pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                    item.setIcon(QIcon(scaled_pixmap))
-                else:
-                    # 如果无法加载图片，设置默认文本
-                    item.setText(f"{os.path.basename(file_path)} (无法加载)")
-                
-                self.image_list.addItem(item)
+        self.image_model.add_paths(files)
         
         # 如果是第一次添加图片，自动选中第一张
-        if self.image_list.count() > 0 and self.current_index == -1:
-            self.image_list.setCurrentRow(0)
-            self.on_image_selected(self.image_list.currentItem())
+        if len(self.image_paths) > 0 and self.current_index == -1:
+            self.select_row(0)
         
         # 启用导出按钮
-        self.btn_export.setEnabled(self.image_list.count() > 0)
+        self.btn_export.setEnabled(len(self.image_paths) > 0)
+    
+    def select_row(self, row):
+        """选中列表中的指定行并更新预览"""
+        index = self.image_model.index(row)
+        if self.image_list.currentIndex() == index:
+            self.on_image_selected(index)
+        else:
+            self.image_list.setCurrentIndex(index)
     
     def remove_files(self):
         """移除选中的文件"""
-        selected_items = self.image_list.selectedItems()
-        if not selected_items:
+        selected_rows = [index.row() for index in self.image_list.selectionModel().selectedIndexes()]
+        if not selected_rows:
             return
         
         # 保存当前选中索引
-        current_row = self.image_list.currentRow()
+        current_row = self.image_list.currentIndex().row()
         
-        # 移除选中项
-        for item in selected_items:
-            index = self.image_list.row(item)
-            if index < len(self.image_paths):
-                del self.image_paths[index]
-            self.image_list.takeItem(self.image_list.row(item))
+        # 一次性移除所有选中项，路径列表和模型保持同步
+        removed = self.image_model.remove_rows(selected_rows)
+        for path in removed:
+            self.image_overrides.pop(path, None)
         
         # 更新当前索引
-        if self.image_list.count() == 0:
+        if len(self.image_paths) == 0:
             self.current_index = -1
             self.preview_label.setText("预览区域")
         else:
             # 尝试保持选中相同位置的项
-            new_row = min(current_row, self.image_list.count() - 1)
-            self.image_list.setCurrentRow(new_row)
-            self.on_image_selected(self.image_list.currentItem())
+            new_row = max(0, min(current_row, len(self.image_paths) - 1))
+            self.select_row(new_row)
         
         # 更新导出按钮状态
-        self.btn_export.setEnabled(self.image_list.count() > 0)
+        self.btn_export.setEnabled(len(self.image_paths) > 0)
     
-    def on_image_selected(self, item):
+    def on_image_selected(self, index):
         """图片选中事件"""
-        if item:
-            index = self.image_list.row(item)
-            if 0 <= index < len(self.image_paths):
-                self.current_index = index
+        if index.isValid():
+            row = index.row()
+            if 0 <= row < len(self.image_paths):
+                self.current_index = row
+                self.sync_override_controls()
                 self.update_preview()
     
     def update_preview(self):
-        """更新预览"""
+        """
+        更新预览
+        
+        先用小尺寸代理图快速渲染一帧并立即显示，再在后台渲染完整质量的预览替换它。
+        代理图需要完整解码才能得到时（未缓存的PNG、TIFF等）不在界面线程中解码，
+        先显示列表中的缩略图，等后台渲染完成。
+        """
+        # 窗口第一次显示之前不渲染，显示后再补上（见 finish_startup）
+        if self.startup_ms is None:
+            return
+        
         if self.current_index >= 0 and self.current_index < len(self.image_paths):
             image_path = self.image_paths[self.current_index]
+            settings = self.settings_for_image(image_path)
+            target_size = self.preview_label.size()
+            start_time = time.perf_counter()
             
             try:
-                # 打开原图
-                image = Image.open(image_path)
-                
-                # 应用水印
-                watermarked_image = self.apply_watermark(image)
-                
-                # 转换为QPixmap显示
-                q_image = self.pil_to_qimage(watermarked_image)
-                if not q_image.isNull():
-                    pixmap = QPixmap.fromImage(q_image)
-                    
-                    # 缩放以适应预览区域
-                    scaled_pixmap = pixmap.scaled(
-                        self.preview_label.size(), 
-                        Qt.KeepAspectRatio, 
-                        Qt.SmoothTransformation
-                    )
-                    
-                    self.preview_label.setPixmap(scaled_pixmap)
+                # 第一阶段：在代理图上渲染水印（只用已缓存的图片或JPEG的快速解码）
+                proxy = self.image_cache.get_proxy(image_path, PREVIEW_PROXY_SIZE, decode=False)
+                if proxy is None:
+                    self.show_preview_placeholder(image_path, target_size)
                 else:
-                    self.preview_label.setText("无法显示预览图片")
+                    proxy, original_size = proxy
+                    proxy_settings = watermark_renderer.scaled_settings(settings, proxy.width / original_size[0])
+                    watermarked_image = watermark_renderer.apply_watermark(proxy, proxy_settings)
+                    
+                    # 转换为QPixmap显示
+                    q_image = self.pil_to_qimage(watermarked_image)
+                    if not q_image.isNull():
+                        pixmap = QPixmap.fromImage(q_image)
+                        
+                        # 快速缩放以适应预览区域
+                        scaled_pixmap = pixmap.scaled(
+                            target_size, 
+                            Qt.KeepAspectRatio, 
+                            Qt.FastTransformation
+                        )
+                        
+                        self.preview_label.setPixmap(scaled_pixmap)
+                    else:
+                        self.preview_label.setText("无法显示预览图片")
+                        return
             except Exception as e:
                 self.preview_label.setText(f"预览错误: {str(e)}")
-        else:
-            self.preview_label.setText("预览区域")
-    
-    def apply_watermark(self, image):
-        """应用水印到图片"""
-        # 创建图像副本
-        watermarked = image.copy()
-        
-        # 根据水印类型应用不同的处理
-        if self.watermark_type == "text":
-            result = self.apply_text_watermark(watermarked)
-            # 确保结果不为空
-            if result is None:
-                return watermarked
-            return result
-        elif self.watermark_type == "image" and self.watermark_image_path:
-            result = self.apply_image_watermark(watermarked)
-            if result is None:
-                return watermarked
-            return result
-        
-        return watermarked
-    
-    def apply_text_watermark(self, image):
-        """应用文本水印"""
-        # 确保图像有alpha通道
-        original_mode = image.mode
-        if image.mode != "RGBA":
-            image = image.convert("RGBA")
-        
-        # 创建水印层
-        watermark_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(watermark_layer)
-        
-        # 获取水印文本
-        text = self.watermark_text
-        if not text.strip():
-            return image  # 如果文本为空，返回原图
-        
-        # 使用用户在UI中设置的字体大小
-        font_size = max(8, min(1024, self.watermark_font.pointSize()))  # 限制字体大小范围
-        
-        # 检查字体设置（加粗和斜体）
-        is_bold = self.watermark_font.bold()
-        is_italic = self.watermark_font.italic()
-        selected_font_family = self.watermark_font.family()
-        
-        # 查找可用的字体
-        font = None
-        
-        # 1. 首先尝试直接使用用户选择的字体名称
-        try:
-            font = ImageFont.truetype(selected_font_family, font_size)
-        except Exception:
-            # 如果直接使用字体名称失败，尝试查找系统中的字体文件
-            font_paths = []
-            
-            # 根据用户选择的字体名称和样式构建可能的字体文件路径
-            font_name_lower = selected_font_family.lower()
-            windows_fonts_dir = "C:\Windows\Fonts"
-            
-            # 构建可能的字体文件名称
-            possible_font_files = []
-            if "微软雅黑" in font_name_lower or "microsoft yahei" in font_name_lower:
-                possible_font_files.extend(["msyh.ttc", "msyhbd.ttc", "msyhl.ttc"])
-            elif "宋体" in font_name_lower or "simsun" in font_name_lower:
-                possible_font_files.extend(["simsun.ttc", "simsunb.ttf"])
-            elif "黑体" in font_name_lower or "heiti" in font_name_lower or "simhei" in font_name_lower:
-                possible_font_files.extend(["simhei.ttf"])
-            elif "楷体" in font_name_lower or "kai" in font_name_lower or "simkai" in font_name_lower:
-                possible_font_files.extend(["simkai.ttf"])
-            elif "arial" in font_name_lower:
-                possible_font_files.extend(["arial.ttf", "arialbd.ttf", "ariali.ttf", "arialbi.ttf"])
-            elif "times" in font_name_lower:
-                possible_font_files.extend(["times.ttf", "timesbd.ttf", "timesi.ttf", "timesbi.ttf"])
-            elif "courier" in font_name_lower:
-                possible_font_files.extend(["cour.ttf", "courbd.ttf", "couri.ttf", "courbi.ttf"])
-            
-            # 优化字体文件排序逻辑，确保粗体优先
-            # 首先按样式优先级排序
-            if is_bold and is_italic:
-                # 粗斜体 > 粗体 > 斜体 > 常规
-                priority_order = {
-                    3: lambda f: ('bd' in f or 'bold' in f.lower()) and ('i' in f or 'italic' in f.lower()),  # 粗斜体
-                    2: lambda f: ('bd' in f or 'bold' in f.lower()) and not ('i' in f or 'italic' in f.lower()),  # 粗体
-                    1: lambda f: not ('bd' in f or 'bold' in f.lower()) and ('i' in f or 'italic' in f.lower()),  # 斜体
-                    0: lambda f: not ('bd' in f or 'bold' in f.lower()) and not ('i' in f or 'italic' in f.lower())  # 常规
-                }
-            elif is_bold:
-                # 粗体 > 常规
-                priority_order = {
-                    2: lambda f: ('bd' in f or 'bold' in f.lower()),  # 粗体
-                    0: lambda f: not ('bd' in f or 'bold' in f.lower())  # 常规
-                }
-            elif is_italic:
-                # 斜体 > 常规
-                priority_order = {
-                    1: lambda f: ('i' in f or 'italic' in f.lower()),  # 斜体
-                    0: lambda f: not ('i' in f or 'italic' in f.lower())  # 常规
-                }
-            else:
-                # 仅常规
-                priority_order = {0: lambda f: True}
+                return
             
-            # 为每个字体文件分配优先级
-            prioritized_fonts = []
-            for f in possible_font_files:
-                for priority, condition in sorted(priority_order.items(), reverse=True):
-                    if condition(f):
-                        prioritized_fonts.append((-priority, f))  # 使用负优先级以便升序排序时高优先级在前
-                        break
+            self.preview_metrics["first_frame_ms"] = (time.perf_counter() - start_time) * 1000
             
-            # 按优先级排序
-            prioritized_fonts.sort()
-            possible_font_files = [f for _, f in prioritized_fonts]
+            # 第二阶段：后台渲染完整质量的预览
+            self.preview_renderer.request(image_path, settings, (target_size.width(), target_size.height()))
             
-            # 添加完整路径
-            for font_file in possible_font_files:
-                full_path = os.path.join(windows_fonts_dir, font_file)
-                if os.path.exists(full_path):
-                    font_paths.append(full_path)
-            
-            # 2. 如果找不到匹配的字体，使用默认的中文字体列表
-            if not font_paths:
-                # Windows系统中常见的中文字体路径
-                # 根据是否需要粗体调整默认字体顺序
-                if is_bold:
-                    # 粗体优先的默认字体列表
-                    chinese_fonts = [
-                        r"C:\Windows\Fonts\msyhbd.ttc",    # 微软雅黑粗体
-                        r"C:\Windows\Fonts\simhei.ttf",    # 黑体（较粗）
-                        r"C:\Windows\Fonts\simsunb.ttf",   # 宋体粗体
-                        r"C:\Windows\Fonts\msyh.ttc",      # 微软雅黑
-                        r"C:\Windows\Fonts\simsun.ttc",     # 宋体
-                        r"C:\Windows\Fonts\simkai.ttf",    # 楷体
-                    ]
-                else:
-                    # 常规字体列表
-                    chinese_fonts = [
-                        r"C:\Windows\Fonts\msyh.ttc",      # 微软雅黑
-                        r"C:\Windows\Fonts\simsun.ttc",     # 宋体
-                        r"C:\Windows\Fonts\simhei.ttf",    # 黑体
-                        r"C:\Windows\Fonts\simkai.ttf",    # 楷体
-                        r"C:\Windows\Fonts\msyhbd.ttc",    # 微软雅黑粗体
-                    ]
-                font_paths.extend(chinese_fonts)
-            
-            # 尝试加载字体文件 - 增强粗体支持
-            font = None
-            # 先尝试直接使用字体名称并指定粗体样式
-            if is_bold:
-                try:
-                    # 对于PIL，可以通过在字体名称后添加样式参数来尝试加载粗体
-                    # 注意：这在不同PIL版本和系统上的支持程度不同
-                    font = ImageFont.truetype(selected_font_family, font_size, weight='bold')
-                except Exception:
-                    pass
-            
-            # 如果直接加载粗体失败，再尝试文件路径方式
-            if font is None:
-                for font_path in font_paths:
-                    try:
-                        if os.path.exists(font_path):
-                            # 获取文件名和扩展名
-                            file_name = os.path.basename(font_path)
-                            file_ext = os.path.splitext(font_path)[1].lower()
-                            
-                            # 设置加载参数
-                            font_params = {}
-                            
-                            # 对于TTC文件，使用index参数选择样式
-                            if file_ext == ".ttc":
-                                # 微软雅黑等字体通常使用index=1作为粗体
-                                if 'bd' in file_name or 'bold' in file_name.lower():
-                                    font_params['index'] = 0  # 粗体文件中的第一个索引通常就是粗体
-                                elif is_bold:
-                                    font_params['index'] = 1  # 常规文件中的第二个索引可能是粗体
-                                else:
-                                    font_params['index'] = 0  # 常规样式
-                            
-                            # 尝试加载字体，传递相应参数
-                            font = ImageFont.truetype(font_path, font_size, **font_params)
-                            
-                            # 验证是否成功加载了正确的粗体字体
-                            # 注意：PIL的ImageFont不直接提供检查字体是否为粗体的方法
-                            # 但我们已经通过文件优先级确保了优先尝试粗体文件
-                            break
-                    except Exception:
-                        continue
-        
-        # 如果找不到中文字体，使用默认字体
-        if font is None:
-            try:
-                # 尝试使用PIL默认字体
-                font = ImageFont.load_default()
-            except Exception:
-                # 如果默认字体也加载失败，使用备用字体大小计算
-                pass
-        
-        # 获取用户设置的颜色和透明度
-        color = self.watermark_color
-        
-        # 直接使用QColor的RGB值，但交换R和B通道以修复颜色反转问题
-        r = color.red()
-        g = color.green()
-        b = color.blue()
-        # 交换R和B通道，因为PIL和PyQt5可能对RGB通道顺序处理不同
-        # 临时保存r值
-        temp = r
-        r = b
-        b = temp
-        
-        # 处理透明度：将用户透明度滑块值(0-100)转换为PIL可用的alpha值(0-255)
-        # 这样可以确保用户选择的颜色RGB值能正确显示，同时透明度由滑块控制
-        opacity_value = self.watermark_opacity
-        final_alpha = int(255 * (opacity_value / 100))
-        
-        # 确保alpha值在有效范围内
-        final_alpha = max(0, min(255, final_alpha))
-        
-        # 为PIL的ImageDraw创建正确的RGBA颜色元组
-        text_color = (r, g, b, final_alpha)
-        
-        # 计算文本尺寸和位置
-        try:
-            # 尝试获取文本尺寸
-            if hasattr(draw, 'textsize'):
-                # PIL 10.0.0之前的版本
-                text_width, text_height = draw.textsize(text, font=font)
-            else:
-                # PIL 10.0.0及以后的版本
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-        except Exception:
-            # 如果无法获取文本尺寸，使用估计值
-            text_width = font_size * len(text) * 0.7
-            text_height = font_size * 1.2
-        
-        # 计算水印位置（基于用户设置的位置）
-        x = int((self.watermark_position[0] * image.width) - (text_width / 2))
-        y = int((self.watermark_position[1] * image.height) - (text_height / 2))
-        
-        # 确保文本在图像范围内
-        x = max(0, min(x, image.width - text_width))
-        y = max(0, min(y, image.height - text_height))
-        
-        # 绘制文本
-        try:
-            # 处理斜体效果
-            if is_italic and font:
-                # 对于斜体，我们需要旋转文本
-                # 创建一个临时的水印层
-                temp_watermark = Image.new("RGBA", (text_width + 50, text_height + 50), (0, 0, 0, 0))
-                temp_draw = ImageDraw.Draw(temp_watermark)
-                temp_draw.text((25, 25), text, font=font, fill=text_color)
-                
-                # 旋转临时水印层来创建斜体效果（通常约12度）
-                italic_watermark = temp_watermark.rotate(-12, expand=1, fillcolor=(0, 0, 0, 0))
-                
-                # 计算旋转后的位置
-                rot_x = x - (italic_watermark.width - temp_watermark.width) // 2
-                rot_y = y - (italic_watermark.height - temp_watermark.height) // 2
-                
-                # 粘贴旋转后的水印
-                watermark_layer.paste(italic_watermark, (rot_x, rot_y), italic_watermark)
-            else:
-                # 正常绘制文本
-                draw.text((x, y), text, font=font, fill=text_color)
-        except Exception:
-            # 如果使用font参数失败，尝试不使用font参数
-            try:
-                draw.text((x, y), text, fill=text_color)
-            except Exception:
-                # 如果仍然失败，记录错误但继续执行
-                pass
-        
-        # 合并水印层到原图
-        result = Image.new("RGBA", image.size)
-        result.paste(image, (0, 0))
-        result.paste(watermark_layer, (0, 0), watermark_layer)
-        
-        # 转换回原始模式
-        if original_mode == "RGB":
-            result = result.convert("RGB")
-        
-        return result
+            # 预览请求发出后，稍等片刻再预取相邻图片
+            self.prefetch_timer.start()
+        else:
+            self.preview_renderer.cancel()
+            self.preview_label.setText("预览区域")
     
-    def apply_image_watermark(self, image):
-        """应用图片水印"""
-        try:
-            # 打开水印图片
-            watermark = Image.open(self.watermark_image_path)
-            
-            # 确保水印图片有alpha通道
-            if watermark.mode != "RGBA":
-                watermark = watermark.convert("RGBA")
-            
-            # 确保原图有alpha通道
-            if image.mode != "RGBA":
-                image = image.convert("RGBA")
-            
-            # 计算水印大小
-            base_size = min(image.width, image.height) * (self.watermark_size / 100)
-            scale_factor = base_size / max(watermark.width, watermark.height)
-            
-            new_width = int(watermark.width * scale_factor)
-            new_height = int(watermark.height * scale_factor)
-            
-            # 调整水印大小
-            watermark = watermark.resize((new_width, new_height), Image.LANCZOS)
-            
-            # 应用透明度
-            if self.watermark_opacity != 100:
-                # 获取水印的alpha通道
-                r, g, b, a = watermark.split()
-                # 调整alpha通道
-                a = a.point(lambda x: int(x * self.watermark_opacity / 100))
-                # 合并回水印图片
-                watermark = Image.merge("RGBA", (r, g, b, a))
-            
-            # 应用旋转
-            if self.watermark_rotation != 0:
-                watermark = watermark.rotate(self.watermark_rotation, expand=1, fillcolor=(0, 0, 0, 0))
-            
-            # 计算水印位置
-            x = int((self.watermark_position[0] * image.width) - (watermark.width / 2))
-            y = int((self.watermark_position[1] * image.height) - (watermark.height / 2))
-            
-            # 创建结果图片并合并
-            result = Image.new("RGBA", image.size)
-            result.paste(image, (0, 0))
-            result.paste(watermark, (x, y), watermark)
-            
-            # 转换回原始模式
-            if image.mode == "RGB":
-                result = result.convert("RGB")
-            
-            return result
-        
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"应用图片水印时出错: {str(e)}")
-            return image
+    def show_preview_placeholder(self, image_path, target_size):
+        """完整质量的预览完成前显示的占位图：列表中已加载的缩略图，没有时显示文字"""
+        thumbnail = self.image_model.cached_thumbnail(image_path)
+        if thumbnail is None:
+            self.preview_label.setText("正在加载预览…")
+            return
+        self.preview_label.setPixmap(thumbnail.scaled(target_size, Qt.KeepAspectRatio, Qt.FastTransformation))
+    
+    def prefetch_nearby_images(self):
+        """预取当前图片前后的图片和列表可见区域的图片"""
+        count = len(self.image_paths)
+        neighbours = []
+        if 0 <= self.current_index < count:
+            for offset in range(1, PREFETCH_NEIGHBOURS + 1):
+                for row in (self.current_index + offset, self.current_index - offset):
+                    if 0 <= row < count:
+                        neighbours.append(self.image_paths[row])
+        
+        visible = [self.image_paths[row] for row in self.visible_rows()]
+        self.prefetcher.prefetch(neighbours, visible)
+    
+    def visible_rows(self, limit=200):
+        """图片列表中当前可见的行号"""
+        viewport_rect = self.image_list.viewport().rect()
+        first = self.image_list.indexAt(viewport_rect.topLeft() + QPoint(10, 10))
+        if not first.isValid():
+            return []
+        
+        rows = []
+        row = first.row()
+        while row < len(self.image_paths) and len(rows) < limit:
+            if not self.image_list.visualRect(self.image_model.index(row)).intersects(viewport_rect):
+                break
+            rows.append(row)
+            row += 1
+        return rows
+    
+    def on_preview_frame_ready(self, generation, q_image, elapsed_ms):
+        """完整质量的预览渲染完成"""
+        # 拖拽过程中不覆盖拖拽预览
+        if self.drag_preview is not None:
+            return
+        self.preview_label.setPixmap(QPixmap.fromImage(q_image))
+        self.preview_metrics["full_frame_ms"] = elapsed_ms
+        self.statusBar().showMessage(
+            f"预览：首帧 {self.preview_metrics['first_frame_ms']:.0f} ms，完整质量 {elapsed_ms:.0f} ms"
+        )
+    
+    def on_preview_failed(self, generation, error):
+        """完整质量的预览渲染失败"""
+        if self.drag_preview is None:
+            self.preview_label.setText(f"预览错误: {error}")
+    
+    def current_settings(self):
+        """获取当前全局水印设置的快照（供渲染模块使用）"""
+        return {
+            "type": self.watermark_type,
+            "text": self.watermark_text,
+            "image_path": self.watermark_image_path,
+            "opacity": self.watermark_opacity,
+            "position": self.watermark_position,
+            "auto_position": self.watermark_auto_position,
+            "size": self.watermark_size,
+            "rotation": self.watermark_rotation,
+            "resample": self.watermark_resample,
+            "color": (self.watermark_color.red(), self.watermark_color.green(), self.watermark_color.blue()),
+            "adaptive_color": self.watermark_adaptive_color,
+            "font_family": self.watermark_font.family(),
+            "font_size": self.watermark_font.pointSize(),
+            "font_bold": self.watermark_font.bold(),
+            "font_italic": self.watermark_font.italic(),
+        }
+    
+    def settings_for_image(self, image_path, base_settings=None):
+        """获取指定图片的有效水印设置（全局设置 + 该图片的单独设置）"""
+        if base_settings is None:
+            base_settings = self.current_settings()
+        return watermark_renderer.settings_with_overrides(base_settings, self.image_overrides.get(image_path))
     
     def pil_to_qimage(self, pil_image):
         """将PIL Image转换为QImage"""
@@ -829,8 +795,17 @@ class WatermarkApp(QMainWindow):
             r, g, b, a = pil_image.split()
             q_image = QImage(pil_image.tobytes(), pil_image.width, pil_image.height, pil_image.width * 4, QImage.Format_RGBA8888)
             return q_image.rgbSwapped()
+        elif pil_image.mode == "L":
+            q_image = QImage(pil_image.tobytes(), pil_image.width, pil_image.height, pil_image.width, QImage.Format_Grayscale8)
+            # QImage 不持有传入的数据，返回前复制一份
+            return q_image.copy()
+        elif pil_image.mode.startswith("I"):
+            # 16位（或32位整数）灰度按比例缩减为8位，每像素不止一个字节，不能按灰度8位解释
+            from high_bit_depth import to_8bit_image
+            return self.pil_to_qimage(to_8bit_image(pil_image))
         else:
-            return QImage(pil_image.tobytes(), pil_image.width, pil_image.height, pil_image.width, QImage.Format_Grayscale8)
+            # 调色板、CMYK等其他模式
+            return self.pil_to_qimage(pil_image.convert("RGB"))
     
     def update_watermark_text(self, text):
         """更新水印文本"""
@@ -839,13 +814,13 @@ class WatermarkApp(QMainWindow):
     
     def update_opacity(self, value):
         """更新透明度"""
-        self.watermark_opacity = value
+        self.set_common_setting("opacity", value)
         self.opacity_label.setText(f"{value}%")
         self.update_preview()
     
     def update_size(self, value):
         """更新水印大小"""
-        self.watermark_size = value
+        self.set_common_setting("size", value)
         self.size_label.setText(f"{value}%")
         self.update_preview()
     
@@ -855,11 +830,77 @@ class WatermarkApp(QMainWindow):
         self.rotation_label.setText(f"{value}°")
         self.update_preview()
     
+    def update_resample(self, index):
+        """更新旋转和斜体变换的插值方式"""
+        self.watermark_resample = self.resample_combo.itemData(index)
+        self.update_preview()
+    
     def set_watermark_position(self, x, y):
         """设置水印位置"""
-        self.watermark_position = (x, y)
+        self.set_common_setting("position", (x, y))
+        self.update_preview()
+    
+    def current_image_path(self):
+        """获取当前选中图片的路径，没有选中时返回None"""
+        if 0 <= self.current_index < len(self.image_paths):
+            return self.image_paths[self.current_index]
+        return None
+    
+    def set_common_setting(self, field, value):
+        """
+        设置位置/透明度/大小
+        
+        勾选了"仅应用于当前图片"时写入当前图片的覆盖设置，否则修改全局设置。
+        """
+        image_path = self.current_image_path()
+        if self.override_check.isChecked() and image_path is not None:
+            overrides = self.image_overrides.setdefault(image_path, {})
+            overrides[field] = value
+            if field == "position":
+                # 手动指定的位置优先于自动定位
+                overrides["auto_position"] = False
+            self.btn_clear_override.setEnabled(True)
+        else:
+            setattr(self, f"watermark_{field}", value)
+            if field == "position" and self.watermark_auto_position:
+                self.watermark_auto_position = False
+                self.auto_position_check.blockSignals(True)
+                self.auto_position_check.setChecked(False)
+                self.auto_position_check.blockSignals(False)
+    
+    def update_auto_position(self, checked):
+        """切换自动定位"""
+        self.watermark_auto_position = checked
         self.update_preview()
     
+    def clear_current_override(self):
+        """清除当前图片的单独设置，恢复使用全局设置"""
+        image_path = self.current_image_path()
+        if image_path is not None:
+            self.image_overrides.pop(image_path, None)
+        self.sync_override_controls()
+        self.update_preview()
+    
+    def sync_override_controls(self):
+        """让通用设置控件显示当前图片的有效设置"""
+        image_path = self.current_image_path()
+        overrides = self.image_overrides.get(image_path, {})
+        opacity = overrides.get("opacity", self.watermark_opacity)
+        size = overrides.get("size", self.watermark_size)
+        
+        # 阻止信号，避免把显示值写回设置
+        self.opacity_slider.blockSignals(True)
+        self.size_slider.blockSignals(True)
+        self.opacity_slider.setValue(opacity)
+        self.size_slider.setValue(size)
+        self.opacity_slider.blockSignals(False)
+        self.size_slider.blockSignals(False)
+        self.opacity_label.setText(f"{opacity}%")
+        self.size_label.setText(f"{size}%")
+        
+        self.override_check.setChecked(bool(overrides))
+        self.btn_clear_override.setEnabled(bool(overrides))
+    
     def select_color(self):
         """选择颜色"""
         # 创建一个颜色对话框，并设置为允许用户选择带有alpha通道的颜色
@@ -876,6 +917,41 @@ class WatermarkApp(QMainWindow):
                 # 更新预览以显示新颜色
                 self.update_preview()
     
+    def update_adaptive_color(self, checked):
+        """切换自适应颜色"""
+        self.watermark_adaptive_color = checked
+        self.color_button.setEnabled(not checked)
+        self.update_preview()
+    
+    def set_font_families(self, families):
+        """填充字体下拉列表，保持当前字体不变"""
+        self.font_combo.blockSignals(True)
+        self.font_combo.clear()
+        self.font_combo.addItems(families)
+        self.font_combo.setCurrentText(self.watermark_font.family())
+        self.font_combo.blockSignals(False)
+    
+    def load_font_families(self):
+        """在后台加载字体索引（字体目录有变化时重新扫描），完成后更新字体列表"""
+        if self.font_index_loader is not None:
+            return
+        self.font_index_loader = FontIndexLoader(default_index(), self)
+        self.font_index_loader.loaded.connect(self.on_font_families_loaded)
+        self.font_index_loader.finished.connect(self.font_index_loader.deleteLater)
+        self.font_index_loader.start()
+    
+    def on_font_families_loaded(self, families):
+        """字体索引加载完成，与缓存不同时更新下拉列表和缓存"""
+        self.font_index_loader = None
+        if not families:
+            # 没有找到字体目录时退回到Qt的字体列表
+            # QFontDatabase().families()直接返回字符串列表，不需要再调用family()方法
+            families = QFontDatabase().families()
+        cached = [self.font_combo.itemText(i) for i in range(self.font_combo.count())]
+        if families != cached:
+            self.set_font_families(families)
+            self.settings.setValue("fonts/families", families)
+    
     def update_font(self):
         """更新字体设置"""
         font_family = self.font_combo.currentText()
@@ -953,62 +1029,262 @@ class WatermarkApp(QMainWindow):
             quality = dialog.quality_spin.value() if export_format == "jpeg" else 100
             resize_option = dialog.get_resize_option()
             
-            # 开始导出
-            for i, image_path in enumerate(self.image_paths):
-                try:
-                    # 打开图片
-                    image = Image.open(image_path)
-                    
-                    # 应用水印
-                    watermarked_image = self.apply_watermark(image)
-                    
-                    # 调整尺寸（如果需要）
-                    if resize_option:
-                        option_type, value = resize_option
-                        if option_type == "width":
-                            width = value
-                            height = int(image.height * (width / image.width))
-                        elif option_type == "height":
-                            height = value
-                            width = int(image.width * (height / image.height))
-                        else:  # percentage
-                            width = int(image.width * value / 100)
-                            height = int(image.height * value / 100)
-                        
-                        watermarked_image = watermarked_image.resize((width, height), Image.LANCZOS)
-                    
-                    # 生成输出文件名
-                    base_name = os.path.basename(image_path)
-                    name_without_ext = os.path.splitext(base_name)[0]
-                    
-                    if naming_rule["type"] == "original":
-                        output_name = f"{name_without_ext}.{export_format}"
-                    elif naming_rule["type"] == "prefix":
-                        output_name = f"{naming_rule['value']}{name_without_ext}.{export_format}"
-                    else:  # suffix
-                        output_name = f"{name_without_ext}{naming_rule['value']}.{export_format}"
-                    
-                    # 保存文件
-                    output_path = os.path.join(export_dir, output_name)
-                    
-                    # 根据格式保存
-                    if export_format == "jpeg":
-                        # 确保是RGB模式
-                        if watermarked_image.mode == "RGBA":
-                            background = Image.new("RGB", watermarked_image.size, (255, 255, 255))
-                            background.paste(watermarked_image, mask=watermarked_image.split()[3])
-                            watermarked_image = background
-                        watermarked_image.save(output_path, "JPEG", quality=quality)
-                    else:  # png
-                        watermarked_image.save(output_path, "PNG")
-                    
-                except Exception as e:
-                    QMessageBox.warning(
-                        self, "导出失败", 
-                        f"导出图片 '{os.path.basename(image_path)}' 时出错: {str(e)}"
-                    )
+            options = {
+                "format": export_format,
+                "naming_rule": naming_rule,
+                "quality": quality,
+                "resize_option": resize_option,
+                # 重建原文件夹结构时，以所有图片的公共上级目录为根
+                "source_root": common_source_root(self.image_paths) if dialog.is_mirror_tree() else None,
+            }
             
-            QMessageBox.information(self, "完成", "图片导出成功！")
+            self.start_export_preflight(export_dir, options)
+    
+    def start_export_preflight(self, export_dir, options):
+        """导出前在后台读取所有图片的文件头，完成后显示检查结果"""
+        # 设置快照在检查开始时生成，之后修改设置不会影响本次导出
+        snapshot = {
+            "image_paths": list(self.image_paths),
+            "settings": self.current_settings(),
+            "overrides": {path: dict(fields) for path, fields in self.image_overrides.items()},
+        }
+        
+        probe = PreflightProbe(
+            snapshot["image_paths"], export_dir, options, self.export_megapixels_per_second(), self
+        )
+        progress = QProgressDialog("正在检查图片...", "取消", 0, len(snapshot["image_paths"]), self)
+        progress.setWindowTitle("导出前检查")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.canceled.connect(probe.cancel)
+        probe.progress.connect(lambda done, total: progress.setValue(done))
+        probe.probe_finished.connect(
+            lambda report: self.on_preflight_finished(report, probe, progress, snapshot, export_dir, options)
+        )
+        self.preflight_probe = probe
+        probe.start()
+        
+        # 检查期间提前启动并预热导出进程池（设置没有变化时不做任何事）
+        self.export_queue.pool.warm(snapshot["settings"])
+    
+    def on_preflight_finished(self, report, probe, progress, snapshot, export_dir, options):
+        """导出前检查完成，显示概要并确认是否开始导出"""
+        progress.close()
+        probe.wait()
+        probe.deleteLater()
+        self.preflight_probe = None
+        if report is None:
+            return
+        
+        if not report.readable:
+            box = QMessageBox(QMessageBox.Warning, "导出前检查", "没有可以读取的图片。", QMessageBox.Ok, self)
+            box.setDetailedText("\n".join(report.detail_lines()))
+            box.exec_()
+            return
+        
+        icon = QMessageBox.Warning if report.has_problems() else QMessageBox.Question
+        box = QMessageBox(icon, "导出前检查",
+                          "\n".join(report.summary_lines()) + "\n\n是否开始导出？",
+                          QMessageBox.Yes | QMessageBox.No, self)
+        box.setDefaultButton(QMessageBox.Yes)
+        details = report.detail_lines()
+        if details:
+            box.setDetailedText("\n".join(details))
+        if box.exec_() != QMessageBox.Yes:
+            return
+        
+        # 任务保存设置快照，之后修改设置不会影响已排队的任务；无法读取的图片直接跳过
+        readable_paths = [info["path"] for info in report.readable]
+        job = ExportJob(
+            readable_paths, snapshot["settings"], snapshot["overrides"], export_dir, options,
+            report.image_sizes()
+        )
+        self.export_queue.add_job(job)
+    
+    def export_megapixels_per_second(self):
+        """估算导出耗时使用的处理速度（由上一次导出实测得到）"""
+        return self.settings.value("export/megapixels_per_second", DEFAULT_MEGAPIXELS_PER_SECOND, type=float)
+    
+    def on_export_progress(self, job):
+        """导出任务开始或每完成一张图片时更新进度"""
+        self.export_progress.setMaximum(job.total)
+        self.export_progress.setValue(job.done_count)
+        self.update_export_status()
+    
+    def on_export_job_finished(self, job):
+        """导出任务结束时汇总结果"""
+        self.update_export_status()
+        
+        # 用实测速度校准下一次导出前检查的耗时估算
+        if job.total_pixels and job.busy_seconds >= 1.0:
+            self.settings.setValue("export/megapixels_per_second", job.total_pixels / 1e6 / job.busy_seconds)
+        
+        # 监视文件夹自动产生的任务只更新状态，不弹出提示
+        if job.options.get("watch"):
+            self.watch_stats["done"] += job.done_count - job.failed_count
+            self.watch_stats["errors"] += job.failed_count
+            self.update_watch_status()
+            return
+        
+        if job.status == JOB_CANCELLED:
+            summary = f"导出已取消，已处理 {job.done_count}/{job.total} 张图片"
+        else:
+            summary = f"图片导出完成！共 {job.total} 张"
+        
+        # 所有错误汇总到一个非模态提示中，不打断后续任务
+        details = []
+        if job.failed_count:
+            box = QMessageBox(QMessageBox.Warning, "导出完成（有错误）",
+                              f"{summary}，其中 {job.failed_count} 张导出失败。", QMessageBox.Ok, self)
+            details.extend(f"无法创建目录 {directory}（{count} 张图片未导出）: {error}"
+                           for directory, error, count in job.dir_errors)
+            details.extend(f"{os.path.basename(path)}: {error}" for path, error in job.errors)
+            details.append("")
+        else:
+            box = QMessageBox(QMessageBox.Information, "完成", summary, QMessageBox.Ok, self)
+        
+        # 按图片尺寸分组的吞吐量统计
+        group_lines = job.group_summary()
+        if group_lines:
+            details.append("按尺寸分组:")
+            details.extend(group_lines)
+        memory_line = job.memory_summary()
+        if memory_line:
+            details.append(f"内存: {memory_line}")
+        if details:
+            box.setDetailedText("\n".join(details))
+        box.setAttribute(Qt.WA_DeleteOnClose)
+        box.setModal(False)
+        box.show()
+    
+    def update_export_status(self):
+        """更新导出进度区域的文字和按钮状态"""
+        job = self.export_queue.current_job
+        pending = self.export_queue.pending_count()
+        
+        if job is None:
+            self.export_status_label.setText("没有正在进行的导出任务")
+            self.export_progress.setValue(0)
+        else:
+            text = f"任务 #{job.job_id}: {job.done_count}/{job.total}"
+            eta = job.eta_seconds()
+            if eta is not None:
+                minutes, seconds = divmod(int(eta), 60)
+                text += f"，剩余约 {minutes:02d}:{seconds:02d}"
+            if self.export_queue.is_paused():
+                text += "（已暂停）"
+            if pending:
+                text += f"，排队中 {pending} 个任务"
+            self.export_status_label.setText(text)
+        
+        has_job = job is not None
+        self.btn_pause_export.setEnabled(has_job)
+        self.btn_cancel_export.setEnabled(has_job)
+        self.btn_pause_export.setText("继续" if self.export_queue.is_paused() else "暂停")
+    
+    def update_memory_budget(self, value):
+        """修改内存预算（MB），超出新预算的缓存立即淘汰"""
+        self.memory_governor.budget_bytes = value * 1024 * 1024
+        self.settings.setValue("memory/budget_mb", value)
+        self.memory_governor.enforce()
+        self.update_memory_status()
+    
+    def update_memory_status(self):
+        """刷新内存占用显示"""
+        mb = 1024 * 1024
+        usage = self.memory_governor.usage()
+        current = sum(usage.values())
+        text = (
+            f"当前 {current / mb:.0f} MB（解码 {usage.get('decoded', 0) / mb:.0f}，"
+            f"缩略图 {usage.get('thumbnails', 0) / mb:.0f}，导出 {usage.get('exports', 0) / mb:.0f}），"
+            f"峰值 {self.memory_governor.peak_bytes / mb:.0f} MB"
+        )
+        rss = process_peak_rss()
+        if rss is not None:
+            text += f"，进程峰值 {rss / mb:.0f} MB"
+        self.memory_status_label.setText(text)
+    
+    def toggle_watch_folder(self):
+        """开始或停止监视文件夹"""
+        if self.folder_watcher is not None:
+            self.stop_watch_folder()
+            return
+        
+        watch_dir = QFileDialog.getExistingDirectory(self, "选择要监视的文件夹")
+        if not watch_dir:
+            return
+        export_dir = QFileDialog.getExistingDirectory(self, "选择导出文件夹")
+        if not export_dir:
+            return
+        # 导出文件夹就是监视的文件夹时，导出结果会被再次当作新图片处理
+        if os.path.normcase(os.path.abspath(export_dir)) == os.path.normcase(os.path.abspath(watch_dir)):
+            QMessageBox.warning(self, "警告", "导出文件夹不能与监视的文件夹相同。")
+            return
+        
+        from export_dialog import ExportDialog
+        dialog = ExportDialog(self)
+        dialog.mirror_check.setEnabled(False)
+        if not dialog.exec_():
+            return
+        
+        export_format = dialog.format_combo.currentText().lower()
+        self.watch_options = {
+            "format": export_format,
+            "naming_rule": dialog.get_naming_rule(),
+            "quality": dialog.quality_spin.value() if export_format == "jpeg" else 100,
+            "resize_option": dialog.get_resize_option(),
+            "source_root": None,
+            "watch": True,
+        }
+        self.watch_export_dir = export_dir
+        self.watch_stats = {"done": 0, "errors": 0}
+        
+        self.folder_watcher = FolderWatcher(watch_dir, parent=self)
+        self.folder_watcher.files_ready.connect(self.on_watch_files_ready)
+        self.folder_watcher.start()
+        self.btn_watch.setText("停止监视")
+        self.update_watch_status()
+    
+    def stop_watch_folder(self):
+        """停止监视文件夹（已排队的导出任务继续执行）"""
+        if self.folder_watcher is None:
+            return
+        self.folder_watcher.stop()
+        self.folder_watcher.deleteLater()
+        self.folder_watcher = None
+        self.btn_watch.setText("监视文件夹...")
+        self.update_watch_status()
+    
+    def on_watch_files_ready(self, paths):
+        """监视的文件夹中有新图片写入完成，使用当前设置排队导出"""
+        job = ExportJob(paths, self.current_settings(), {}, self.watch_export_dir, self.watch_options)
+        self.export_queue.add_job(job)
+        self.update_watch_status()
+    
+    def update_watch_status(self):
+        """更新监视文件夹的状态文字"""
+        if self.folder_watcher is None:
+            text = ""
+            if self.watch_stats["done"] or self.watch_stats["errors"]:
+                text = f"监视已停止，共导出 {self.watch_stats['done']} 张"
+        else:
+            mode = "" if self.folder_watcher.using_notifications else "（轮询）"
+            text = (f"正在监视{mode} {self.folder_watcher.directory}："
+                    f"已导出 {self.watch_stats['done']} 张")
+        if self.watch_stats["errors"]:
+            text += f"，失败 {self.watch_stats['errors']} 张"
+        self.watch_status_label.setText(text)
+    
+    def toggle_export_pause(self):
+        """暂停或继续导出"""
+        if self.export_queue.is_paused():
+            self.export_queue.resume()
+        else:
+            self.export_queue.pause()
+    
+    def cancel_export(self):
+        """取消当前导出任务"""
+        self.export_queue.cancel_current()
     
     def save_template(self):
         """保存当前设置为模板"""
@@ -1052,74 +1328,63 @@ class WatermarkApp(QMainWindow):
         else:
             QMessageBox.warning(self, "警告", "请先选择一个模板")
     
+    def current_template(self):
+        """把当前全局设置转换为模板记录"""
+        return {
+            "type": self.watermark_type,
+            "text": self.watermark_text,
+            "image_path": self.watermark_image_path,
+            "opacity": self.watermark_opacity,
+            "position_x": self.watermark_position[0],
+            "position_y": self.watermark_position[1],
+            "auto_position": self.watermark_auto_position,
+            "size": self.watermark_size,
+            "rotation": self.watermark_rotation,
+            "resample": self.watermark_resample,
+            "color": self.watermark_color.name(),
+            "adaptive_color": self.watermark_adaptive_color,
+            "font_family": self.watermark_font.family(),
+            "font_size": self.watermark_font.pointSize(),
+            "font_bold": self.watermark_font.bold(),
+            "font_italic": self.watermark_font.italic(),
+        }
+    
+    def apply_template(self, template):
+        """把模板记录应用为当前全局设置"""
+        self.watermark_type = template["type"]
+        self.watermark_text = template["text"]
+        self.watermark_image_path = template["image_path"]
+        self.watermark_opacity = template["opacity"]
+        self.watermark_position = (template["position_x"], template["position_y"])
+        self.watermark_auto_position = template["auto_position"]
+        self.watermark_size = template["size"]
+        self.watermark_rotation = template["rotation"]
+        self.watermark_resample = template["resample"]
+        self.watermark_color = QColor(template["color"])
+        self.watermark_adaptive_color = template["adaptive_color"]
+        
+        self.watermark_font = QFont(template["font_family"], template["font_size"])
+        self.watermark_font.setBold(template["font_bold"])
+        self.watermark_font.setItalic(template["font_italic"])
+    
     def save_template_to_settings(self, template_name):
         """保存模板到设置"""
-        template_key = f"templates/{template_name}"
-        
-        self.settings.setValue(f"{template_key}/type", self.watermark_type)
-        self.settings.setValue(f"{template_key}/text", self.watermark_text)
-        self.settings.setValue(f"{template_key}/image_path", self.watermark_image_path)
-        self.settings.setValue(f"{template_key}/opacity", self.watermark_opacity)
-        self.settings.setValue(f"{template_key}/position_x", self.watermark_position[0])
-        self.settings.setValue(f"{template_key}/position_y", self.watermark_position[1])
-        self.settings.setValue(f"{template_key}/size", self.watermark_size)
-        self.settings.setValue(f"{template_key}/rotation", self.watermark_rotation)
-        self.settings.setValue(f"{template_key}/color", self.watermark_color.name())
-        self.settings.setValue(f"{template_key}/font_family", self.watermark_font.family())
-        self.settings.setValue(f"{template_key}/font_size", self.watermark_font.pointSize())
-        self.settings.setValue(f"{template_key}/font_bold", self.watermark_font.bold())
-        self.settings.setValue(f"{template_key}/font_italic", self.watermark_font.italic())
+        self.template_store.save(template_name, self.current_template())
     
     def load_template_from_settings(self, template_name):
         """从设置加载模板"""
-        template_key = f"templates/{template_name}"
-        
-        self.watermark_type = self.settings.value(f"{template_key}/type", "text")
-        self.watermark_text = self.settings.value(f"{template_key}/text", "水印文字")
-        self.watermark_image_path = self.settings.value(f"{template_key}/image_path", "")
-        self.watermark_opacity = self.settings.value(f"{template_key}/opacity", 50, type=int)
-        pos_x = self.settings.value(f"{template_key}/position_x", 0.5, type=float)
-        pos_y = self.settings.value(f"{template_key}/position_y", 0.5, type=float)
-        self.watermark_position = (pos_x, pos_y)
-        self.watermark_size = self.settings.value(f"{template_key}/size", 100, type=int)
-        self.watermark_rotation = self.settings.value(f"{template_key}/rotation", 0, type=int)
-        
-        color_name = self.settings.value(f"{template_key}/color", "#FFFFFF")
-        self.watermark_color = QColor(color_name)
-        
-        font_family = self.settings.value(f"{template_key}/font_family", "SimHei")
-        font_size = self.settings.value(f"{template_key}/font_size", 36, type=int)
-        font_bold = self.settings.value(f"{template_key}/font_bold", False, type=bool)
-        font_italic = self.settings.value(f"{template_key}/font_italic", False, type=bool)
-        
-        self.watermark_font = QFont(font_family, font_size)
-        self.watermark_font.setBold(font_bold)
-        self.watermark_font.setItalic(font_italic)
+        template = self.template_store.get(template_name)
+        if template is not None:
+            self.apply_template(template)
     
     def delete_template_from_settings(self, template_name):
         """从设置删除模板"""
-        template_key = f"templates/{template_name}"
-        
-        # 删除所有模板相关的设置
-        for key in self.settings.allKeys():
-            if key.startswith(template_key):
-                self.settings.remove(key)
+        self.template_store.delete(template_name)
     
     def load_template_list(self):
         """加载模板列表"""
         self.template_list.clear()
-        
-        # 获取所有模板名称
-        template_names = set()
-        for key in self.settings.allKeys():
-            if key.startswith("templates/"):
-                parts = key.split("/")
-                if len(parts) >= 2:
-                    template_names.add(parts[1])
-        
-        # 添加到列表
-        for name in sorted(template_names):
-            self.template_list.addItem(name)
+        self.template_list.addItems(self.template_store.names())
     
     def update_ui_from_settings(self):
         """从设置更新UI"""
@@ -1136,19 +1401,26 @@ class WatermarkApp(QMainWindow):
         
         # 更新颜色
         self.color_button.setStyleSheet(f"background-color: {self.watermark_color.name()}")
+        self.color_button.setEnabled(not self.watermark_adaptive_color)
+        self.adaptive_color_check.blockSignals(True)
+        self.adaptive_color_check.setChecked(self.watermark_adaptive_color)
+        self.adaptive_color_check.blockSignals(False)
         
         # 更新图片水印设置
         self.watermark_path_label.setText(self.watermark_image_path)
         # 根据是否存在水印图片路径启用或禁用取消按钮
         self.btn_clear_watermark.setEnabled(bool(self.watermark_image_path))
         
-        # 更新通用设置
-        self.opacity_slider.setValue(self.watermark_opacity)
-        self.opacity_label.setText(f"{self.watermark_opacity}%")
-        self.size_slider.setValue(self.watermark_size)
-        self.size_label.setText(f"{self.watermark_size}%")
+        # 更新通用设置（透明度和大小显示当前图片的有效值）
+        self.sync_override_controls()
         self.rotation_slider.setValue(self.watermark_rotation)
         self.rotation_label.setText(f"{self.watermark_rotation}°")
+        self.resample_combo.blockSignals(True)
+        self.resample_combo.setCurrentIndex(max(0, self.resample_combo.findData(self.watermark_resample)))
+        self.resample_combo.blockSignals(False)
+        self.auto_position_check.blockSignals(True)
+        self.auto_position_check.setChecked(self.watermark_auto_position)
+        self.auto_position_check.blockSignals(False)
         
         # 切换到正确的选项卡
         if self.watermark_type == "image":
@@ -1160,28 +1432,9 @@ class WatermarkApp(QMainWindow):
         """加载应用设置"""
         # 尝试加载上次使用的设置
         try:
-            if self.settings.contains("last_settings/type"):
-                self.watermark_type = self.settings.value("last_settings/type", "text")
-                self.watermark_text = self.settings.value("last_settings/text", "水印文字")
-                self.watermark_image_path = self.settings.value("last_settings/image_path", "")
-                self.watermark_opacity = self.settings.value("last_settings/opacity", 50, type=int)
-                pos_x = self.settings.value("last_settings/position_x", 0.5, type=float)
-                pos_y = self.settings.value("last_settings/position_y", 0.5, type=float)
-                self.watermark_position = (pos_x, pos_y)
-                self.watermark_size = self.settings.value("last_settings/size", 100, type=int)
-                self.watermark_rotation = self.settings.value("last_settings/rotation", 0, type=int)
-                
-                color_name = self.settings.value("last_settings/color", "#FFFFFF")
-                self.watermark_color = QColor(color_name)
-                
-                font_family = self.settings.value("last_settings/font_family", "SimHei")
-                font_size = self.settings.value("last_settings/font_size", 36, type=int)
-                font_bold = self.settings.value("last_settings/font_bold", False, type=bool)
-                font_italic = self.settings.value("last_settings/font_italic", False, type=bool)
-                
-                self.watermark_font = QFont(font_family, font_size)
-                self.watermark_font.setBold(font_bold)
-                self.watermark_font.setItalic(font_italic)
+            last_settings = self.template_store.last_settings()
+            if last_settings is not None:
+                self.apply_template(last_settings)
                 
             # 加载完设置后更新UI
             self.update_ui_from_settings()
@@ -1192,21 +1445,12 @@ class WatermarkApp(QMainWindow):
     def save_settings(self):
         """保存应用设置"""
         try:
-            self.settings.setValue("last_settings/type", self.watermark_type)
-            self.settings.setValue("last_settings/text", self.watermark_text)
-            self.settings.setValue("last_settings/image_path", self.watermark_image_path)
-            self.settings.setValue("last_settings/opacity", self.watermark_opacity)
-            self.settings.setValue("last_settings/position_x", self.watermark_position[0])
-            self.settings.setValue("last_settings/position_y", self.watermark_position[1])
-            self.settings.setValue("last_settings/size", self.watermark_size)
-            self.settings.setValue("last_settings/rotation", self.watermark_rotation)
-            self.settings.setValue("last_settings/color", self.watermark_color.name())
-            self.settings.setValue("last_settings/font_family", self.watermark_font.family())
-            self.settings.setValue("last_settings/font_size", self.watermark_font.pointSize())
-            self.settings.setValue("last_settings/font_bold", self.watermark_font.bold())
-            self.settings.setValue("last_settings/font_italic", self.watermark_font.italic())
+            self.template_store.set_last_settings(self.current_template())
         except:
             pass
+        # 关闭前最后一次重试，仍然失败时提示用户本次的模板修改没有保存
+        if not self.template_store.flush():
+            QMessageBox.warning(self, "保存失败", f"无法写入模板文件：\n{self.template_store.path}")
     
     def on_preview_mouse_press(self, event):
         """预览区域鼠标按下事件"""
@@ -1216,6 +1460,7 @@ class WatermarkApp(QMainWindow):
             self.is_dragging = True
             self.drag_start_pos = event.pos()
             self.setCursor(QCursor(Qt.ClosedHandCursor))
+            self.begin_drag_preview()
     
     def on_preview_mouse_move(self, event):
         """预览区域鼠标移动事件"""
@@ -1223,28 +1468,30 @@ class WatermarkApp(QMainWindow):
             # 计算移动距离
             delta = event.pos() - self.drag_start_pos
             
-            # 获取预览标签的尺寸和图像的实际尺寸
+            # 获取预览图的显示尺寸
             if self.preview_label.pixmap():
                 pixmap = self.preview_label.pixmap()
-                label_width = self.preview_label.width()
-                label_height = self.preview_label.height()
                 
-                # 计算移动比例
-                scale_x = 1.0 / label_width
-                scale_y = 1.0 / label_height
+                # 计算移动比例（按图片显示尺寸换算，水印跟随鼠标移动）
+                scale_x = 1.0 / max(1, pixmap.width())
+                scale_y = 1.0 / max(1, pixmap.height())
                 
                 # 更新水印位置
-                new_x = self.watermark_position[0] + delta.x() * scale_x
-                new_y = self.watermark_position[1] + delta.y() * scale_y
+                position = self.settings_for_image(self.current_image_path())["position"]
+                new_x = position[0] + delta.x() * scale_x
+                new_y = position[1] + delta.y() * scale_y
                 
                 # 限制在有效范围内
                 new_x = max(0.0, min(1.0, new_x))
                 new_y = max(0.0, min(1.0, new_y))
                 
-                self.watermark_position = (new_x, new_y)
+                self.set_common_setting("position", (new_x, new_y))
                 
-                # 更新预览
-                self.update_preview()
+                # 拖拽过程中只重绘缓存的水印精灵，松开鼠标后再完整渲染
+                if self.drag_preview is not None:
+                    self.paint_drag_frame()
+                else:
+                    self.update_preview()
                 
                 # 更新起始位置
                 self.drag_start_pos = event.pos()
@@ -1254,6 +1501,84 @@ class WatermarkApp(QMainWindow):
         if event.button() == Qt.LeftButton and self.is_dragging:
             self.is_dragging = False
             self.setCursor(QCursor(Qt.ArrowCursor))
+            if self.drag_preview is not None:
+                self.drag_preview = None
+                self.update_preview()
+    
+    def begin_drag_preview(self):
+        """准备拖拽预览：缓存缩放后的原图和单独渲染的水印精灵"""
+        self.drag_preview = None
+        image_path = self.current_image_path()
+        pixmap = self.preview_label.pixmap()
+        if image_path is None or pixmap is None or pixmap.isNull():
+            return
+        
+        try:
+            target_size = (pixmap.width(), pixmap.height())
+            
+            # 与预览共用解码缓存，JPEG可以直接按接近预览的尺寸解码；
+            # 需要完整解码而原图尚未缓存时不在界面线程中解码，退回到逐帧完整渲染
+            proxy = self.image_cache.get_proxy(image_path, max(target_size), decode=False)
+            if proxy is None:
+                return
+            proxy, original_size = proxy
+            base = proxy.resize(target_size, Image.BILINEAR)
+            if base.mode not in ("RGB", "RGBA"):
+                base = base.convert("RGBA" if "A" in base.mode else "RGB")
+            
+            settings = self.settings_for_image(image_path)
+            scale = target_size[0] / original_size[0]
+            sprite, sprite_pos = watermark_renderer.render_sprite(base, settings, scale)
+        except Exception:
+            # 无法准备缓存时退回到逐帧完整渲染
+            return
+        
+        self.drag_preview = {
+            "base": QPixmap.fromImage(self.pil_to_qimage(base)),
+            "sprite": QPixmap.fromImage(self.pil_to_qimage(sprite)) if sprite is not None else None,
+            "sprite_pos": sprite_pos,
+            "start_position": settings["position"],
+            "clamp": settings["type"] == "text",
+        }
+    
+    def paint_drag_frame(self):
+        """把缓存的水印精灵绘制到缓存的原图上，只在拖拽过程中使用"""
+        preview = self.drag_preview
+        frame = QPixmap(preview["base"])
+        sprite = preview["sprite"]
+        
+        if sprite is not None:
+            position = self.settings_for_image(self.current_image_path())["position"]
+            start = preview["start_position"]
+            x = preview["sprite_pos"][0] + (position[0] - start[0]) * frame.width()
+            y = preview["sprite_pos"][1] + (position[1] - start[1]) * frame.height()
+            
+            # 文本水印与完整渲染一样限制在图片范围内
+            if preview["clamp"]:
+                x = max(0, min(x, frame.width() - sprite.width()))
+                y = max(0, min(y, frame.height() - sprite.height()))
+            
+            painter = QPainter(frame)
+            painter.drawPixmap(int(x), int(y), sprite)
+            painter.end()
+        
+        self.preview_label.setPixmap(frame)
+    
+    def showEvent(self, event):
+        """窗口显示事件"""
+        super().showEvent(event)
+        if self.startup_ms is None:
+            # 等窗口画出来之后再做较慢的初始化
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """窗口第一次显示后：读取系统字体列表并渲染第一次预览"""
+        if self.startup_ms is not None:
+            return
+        self.startup_ms = (time.perf_counter() - STARTUP_BEGIN) * 1000
+        self.load_font_families()
+        self.update_preview()
+        self.statusBar().showMessage(f"启动用时 {self.startup_ms:.0f} ms", 5000)
     
     def resizeEvent(self, event):
         """窗口大小改变事件"""
@@ -1291,28 +1616,8 @@ class WatermarkApp(QMainWindow):
             elif event.type() == event.Drop:
                 # 处理拖放事件
                 if event.mimeData().hasUrls():
-                    # 获取拖放的文件路径
-                    files = []
-                    for url in event.mimeData().urls():
-                        file_path = url.toLocalFile()
-                        # 检查是否为文件且是支持的图片格式
-                        if os.path.isfile(file_path):
-                            _, ext = os.path.splitext(file_path)
-                            if ext.lower() in ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif']:
-                                files.append(file_path)
-                        # 检查是否为文件夹
-                        elif os.path.isdir(file_path):
-                            # 递归获取文件夹中所有支持的图片文件
-                            supported_formats = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif']
-                            for root, _, filenames in os.walk(file_path):
-                                for filename in filenames:
-                                    if any(filename.lower().endswith(ext) for ext in supported_formats):
-                                        files.append(os.path.join(root, filename))
-                    
-                    # 添加图片
-                    if files:
-                        self.add_images(files)
-                    
+                    # 获取拖放的文件路径，文件夹在后台递归扫描
+                    self.scan_paths([url.toLocalFile() for url in event.mimeData().urls()])
                     event.acceptProposedAction()
                     return True
         # 其他事件交给默认处理
@@ -1321,34 +1626,54 @@ class WatermarkApp(QMainWindow):
     def dropEvent(self, event):
         """处理主窗口的拖放事件"""
         if event.mimeData().hasUrls():
-            # 获取拖放的文件路径
-            files = []
-            for url in event.mimeData().urls():
-                file_path = url.toLocalFile()
-                # 检查是否为文件且是支持的图片格式
-                if os.path.isfile(file_path):
-                    _, ext = os.path.splitext(file_path)
-                    if ext.lower() in ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif']:
-                        files.append(file_path)
-                # 检查是否为文件夹
-                elif os.path.isdir(file_path):
-                    # 递归获取文件夹中所有支持的图片文件
-                    supported_formats = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif']
-                    for root, _, filenames in os.walk(file_path):
-                        for filename in filenames:
-                            if any(filename.lower().endswith(ext) for ext in supported_formats):
-                                files.append(os.path.join(root, filename))
-            
-            # 添加图片
-            if files:
-                self.add_images(files)
-            
+            # 获取拖放的文件路径，文件夹在后台递归扫描
+            self.scan_paths([url.toLocalFile() for url in event.mimeData().urls()])
             event.acceptProposedAction()
         else:
             super().dropEvent(event)
     
     def closeEvent(self, event):
         """窗口关闭事件"""
+        # 如果还有导出任务，确认是否取消
+        if self.export_queue.current_job is not None:
+            reply = QMessageBox.question(
+                self, "确认退出",
+                "还有导出任务正在进行，退出将取消这些任务。确定要退出吗？",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply == QMessageBox.No:
+                event.ignore()
+                return
+            self.export_queue.cancel_all()
+        # 等待导出线程退出并关闭常驻的进程池
+        self.export_queue.shutdown()
+        self.memory_timer.stop()
+        
+        # 停止监视文件夹
+        self.stop_watch_folder()
+        
+        # 停止导出前检查
+        if self.preflight_probe is not None:
+            self.preflight_probe.cancel()
+            self.preflight_probe.wait()
+        
+        # 停止后台预览渲染和预取
+        self.prefetch_timer.stop()
+        self.preview_renderer.cancel()
+        self.prefetcher.cancel()
+        self.preview_renderer.wait_for_done()
+        self.prefetcher.wait_for_done()
+        self.preview_renderer.shutdown()
+        
+        # 停止正在进行的文件夹扫描
+        for scanner in list(self.scanners):
+            scanner.cancel()
+            scanner.wait()
+        
+        # 等待字体索引加载完成（扫描字体目录不能中途取消）
+        if self.font_index_loader is not None:
+            self.font_index_loader.wait()
+        
         # 保存设置
         self.save_settings()
         event.accept()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+memory_governor.py - 全局内存预算
+
+解码缓存、缩略图缓存和正在导出的图片各自估算占用的内存，统一登记到 MemoryGovernor。
+总量超过预算时按登记顺序让缓存淘汰旧项；导出在提交新图片前检查预算，
+不够时先等已提交的图片完成，而不是同时解码更多大图。
+同时记录估算占用的峰值和进程的实际内存峰值（RSS），用于状态栏和导出报告。
+"""
+
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不显示进程内存峰值
+    resource = None
+
+
+# 默认内存预算（字节）
+DEFAULT_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+
+# 导出一张图片时同时存在的图片副本数（解码结果、RGBA副本、合成结果）
+EXPORT_WORKING_COPIES = 3
+
+# 导出前无法读取尺寸的图片按这个大小估算（字节）
+UNKNOWN_EXPORT_BYTES = 64 * 1024 * 1024
+
+
+def estimate_export_bytes(size):
+    """估算导出一张图片时占用的内存（字节）"""
+    if size is None:
+        return UNKNOWN_EXPORT_BYTES
+    return size[0] * size[1] * 4 * EXPORT_WORKING_COPIES
+
+
+def process_peak_rss():
+    """当前进程的实际内存峰值（字节），无法获取时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的单位是KB，macOS 是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryGovernor:
+    """
+    内存预算管理（线程安全）
+
+    缓存通过 add_consumer 登记自己的占用统计函数和淘汰函数；
+    临时占用（正在导出的图片）通过 reserve/release 登记。
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_MEMORY_BUDGET):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._consumers = []  # [(名称, 占用函数, 淘汰函数或None)]，按登记顺序淘汰
+        self._reserved = {}  # {名称: 临时占用的字节数}
+        self.peak_bytes = 0
+
+    def add_consumer(self, name, usage, shrink=None):
+        """
+        登记一个缓存
+
+        Args:
+            name: 在状态中显示的名称
+            usage: 返回当前占用字节数的函数
+            shrink: 淘汰函数 shrink(需要释放的字节数) -> 实际释放的字节数，为None时不参与淘汰
+        """
+        with self._lock:
+            self._consumers.append((name, usage, shrink))
+
+    def usage(self):
+        """各项当前占用 {名称: 字节数}"""
+        with self._lock:
+            consumers = list(self._consumers)
+            reserved = dict(self._reserved)
+        usage = {name: usage_fn() for name, usage_fn, _ in consumers}
+        for name, nbytes in reserved.items():
+            usage[name] = usage.get(name, 0) + nbytes
+        return usage
+
+    def current_bytes(self):
+        """当前估算的总占用"""
+        return sum(self.usage().values())
+
+    def can_reserve(self, nbytes):
+        """在允许淘汰缓存的前提下，再占用 nbytes 是否不超过预算"""
+        with self._lock:
+            consumers = list(self._consumers)
+            reserved = sum(self._reserved.values())
+        # 可以淘汰的缓存不计入
+        fixed = sum(usage_fn() for _, usage_fn, shrink in consumers if shrink is None)
+        return fixed + reserved + nbytes <= self.budget_bytes
+
+    def reserve(self, name, nbytes):
+        """登记临时占用，必要时让缓存淘汰旧项腾出空间"""
+        with self._lock:
+            self._reserved[name] = self._reserved.get(name, 0) + nbytes
+        self.enforce()
+
+    def release(self, name, nbytes):
+        """释放临时占用"""
+        with self._lock:
+            self._reserved[name] = max(0, self._reserved.get(name, 0) - nbytes)
+
+    def notify(self):
+        """缓存占用增加后调用：更新峰值，超过预算时淘汰"""
+        self.enforce()
+
+    def enforce(self):
+        """
+        总占用超过预算时按登记顺序让缓存淘汰旧项
+
+        Returns:
+            淘汰后的总占用
+        """
+        current = self.current_bytes()
+        self._update_peak(current)
+        if current <= self.budget_bytes:
+            return current
+
+        with self._lock:
+            consumers = list(self._consumers)
+        for _, usage_fn, shrink in consumers:
+            if shrink is None:
+                continue
+            excess = current - self.budget_bytes
+            if excess <= 0:
+                break
+            current -= shrink(excess)
+        return current
+
+    def reset_peak(self):
+        """从当前占用重新开始统计峰值"""
+        with self._lock:
+            self.peak_bytes = 0
+        self._update_peak(self.current_bytes())
+
+    def _update_peak(self, current):
+        with self._lock:
+            if current > self.peak_bytes:
+                self.peak_bytes = current
+
+
+# 进程内共用的内存预算
+memory_governor = MemoryGovernor()
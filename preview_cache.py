@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+preview_cache.py - 预览缓存与后台渲染
+
+DecodedImageCache 按内存预算缓存解码后的原图和小尺寸代理图，
+PreviewRenderer 在后台渲染完整质量的预览，过期的请求直接丢弃；合成在独立的工作进程中进行，
+原图和结果通过共享内存传递（见 shared_images.py），不与界面线程争用GIL，
+PreviewPrefetcher 在空闲时以低优先级预先解码相邻和可见的图片。
+16位灰度图片解码后立即转换为8位（见 high_bit_depth.py），预览不需要16位精度。
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage
+from PIL import Image
+
+import watermark_renderer
+from worker_pool import WarmWorkerPool
+
+
+# 解码缓存的默认内存预算（字节）
+DEFAULT_CACHE_BUDGET = 512 * 1024 * 1024
+
+
+def _file_stamp(path):
+    """文件的修改时间和大小，用于判断缓存是否过期"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _decoded(image):
+    """加载像素；16位（或32位整数）灰度图片转换为8位，PIL直接转换为RGB时会截断"""
+    image.load()
+    if image.mode.startswith("I"):
+        # 只有遇到这类图片时才导入（会同时导入NumPy）
+        from high_bit_depth import to_8bit_image
+        image = to_8bit_image(image)
+    return image
+
+
+def estimate_image_bytes(image):
+    """估算PIL图片占用的内存（字节）"""
+    return image.width * image.height * len(image.getbands())
+
+
+class DecodedImageCache:
+    """
+    解码图片缓存（线程安全）
+
+    同时缓存完整解码的原图和用于快速预览的小尺寸代理图，
+    按最近最少使用的顺序淘汰，总大小不超过内存预算。
+    指定 governor 时登记到全局内存预算（见 memory_governor.py），总占用超出时也会被要求淘汰。
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_CACHE_BUDGET, governor=None):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        # {(路径, 代理尺寸或None): (文件标记, 图片, 原图尺寸, 字节数)}
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.governor = governor
+        if governor is not None:
+            governor.add_consumer("decoded", lambda: self._total_bytes, self.shrink)
+
+    @property
+    def total_bytes(self):
+        """当前缓存占用的字节数"""
+        return self._total_bytes
+
+    def free_bytes(self):
+        """预算中尚未使用的字节数"""
+        return max(0, self.budget_bytes - self._total_bytes)
+
+    def is_cached(self, path, max_size=None):
+        """原图（max_size为None）或指定尺寸的代理图是否已在缓存中（不检查文件是否修改）"""
+        with self._lock:
+            return (path, max_size) in self._entries
+
+    def get(self, path):
+        """获取完整解码的原图"""
+        stamp = _file_stamp(path)
+        entry = self._lookup((path, None), stamp)
+        if entry is not None:
+            return entry[1]
+
+        image = _decoded(Image.open(path))
+        self._store((path, None), stamp, image, image.size)
+        return image
+
+    def get_proxy(self, path, max_size, decode=True):
+        """
+        获取最长边不超过 max_size 的代理图
+
+        原图已缓存时直接从原图缩小；否则JPEG按比例快速解码，
+        其他格式完整解码后缩小，预算有空余时原图也放入缓存供后续完整渲染复用，
+        但不会为此淘汰其他缓存（预取可见行时不会挤掉当前图片的原图）。
+
+        Args:
+            decode: 为False时不做完整解码（界面线程中调用），需要完整解码时返回None
+
+        Returns:
+            (代理图, 原图尺寸)，decode为False且无法快速得到代理图时为None
+        """
+        stamp = _file_stamp(path)
+        entry = self._lookup((path, max_size), stamp)
+        if entry is not None:
+            return entry[1], entry[2]
+
+        full_entry = self._lookup((path, None), stamp)
+        if full_entry is not None:
+            source = full_entry[1]
+            original_size = source.size
+        else:
+            source = Image.open(path)
+            original_size = source.size
+            if source.format == "JPEG":
+                source.draft("RGB", (max_size, max_size))
+            elif not decode:
+                source.close()
+                return None
+            else:
+                source = _decoded(source)
+                if estimate_image_bytes(source) <= self.free_bytes():
+                    self._store((path, None), stamp, source, original_size)
+
+        return self._store_proxy(path, stamp, source, original_size, max_size), original_size
+
+    def add_proxy(self, path, image, max_size):
+        """
+        用已完整解码的原图生成代理图放入缓存（代理图已缓存时不做任何事）
+
+        原图超出预算没有缓存时，后台渲染用它留下代理图，之后的快速预览不需要再次解码。
+        """
+        stamp = _file_stamp(path)
+        if self._lookup((path, max_size), stamp) is None:
+            self._store_proxy(path, stamp, image, image.size, max_size)
+
+    def _store_proxy(self, path, stamp, source, original_size, max_size):
+        """从 source 缩小出代理图并放入缓存"""
+        proxy = source.copy()
+        proxy.thumbnail((max_size, max_size), Image.BILINEAR)
+        self._store((path, max_size), stamp, proxy, original_size)
+        return proxy
+
+    def invalidate(self, path):
+        """删除某个文件的所有缓存"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._total_bytes -= self._entries.pop(key)[3]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def shrink(self, nbytes):
+        """
+        按最近最少使用的顺序淘汰，直到释放至少 nbytes 字节或缓存为空
+
+        Returns:
+            实际释放的字节数
+        """
+        freed = 0
+        with self._lock:
+            while freed < nbytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted[3]
+                freed += evicted[3]
+        return freed
+
+    def _lookup(self, key, stamp):
+        """查找缓存项，文件已修改时视为未命中"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                self._total_bytes -= self._entries.pop(key)[3]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, stamp, image, original_size):
+        """放入缓存并按预算淘汰旧项"""
+        nbytes = estimate_image_bytes(image)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[3]
+
+            # 单张超过预算的图片不缓存
+            if nbytes > self.budget_bytes:
+                return
+            self._entries[key] = (stamp, image, original_size, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted[3]
+
+        # 在释放锁之后通知，全局预算超出时会回调 shrink
+        if self.governor is not None:
+            self.governor.notify()
+
+
+class _PreviewSignals(QObject):
+    """预览任务的信号"""
+
+    finished = pyqtSignal(int, object, str)  # 请求编号, 缩放后的QImage（失败时为None）, 错误信息
+
+
+class _PreviewTask(QRunnable):
+    """在后台线程中渲染一帧完整质量的预览"""
+
+    def __init__(self, renderer, generation, path, settings, target_size):
+        super().__init__()
+        self.renderer = renderer
+        self.generation = generation
+        self.path = path
+        self.settings = settings
+        self.target_size = target_size
+
+    def run(self):
+        # 已经有更新的请求时不再渲染
+        if self.generation != self.renderer.generation:
+            return
+
+        try:
+            result = (self.render(), "")
+        except Exception as e:
+            result = (None, str(e))
+
+        try:
+            self.renderer.signals.finished.emit(self.generation, *result)
+        except RuntimeError:
+            # 程序退出时信号对象可能已被销毁
+            pass
+
+    def render(self):
+        """渲染并缩放到预览尺寸"""
+        image = self.renderer.cache.get(self.path)
+        if self.renderer.proxy_size is not None:
+            # 留下代理图，下次调整设置时界面线程可以直接渲染快速预览
+            self.renderer.cache.add_proxy(self.path, image, self.renderer.proxy_size)
+        q_image = None
+        if self.renderer.pool is not None:
+            q_image = self.renderer.render_shared(self.path, image, self.settings)
+        if q_image is None:
+            watermarked = watermark_renderer.apply_watermark(image, self.settings)
+            q_image = self.renderer.to_qimage(watermarked)
+        if q_image.isNull():
+            raise ValueError("无法显示预览图片")
+        return q_image.scaled(
+            self.target_size[0], self.target_size[1],
+            Qt.KeepAspectRatio, Qt.SmoothTransformation
+        )
+
+
+class PreviewRenderer(QObject):
+    """后台预览渲染器，只保留最新一次请求的结果"""
+
+    frame_ready = pyqtSignal(int, object, float)  # 请求编号, QImage, 从请求到完成的耗时（毫秒）
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, cache, to_qimage, parent=None, use_processes=True, proxy_size=None):
+        """
+        初始化预览渲染器
+
+        Args:
+            cache: DecodedImageCache 实例，与快速预览共用
+            to_qimage: 把PIL图片转换为QImage的函数
+            parent: 父对象
+            use_processes: 是否在独立的工作进程中合成（通过共享内存传递图片）
+            proxy_size: 快速预览使用的代理图尺寸，渲染时顺便生成代理图，为None时不生成
+        """
+        super().__init__(parent)
+        self.cache = cache
+        self.to_qimage = to_qimage
+        self.proxy_size = proxy_size
+        self.generation = 0
+        self._request_times = {}
+
+        # 预览专用的单进程池，不会排在导出任务后面
+        self.pool = WarmWorkerPool(workers=1) if use_processes else None
+        # 最近一张原图和输出的共享内存，反复调整同一张图片的设置时直接复用
+        self._shared_source = None  # (路径, (修改时间, 文件大小), 图片尺寸, SharedImage)
+        self._shared_output = None
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self.signals = _PreviewSignals(self)
+        self.signals.finished.connect(self._on_finished)
+
+    def request(self, path, settings, target_size):
+        """
+        请求渲染一帧预览，之前尚未完成的请求将被丢弃
+
+        Returns:
+            本次请求的编号
+        """
+        self.generation += 1
+        self._request_times = {self.generation: time.perf_counter()}
+        # 丢弃排队中尚未开始的旧请求
+        self._thread_pool.clear()
+        self._thread_pool.start(_PreviewTask(self, self.generation, path, settings, target_size))
+        return self.generation
+
+    def cancel(self):
+        """丢弃所有未完成的请求"""
+        self.generation += 1
+        self._thread_pool.clear()
+
+    def wait_for_done(self):
+        """等待后台线程结束（用于关闭程序时）"""
+        self._thread_pool.waitForDone()
+
+    def shutdown(self):
+        """释放共享内存并关闭工作进程（用于关闭程序时，需先调用 wait_for_done）"""
+        self._release_shared()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def render_shared(self, path, image, settings):
+        """
+        在工作进程中合成，原图和结果通过共享内存传递（在后台线程中调用）
+
+        Returns:
+            缩放前的QImage，共享内存不可用时返回None（由调用方在本线程中渲染）
+        """
+        try:
+            # 第一次渲染时才导入（依赖NumPy），不拖慢程序启动
+            from shared_images import SharedImage, composite_shared
+        except ImportError:
+            # 没有共享内存支持时以后都在后台线程中直接渲染
+            self.pool = None
+            return None
+
+        try:
+            source = self._source_segment(path, image)
+            output = self._shared_output
+            if output is None or output.size != image.size:
+                if output is not None:
+                    output.release()
+                output = self._shared_output = SharedImage(image.size)
+        except OSError:
+            # 共享内存不足或不可用
+            self._release_shared()
+            return None
+
+        try:
+            future = self.pool.submit(composite_shared, source.descriptor(), output.descriptor(), settings)
+            output.opaque = future.result()
+        except Exception:
+            # 工作进程异常退出时重建进程池，本次在当前线程中渲染
+            self.pool.reset()
+            return None
+
+        # 与 pil_to_qimage 的转换方式保持一致；rgbSwapped 会复制数据，之后不再引用共享内存
+        width, height = output.size
+        if output.opaque:
+            q_image = QImage(output.array().data, width, height, output.stride, QImage.Format_RGBX8888)
+        else:
+            q_image = QImage(output.array().data, width, height, output.stride, QImage.Format_RGBA8888)
+        return q_image.rgbSwapped()
+
+    def _source_segment(self, path, image):
+        """原图所在的共享内存，同一张图片只复制一次"""
+        from shared_images import SharedImage
+
+        # 按文件内容和图片尺寸判断，不用对象id：图片被缓存淘汰后新对象可能得到相同的id
+        key = (path, _file_stamp(path), image.size)
+        if self._shared_source is not None:
+            if self._shared_source[:3] == key:
+                return self._shared_source[3]
+            self._shared_source[3].release()
+            self._shared_source = None
+
+        shared = SharedImage.from_image(image)
+        self._shared_source = key + (shared,)
+        return shared
+
+    def _release_shared(self):
+        """释放缓存的共享内存"""
+        if self._shared_source is not None:
+            self._shared_source[3].release()
+            self._shared_source = None
+        if self._shared_output is not None:
+            self._shared_output.release()
+            self._shared_output = None
+
+    def _on_finished(self, generation, q_image, error):
+        """后台渲染结束，只转发最新请求的结果"""
+        if generation != self.generation:
+            return
+        elapsed_ms = (time.perf_counter() - self._request_times.pop(generation, time.perf_counter())) * 1000
+        if q_image is None:
+            self.failed.emit(generation, error)
+        else:
+            self.frame_ready.emit(generation, q_image, elapsed_ms)
+
+
+class _PrefetchTask(QRunnable):
+    """在后台以低优先级预先解码一张图片"""
+
+    def __init__(self, prefetcher, generation, path, full):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.generation = generation
+        self.path = path
+        self.full = full
+
+    def run(self):
+        QThread.currentThread().setPriority(QThread.LowestPriority)
+        if self.generation != self.prefetcher.generation:
+            return
+
+        cache = self.prefetcher.cache
+        try:
+            cache.get_proxy(self.path, self.prefetcher.proxy_size)
+
+            # 只在预算有空余时预解码原图，不挤掉正在使用的缓存
+            if self.full and not cache.is_cached(self.path):
+                with Image.open(self.path) as probe:
+                    needed = estimate_image_bytes(probe)
+                if needed <= cache.free_bytes():
+                    cache.get(self.path)
+        except Exception:
+            # 预取失败不影响正常预览，选中时会再次报告错误
+            pass
+
+
+class PreviewPrefetcher(QObject):
+    """预取器：空闲时预先解码相邻图片和列表可见区域的图片"""
+
+    def __init__(self, cache, proxy_size, parent=None):
+        """
+        初始化预取器
+
+        Args:
+            cache: DecodedImageCache 实例
+            proxy_size: 快速预览使用的代理图尺寸
+            parent: 父对象
+        """
+        super().__init__(parent)
+        self.cache = cache
+        self.proxy_size = proxy_size
+        self.generation = 0
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+
+    def prefetch(self, neighbour_paths, visible_paths):
+        """
+        安排预取，替换之前尚未执行的预取任务
+
+        Args:
+            neighbour_paths: 当前图片的相邻图片（按优先顺序），预解码代理图和原图
+            visible_paths: 列表中可见的图片，只预解码代理图
+        """
+        self.generation += 1
+        self._thread_pool.clear()
+
+        queued = set()
+        for paths, full in ((neighbour_paths, True), (visible_paths, False)):
+            for path in paths:
+                if path in queued:
+                    continue
+                queued.add(path)
+                if self.cache.is_cached(path, self.proxy_size) and (not full or self.cache.is_cached(path)):
+                    continue
+                self._thread_pool.start(_PrefetchTask(self, self.generation, path, full))
+
+    def cancel(self):
+        """取消所有未执行的预取任务"""
+        self.generation += 1
+        self._thread_pool.clear()
+
+    def wait_for_done(self):
+        """等待后台线程结束（用于关闭程序时）"""
+        self._thread_pool.waitForDone()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+shared_images.py - 通过共享内存在进程之间传递图片
+
+解码后的图片放在 multiprocessing.shared_memory 中，进程之间只传递很小的描述信息
+（名称、形状、模式、行跨度），不需要把几百MB的像素数据序列化后复制。
+工作进程直接在共享内存中读取原图并写入合成结果，界面进程再把结果包装为QImage。
+
+共享内存由创建它的进程负责释放（引用计数归零时 unlink）；
+进程意外退出时，multiprocessing 的资源跟踪进程会清理遗留的共享内存。
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+import watermark_renderer
+from worker_pool import warm_worker
+
+
+class SharedImage:
+    """
+    共享内存中的RGBA图片
+
+    创建者持有一个引用，acquire/release 增减引用计数，归零时释放共享内存。
+    """
+
+    def __init__(self, size, descriptor=None):
+        """
+        创建新的共享内存图片，或按描述信息连接到已有的共享内存
+
+        Args:
+            size: 图片尺寸 (宽, 高)
+            descriptor: 其他进程创建的共享图片的描述信息，为None时新建
+        """
+        self.size = tuple(size)
+        width, height = self.size
+        self.opaque = True if descriptor is None else descriptor["opaque"]
+        self._owner = descriptor is None
+        if descriptor is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, width * height * 4))
+        else:
+            self._shm = shared_memory.SharedMemory(name=descriptor["name"])
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_image(cls, image):
+        """把PIL图片复制到新的共享内存中"""
+        shared = cls(image.size)
+        shared.write(image)
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        """按描述信息连接到其他进程创建的共享图片"""
+        height, width, _ = descriptor["shape"]
+        return cls((width, height), descriptor)
+
+    @property
+    def stride(self):
+        """每行的字节数"""
+        return self.size[0] * 4
+
+    def descriptor(self):
+        """传给其他进程的描述信息"""
+        width, height = self.size
+        return {
+            "name": self._shm.name,
+            "shape": (height, width, 4),
+            "mode": "RGBA",
+            "stride": self.stride,
+            "opaque": self.opaque,
+        }
+
+    def array(self):
+        """共享内存的NumPy视图（不复制），形状为 (高, 宽, 4)"""
+        width, height = self.size
+        return np.ndarray((height, width, 4), dtype=np.uint8, buffer=self._shm.buf)
+
+    def write(self, image):
+        """把图片写入共享内存（没有alpha通道的图片记为不透明）"""
+        if image.size != self.size:
+            raise ValueError("图片尺寸与共享内存不一致")
+        self.opaque = "A" not in image.getbands()
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        self.array()[:] = np.asarray(image)
+
+    def to_pil(self):
+        """
+        以共享内存为底层数据的PIL图片（不复制）
+
+        返回的图片不能修改；使用完后要先释放它，才能关闭共享内存。
+        """
+        image = Image.frombuffer("RGBA", self.size, self._shm.buf, "raw", "RGBA", 0, 1)
+        # 不透明图片按RGB合成，结果与直接使用解码后的图片一致
+        return image.convert("RGB") if self.opaque else image
+
+    def acquire(self):
+        """增加一个引用"""
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        """减少一个引用，归零时关闭（创建者还会删除）共享内存"""
+        with self._lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def composite_shared(source_descriptor, output_descriptor, settings):
+    """
+    在工作进程中读取共享内存中的原图，添加水印后写入输出共享内存
+
+    Returns:
+        输出图片是否不透明
+    """
+    warm_worker(settings)
+    source = SharedImage.attach(source_descriptor)
+    output = SharedImage.attach(output_descriptor)
+    try:
+        image = source.to_pil()
+        result = watermark_renderer.apply_watermark(image, settings)
+        # 释放对共享内存的引用后才能关闭
+        del image
+        output.write(result)
+        return output.opaque
+    finally:
+        source.release()
+        output.release()
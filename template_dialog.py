@@ -81,25 +81,15 @@ class TemplateDialog(QDialog):
     
     def load_existing_templates(self):
         """加载现有模板列表"""
-        # 从父窗口获取设置对象
-        if self.parent() and hasattr(self.parent(), 'settings'):
-            settings = self.parent().settings
-            
-            # 获取所有模板名称
-            template_names = set()
-            for key in settings.allKeys():
-                if key.startswith("templates/"):
-                    parts = key.split("/")
-                    if len(parts) >= 2:
-                        template_names.add(parts[1])
+        # 从父窗口获取模板存储
+        if self.parent() and hasattr(self.parent(), 'template_store'):
+            template_names = self.parent().template_store.names()
             
             # 添加到列表
             if self.dialog_type == "save":
-                for name in sorted(template_names):
-                    self.existing_templates.addItem(name)
+                self.existing_templates.addItems(template_names)
             else:
-                for name in sorted(template_names):
-                    self.template_list.addItem(name)
+                self.template_list.addItems(template_names)
     
     def on_template_selected(self, item):
         """当选择现有模板时，将其名称填充到输入框"""
@@ -127,9 +117,8 @@ class TemplateDialog(QDialog):
                 return
             
             # 检查是否与现有模板重名
-            if self.parent() and hasattr(self.parent(), 'settings'):
-                settings = self.parent().settings
-                if settings.contains(f"templates/{template_name}/type"):
+            if self.parent() and hasattr(self.parent(), 'template_store'):
+                if self.parent().template_store.contains(template_name):
                     from PyQt5.QtWidgets import QMessageBox
                     reply = QMessageBox.question(
                         self, "确认覆盖", 
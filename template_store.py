@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+template_store.py - 模板存储
+
+所有模板和上次使用的设置保存在一个带版本号的JSON文件中，
+读取时在内存中建立索引，修改后延迟合并写入，写入时先写临时文件再原子替换。
+写入失败（目录只读、磁盘已满、文件被占用）时通过 save_failed 信号报告，
+未写入的修改保留在内存中，下次修改或关闭时重试。
+首次使用时会从旧版INI配置的 templates/* 和 last_settings/* 键迁移数据。
+"""
+
+import os
+import json
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+# 模板字段及其默认值（默认值的类型也用于迁移旧INI数据时的类型转换）
+TEMPLATE_DEFAULTS = {
+    "type": "text",
+    "text": "水印文字",
+    "image_path": "",
+    "opacity": 50,
+    "position_x": 0.5,
+    "position_y": 0.5,
+    "auto_position": False,
+    "size": 100,
+    "rotation": 0,
+    "resample": "bicubic",
+    "color": "#FFFFFF",
+    "adaptive_color": False,
+    "font_family": "SimHei",
+    "font_size": 36,
+    "font_bold": False,
+    "font_italic": False,
+}
+
+
+def _coerce(value, default):
+    """把旧INI中读出的值（通常是字符串）转换为默认值的类型"""
+    try:
+        if isinstance(default, bool):
+            if isinstance(value, str):
+                return value.lower() in ("true", "1", "yes")
+            return bool(value)
+        if isinstance(default, int):
+            return int(float(value))
+        if isinstance(default, float):
+            return float(value)
+        return str(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _valid_store_data(data):
+    """检查从JSON文件读出的数据结构：顶层、templates 和每条模板记录都必须是对象"""
+    if not isinstance(data, dict):
+        return False
+    templates = data.get("templates")
+    if templates is None:
+        templates = {}
+    if not isinstance(templates, dict) or not all(isinstance(record, dict) for record in templates.values()):
+        return False
+    return isinstance(data.get("last_settings"), (dict, type(None)))
+
+
+def read_templates(path):
+    """
+    只读地加载模板文件（不需要Qt事件循环，供命令行和服务进程使用）
+
+    Returns:
+        {模板名称: 模板记录}，文件不存在或损坏时返回空字典
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not _valid_store_data(data):
+        return {}
+    return dict(data.get("templates") or {})
+
+
+def template_to_settings(record):
+    """把模板记录转换为渲染模块使用的设置字典，缺少的字段使用默认值"""
+    template = dict(TEMPLATE_DEFAULTS, **record)
+    for field, default in TEMPLATE_DEFAULTS.items():
+        template[field] = _coerce(template[field], default)
+
+    color = template["color"].lstrip("#")
+    try:
+        rgb = (int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16))
+    except ValueError:
+        rgb = (255, 255, 255)
+
+    return {
+        "type": template["type"],
+        "text": template["text"],
+        "image_path": template["image_path"],
+        "opacity": template["opacity"],
+        "position": (template["position_x"], template["position_y"]),
+        "auto_position": template["auto_position"],
+        "size": template["size"],
+        "rotation": template["rotation"],
+        "resample": template["resample"],
+        "color": rgb,
+        "adaptive_color": template["adaptive_color"],
+        "font_family": template["font_family"],
+        "font_size": template["font_size"],
+        "font_bold": template["font_bold"],
+        "font_italic": template["font_italic"],
+    }
+
+
+class TemplateStore(QObject):
+    """基于单个JSON文件的模板存储"""
+
+    SCHEMA_VERSION = 1
+
+    save_failed = pyqtSignal(str)  # 错误信息
+
+    def __init__(self, path, legacy_settings=None, delay_ms=500, parent=None):
+        """
+        初始化模板存储
+
+        Args:
+            path: JSON文件路径
+            legacy_settings: 旧版QSettings对象，JSON文件不存在时从中迁移
+            delay_ms: 修改后延迟多久写入磁盘（毫秒），期间的多次修改合并为一次写入
+            parent: 父对象
+        """
+        super().__init__(parent)
+        self.path = path
+        self._templates = {}
+        self._last_settings = None
+        self._sorted_names = None
+        self._dirty = False  # 是否有尚未写入磁盘的修改
+
+        # 延迟写入定时器（槽函数中不能抛出异常，写入错误在 flush 中处理）
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(delay_ms)
+        self._save_timer.timeout.connect(self.flush)
+
+        if os.path.exists(self.path):
+            self._load()
+        elif legacy_settings is not None:
+            self._migrate(legacy_settings)
+
+    def names(self):
+        """按名称排序的模板列表"""
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._templates)
+        return list(self._sorted_names)
+
+    def contains(self, name):
+        """是否存在指定名称的模板"""
+        return name in self._templates
+
+    def get(self, name):
+        """获取模板内容（缺少的字段用默认值补全），不存在时返回None"""
+        record = self._templates.get(name)
+        if record is None:
+            return None
+        return dict(TEMPLATE_DEFAULTS, **record)
+
+    def save(self, name, record):
+        """保存或覆盖模板"""
+        if name not in self._templates:
+            self._sorted_names = None
+        self._templates[name] = dict(record)
+        self._schedule_save()
+
+    def delete(self, name):
+        """删除模板"""
+        if self._templates.pop(name, None) is not None:
+            self._sorted_names = None
+            self._schedule_save()
+
+    def last_settings(self):
+        """获取上次关闭时的设置，没有时返回None"""
+        if self._last_settings is None:
+            return None
+        return dict(TEMPLATE_DEFAULTS, **self._last_settings)
+
+    def set_last_settings(self, record):
+        """记录当前设置，供下次启动时恢复"""
+        self._last_settings = dict(record)
+        self._schedule_save()
+
+    @property
+    def dirty(self):
+        """是否有尚未写入磁盘的修改"""
+        return self._dirty
+
+    def flush(self):
+        """
+        立即把未写入的修改保存到磁盘
+
+        写入失败时发出 save_failed 信号，修改保留在内存中等待下次重试。
+
+        Returns:
+            是否已全部写入
+        """
+        self._save_timer.stop()
+        if not self._dirty:
+            return True
+        try:
+            self._write()
+        except OSError as e:
+            self.save_failed.emit(f"无法保存模板文件 {self.path}: {e}")
+            return False
+        self._dirty = False
+        return True
+
+    def _write(self):
+        """写入JSON文件"""
+        data = {
+            "schema_version": self.SCHEMA_VERSION,
+            "templates": self._templates,
+            "last_settings": self._last_settings,
+        }
+
+        # 先写临时文件再替换，避免写到一半时损坏原文件
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _schedule_save(self):
+        """安排一次延迟写入（已安排时重新计时）"""
+        self._dirty = True
+        self._save_timer.start()
+
+    def _load(self):
+        """从JSON文件读取所有模板"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+            if not os.path.exists(self.path):
+                return
+
+        if not _valid_store_data(data):
+            # 文件损坏（或是合法JSON但结构不对）时保留一份备份，从空存储开始
+            try:
+                os.replace(self.path, self.path + ".bak")
+            except OSError:
+                pass
+            return
+
+        self._templates = dict(data.get("templates") or {})
+        self._last_settings = data.get("last_settings")
+
+    def _migrate(self, settings):
+        """从旧版INI配置迁移模板和上次设置，迁移后删除INI中的旧键"""
+        for key in settings.allKeys():
+            parts = key.split("/")
+            if parts[0] == "templates" and len(parts) == 3:
+                name, field = parts[1], parts[2]
+                if field in TEMPLATE_DEFAULTS:
+                    record = self._templates.setdefault(name, {})
+                    record[field] = _coerce(settings.value(key), TEMPLATE_DEFAULTS[field])
+            elif parts[0] == "last_settings" and len(parts) == 2:
+                field = parts[1]
+                if field in TEMPLATE_DEFAULTS:
+                    if self._last_settings is None:
+                        self._last_settings = {}
+                    self._last_settings[field] = _coerce(settings.value(key), TEMPLATE_DEFAULTS[field])
+
+        if self._templates or self._last_settings is not None:
+            self._dirty = True
+            # 写入失败时保留INI中的旧键，下次启动还能再迁移
+            if not self.flush():
+                return
+            settings.remove("templates")
+            settings.remove("last_settings")
+            settings.sync()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+tests - 单元测试
+
+运行: python -m unittest discover -s tests -t .
+"""
+
+import os
+
+
+def qt_app():
+    """所有测试共用的Qt应用程序对象（没有显示器时使用 offscreen 平台）"""
+    from PyQt5.QtWidgets import QApplication
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_export_jobs.py - 输出路径分配测试（同名冲突、重建文件夹结构、大小写）
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import export_jobs
+from export_jobs import assign_output_paths, output_name_key
+
+
+ORIGINAL = {"type": "original", "value": ""}
+
+
+def _paths(*parts):
+    return [os.path.join(os.sep, "photos", *part.split("/")) for part in parts]
+
+
+class AssignOutputPathsTest(unittest.TestCase):
+    export_dir = os.path.join(os.sep, "out")
+
+    def names(self, output_paths):
+        return {os.path.relpath(path, os.path.join(os.sep, "photos")): os.path.relpath(output, self.export_dir)
+                for path, output in output_paths.items()}
+
+    def test_unique_names_are_kept(self):
+        output_paths = assign_output_paths(_paths("a/1.jpg", "a/2.png"), self.export_dir, "jpeg", ORIGINAL)
+        self.assertEqual(self.names(output_paths), {
+            os.path.join("a", "1.jpg"): "1.jpeg",
+            os.path.join("a", "2.png"): "2.jpeg",
+        })
+
+    def test_collisions_are_numbered_in_source_order(self):
+        # 提交顺序不影响结果：按源路径排序，第一张保留原名
+        images = _paths("c/img.jpg", "a/img.jpg", "b/img.png")
+        output_paths = assign_output_paths(images, self.export_dir, "png", ORIGINAL)
+        self.assertEqual(self.names(output_paths), {
+            os.path.join("a", "img.jpg"): "img.png",
+            os.path.join("b", "img.png"): "img_2.png",
+            os.path.join("c", "img.jpg"): "img_3.png",
+        })
+
+    def test_numbered_name_skips_names_taken_by_other_images(self):
+        images = _paths("a/img.jpg", "b/img.jpg", "a/img_2.jpg")
+        output_paths = assign_output_paths(images, self.export_dir, "jpeg", ORIGINAL)
+        self.assertEqual(self.names(output_paths), {
+            os.path.join("a", "img.jpg"): "img.jpeg",
+            os.path.join("a", "img_2.jpg"): "img_2.jpeg",
+            os.path.join("b", "img.jpg"): "img_3.jpeg",
+        })
+        self.assertEqual(len(set(output_paths.values())), 3)
+
+    def test_naming_rule_is_applied(self):
+        images = _paths("a/img.jpg", "b/img.jpg")
+        output_paths = assign_output_paths(images, self.export_dir, "jpeg", {"type": "suffix", "value": "_wm"})
+        self.assertEqual(sorted(self.names(output_paths).values()), ["img_wm.jpeg", "img_wm_2.jpeg"])
+
+    def test_source_structure_avoids_collisions(self):
+        images = _paths("a/img.jpg", "b/img.jpg")
+        source_root = os.path.join(os.sep, "photos")
+        output_paths = assign_output_paths(images, self.export_dir, "jpeg", ORIGINAL, source_root)
+        self.assertEqual(self.names(output_paths), {
+            os.path.join("a", "img.jpg"): os.path.join("a", "img.jpeg"),
+            os.path.join("b", "img.jpg"): os.path.join("b", "img.jpeg"),
+        })
+
+    def test_case_only_differences_collide_on_case_insensitive_filesystems(self):
+        images = _paths("a/IMG.jpg", "b/img.jpg")
+        with mock.patch.object(export_jobs, "CASE_INSENSITIVE_PATHS", True):
+            output_paths = assign_output_paths(images, self.export_dir, "jpeg", ORIGINAL)
+            self.assertEqual(output_name_key("IMG.jpeg"), output_name_key("img.jpeg"))
+        self.assertEqual(self.names(output_paths), {
+            os.path.join("a", "IMG.jpg"): "IMG.jpeg",
+            os.path.join("b", "img.jpg"): "IMG_2.jpeg",
+        })
+
+    def test_case_only_differences_are_distinct_on_case_sensitive_filesystems(self):
+        images = _paths("a/IMG.jpg", "b/img.jpg")
+        with mock.patch.object(export_jobs, "CASE_INSENSITIVE_PATHS", False), \
+                mock.patch("os.path.normcase", lambda name: name):
+            output_paths = assign_output_paths(images, self.export_dir, "jpeg", ORIGINAL)
+        self.assertEqual(sorted(self.names(output_paths).values()), ["IMG.jpeg", "img.jpeg"])
+
+
+class ExistingOutputFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+
+    def touch(self, *parts):
+        path = os.path.join(self.export_dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+
+    def names(self, output_paths):
+        return sorted(os.path.relpath(path, self.export_dir) for path in output_paths.values())
+
+    def test_existing_files_are_not_overwritten(self):
+        self.touch("img.jpeg")
+        self.touch("img_2.jpeg")
+        images = _paths("a/img.jpg", "b/img.png")
+        output_paths = assign_output_paths(images, self.export_dir, "jpeg", ORIGINAL, skip_existing=True)
+        self.assertEqual(self.names(output_paths), ["img_3.jpeg", "img_4.jpeg"])
+
+    def test_existing_files_are_ignored_by_default(self):
+        self.touch("img.jpeg")
+        output_paths = assign_output_paths(_paths("a/img.jpg"), self.export_dir, "jpeg", ORIGINAL)
+        self.assertEqual(self.names(output_paths), ["img.jpeg"])
+
+    def test_rerun_gets_new_names(self):
+        images = _paths("a/1.jpg", "a/2.jpg")
+        for output_path in assign_output_paths(images, self.export_dir, "png", ORIGINAL, skip_existing=True).values():
+            open(output_path, "wb").close()
+
+        output_paths = assign_output_paths(images, self.export_dir, "png", ORIGINAL, skip_existing=True)
+        self.assertEqual(self.names(output_paths), ["1_2.png", "2_2.png"])
+
+    def test_existing_files_in_source_structure(self):
+        self.touch("a", "img.jpeg")
+        source_root = os.path.join(os.sep, "photos")
+        output_paths = assign_output_paths(
+            _paths("a/img.jpg", "b/img.jpg"), self.export_dir, "jpeg", ORIGINAL, source_root, skip_existing=True
+        )
+        self.assertEqual(self.names(output_paths), [os.path.join("a", "img_2.jpeg"), os.path.join("b", "img.jpeg")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_export_queue.py - 导出队列测试（连续任务和监视文件夹的多批导出不覆盖之前的输出）
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QTimer
+from PIL import Image
+
+from export_jobs import ExportJob, ExportQueue, JOB_CANCELLED, JOB_DONE
+from template_store import template_to_settings
+from tests import qt_app
+
+
+def setUpModule():
+    global _app
+    _app = qt_app()
+
+
+class _ThreadPool:
+    """与 WarmWorkerPool 接口相同、在线程中执行的池（测试中不启动工作进程）"""
+
+    workers = 2
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def warm(self, settings):
+        pass
+
+    def submit(self, fn, *args):
+        return self._executor.submit(fn, *args)
+
+    def reset(self):
+        pass
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+WATCH_OPTIONS = {
+    "format": "png",
+    "naming_rule": {"type": "original", "value": ""},
+    "quality": 100,
+    "resize_option": None,
+    "source_root": None,
+    "watch": True,
+}
+
+
+class ExportQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.export_dir = os.path.join(self.work_dir, "out")
+        os.mkdir(self.export_dir)
+        self.pool = _ThreadPool()
+        self.queue = ExportQueue(pool=self.pool)
+        self.settings = template_to_settings({"text": "wm", "font_size": 8})
+
+    def tearDown(self):
+        self.queue.worker.wait()
+        self.pool.shutdown()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def source(self, folder, name, color):
+        path = os.path.join(self.work_dir, folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new("RGB", (32, 24), color).save(path)
+        return path
+
+    def run_jobs(self, jobs):
+        """排队执行所有任务，等待全部完成"""
+        finished = []
+
+        def on_finished(job):
+            finished.append(job)
+            if len(finished) == len(jobs):
+                _app.quit()
+
+        self.queue.job_finished.connect(on_finished)
+        for job in jobs:
+            self.queue.add_job(job)
+        QTimer.singleShot(30000, _app.quit)
+        _app.exec_()
+        self.assertEqual(len(finished), len(jobs))
+        for job in finished:
+            self.assertEqual(job.errors, [])
+
+    def test_watch_batches_keep_earlier_outputs(self):
+        first = self.source("in", "img.bmp", "red")
+        self.run_jobs([ExportJob([first], self.settings, {}, self.export_dir, WATCH_OPTIONS)])
+
+        # 后一批中同名的新文件和重新保存的文件都得到新的文件名
+        second = self.source("in", "img.png", "green")
+        self.source("in", "img.bmp", "blue")
+        self.run_jobs([
+            ExportJob([second], self.settings, {}, self.export_dir, WATCH_OPTIONS),
+            ExportJob([first], self.settings, {}, self.export_dir, WATCH_OPTIONS),
+        ])
+
+        self.assertEqual(sorted(os.listdir(self.export_dir)), ["img.png", "img_2.png", "img_3.png"])
+        colors = [Image.open(os.path.join(self.export_dir, name)).convert("RGB").getpixel((0, 0))
+                  for name in ("img.png", "img_2.png", "img_3.png")]
+        self.assertEqual(colors, [(255, 0, 0), (0, 128, 0), (0, 0, 255)])
+
+    def test_cancel_while_paused_keeps_queue_paused(self):
+        paths = [self.source("in", f"{i}.png", "red") for i in range(3)]
+        first = ExportJob(paths, self.settings, {}, self.export_dir, WATCH_OPTIONS)
+        second = ExportJob(paths, self.settings, {}, self.export_dir, WATCH_OPTIONS)
+        finished = []
+
+        def on_started(job):
+            if job is first:
+                self.queue.cancel_current()
+
+        def on_finished(job):
+            finished.append(job)
+            _app.quit()
+
+        self.queue.job_started.connect(on_started)
+        self.queue.job_finished.connect(on_finished)
+        self.queue.pause()
+        self.queue.add_job(first)
+        self.queue.add_job(second)
+        QTimer.singleShot(30000, _app.quit)
+        _app.exec_()
+
+        self.assertEqual(finished, [first])
+        self.assertEqual(first.status, JOB_CANCELLED)
+        self.assertEqual(first.done_count, 0)
+        # 取消不解除暂停，后一个任务等继续后才处理图片
+        self.assertTrue(self.queue.is_paused())
+        self.assertEqual(second.done_count, 0)
+
+        self.queue.resume()
+        _app.exec_()
+        self.assertEqual(finished, [first, second])
+        self.assertEqual(second.status, JOB_DONE)
+        self.assertEqual(second.done_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_glyph_cache.py - 字形缓存测试（逐字拼接的结果与 ImageDraw.text 逐像素一致）
+"""
+
+import os
+import glob
+import unittest
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from watermark_renderer import GlyphCache
+
+
+def _find_font():
+    """找一个系统中的TrueType字体文件，找不到时返回None"""
+    patterns = [
+        "/usr/share/fonts/**/DejaVuSans.ttf",
+        "/usr/share/fonts/**/*.ttf",
+        "/System/Library/Fonts/*.ttf",
+        "/Library/Fonts/*.ttf",
+        os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts", "arial.ttf"),
+    ]
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if matches:
+            return matches[0]
+    return None
+
+
+FONT_PATH = _find_font()
+
+TEXTS = ["AVATAR Wave", "Hello, world!", "T. Ty 1/2", "x"]
+
+
+@unittest.skipIf(FONT_PATH is None, "没有找到TrueType字体")
+class GlyphCacheTest(unittest.TestCase):
+    def font(self, size):
+        return ImageFont.truetype(FONT_PATH, size, layout_engine=ImageFont.Layout.BASIC)
+
+    def reference(self, font, text, size, origin):
+        """整行栅格化的结果"""
+        mask = Image.new("L", size, 0)
+        ImageDraw.Draw(mask).text(origin, text, font=font, fill=255)
+        return mask
+
+    def test_compose_matches_draw_text(self):
+        cache = GlyphCache()
+        for size in (12, 36, 97):
+            font = self.font(size)
+            for text in TEXTS:
+                with self.subTest(size=size, text=text):
+                    text_layout = cache.layout(font, text)
+                    self.assertEqual(text_layout[1], font.getbbox(text))
+
+                    mask, (x0, y0) = cache.compose(text_layout)
+                    expected = self.reference(font, text, mask.size, (-x0, -y0))
+                    self.assertIsNone(ImageChops.difference(mask, expected).getbbox())
+
+    def test_cached_glyphs_give_same_result(self):
+        cache = GlyphCache()
+        font = self.font(40)
+        first, _ = cache.compose(cache.layout(font, "Wave"))
+        # 第二次只用缓存中的字形拼接
+        second, _ = cache.compose(cache.layout(font, "Wave"))
+        self.assertEqual(first.tobytes(), second.tobytes())
+
+    def test_clip_matches_crop(self):
+        cache = GlyphCache()
+        font = self.font(48)
+        text_layout = cache.layout(font, "Hello, world!")
+        full, (x0, y0) = cache.compose(text_layout)
+
+        clip = (x0 + 30, y0 + 5, x0 + 120, y0 + 30)
+        clipped, (left, top) = cache.compose(text_layout, clip)
+        self.assertEqual((left, top), clip[:2])
+        expected = full.crop((clip[0] - x0, clip[1] - y0, clip[2] - x0, clip[3] - y0))
+        self.assertEqual(clipped.tobytes(), expected.tobytes())
+
+    def test_clip_outside_text_is_empty(self):
+        cache = GlyphCache()
+        text_layout = cache.layout(self.font(24), "abc")
+        mask, _ = cache.compose(text_layout, (1000, 1000, 1100, 1100))
+        self.assertIsNone(mask)
+
+    def test_unsupported_text_falls_back(self):
+        cache = GlyphCache()
+        font = self.font(24)
+        self.assertIsNone(cache.layout(font, ""))
+        self.assertIsNone(cache.layout(font, "two\nlines"))
+        self.assertIsNone(cache.layout(ImageFont.load_default_imagefont(), "abc"))
+
+    def test_limit_evicts_old_glyphs(self):
+        cache = GlyphCache(limit_bytes=2000)
+        font = self.font(30)
+        cache.layout(font, "ABCDEFGHIJKLMNOP")
+        self.assertLessEqual(cache._bytes, 2000)
+        self.assertEqual(cache._bytes, sum(
+            glyph.width * glyph.height for glyph, _, _ in cache._glyphs.values() if glyph is not None
+        ))
+
+
+if __name__ == "__main__":
+    unittest.main()
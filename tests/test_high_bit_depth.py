@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_high_bit_depth.py - 16位合成测试（混合精度、重叠区域、灰度和alpha通道）
+"""
+
+import io
+import unittest
+
+import numpy as np
+from PIL import Image
+
+import high_bit_depth
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def _sprite(size, rgba):
+    return Image.new("RGBA", size, rgba)
+
+
+class CompositeTest(unittest.TestCase):
+    def test_none_sprite_leaves_array_unchanged(self):
+        array = np.full((4, 4, 3), 1234, dtype=np.uint16)
+        self.assertIs(high_bit_depth.composite(array, None, (0, 0)), array)
+        self.assertTrue((array == 1234).all())
+
+    def test_opaque_sprite_replaces_pixels(self):
+        array = np.full((6, 8, 3), 1000, dtype=np.uint16)
+        high_bit_depth.composite(array, _sprite((3, 2), (255, 128, 0, 255)), (2, 1))
+
+        self.assertEqual(array[1, 2].tolist(), [65535, 128 * 257, 0])
+        self.assertEqual(array[2, 4].tolist(), [65535, 128 * 257, 0])
+        # 水印以外的像素保持原值（包括低8位）
+        self.assertEqual(array[0, 0].tolist(), [1000, 1000, 1000])
+        self.assertEqual(array[3, 2].tolist(), [1000, 1000, 1000])
+        self.assertEqual(array[1, 5].tolist(), [1000, 1000, 1000])
+
+    def test_transparent_sprite_keeps_low_bits(self):
+        values = np.arange(4 * 4 * 3, dtype=np.uint16).reshape(4, 4, 3) * 997 + 1
+        array = values.copy()
+        high_bit_depth.composite(array, _sprite((4, 4), (255, 255, 255, 0)), (0, 0))
+        self.assertTrue((array == values).all())
+
+    def test_partial_alpha_blends_at_16_bit_precision(self):
+        array = np.full((2, 2, 3), 40001, dtype=np.uint16)
+        alpha = 100
+        high_bit_depth.composite(array, _sprite((2, 2), (10, 200, 255, alpha)), (0, 0))
+
+        a = alpha / 255
+        expected = [round(40001 * (1 - a) + value * 257 * a) for value in (10, 200, 255)]
+        for actual, target in zip(array[0, 0].tolist(), expected):
+            self.assertLessEqual(abs(actual - target), 1)
+
+    def test_matches_8_bit_compositing(self):
+        rng = np.random.default_rng(0)
+        base = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+        sprite = Image.fromarray(rng.integers(0, 256, (16, 16, 4), dtype=np.uint8), "RGBA")
+
+        array = base.astype(np.uint16) * 257
+        high_bit_depth.composite(array, sprite, (0, 0))
+        image = Image.fromarray(base).convert("RGBA")
+        image.paste(sprite, (0, 0), sprite)
+
+        expected = np.asarray(image.convert("RGB")).astype(np.int32)
+        self.assertLessEqual(np.abs(high_bit_depth.to_8bit(array).astype(np.int32) - expected).max(), 1)
+
+    def test_sprite_partly_outside_image(self):
+        array = np.zeros((4, 4, 3), dtype=np.uint16)
+        high_bit_depth.composite(array, _sprite((3, 3), (255, 255, 255, 255)), (-1, 2))
+
+        changed = (array[..., 0] == 65535)
+        self.assertEqual(np.argwhere(changed).tolist(), [[2, 0], [2, 1], [3, 0], [3, 1]])
+
+    def test_sprite_completely_outside_image(self):
+        array = np.full((4, 4), 7, dtype=np.uint16)
+        high_bit_depth.composite(array, _sprite((3, 3), (255, 255, 255, 255)), (10, -10))
+        self.assertTrue((array == 7).all())
+
+    def test_gray_array_uses_luminance(self):
+        array = np.zeros((2, 2), dtype=np.uint16)
+        high_bit_depth.composite(array, _sprite((2, 2), (255, 0, 0, 255)), (0, 0))
+        luminance = Image.new("RGB", (1, 1), (255, 0, 0)).convert("L").getpixel((0, 0))
+        self.assertTrue((array == luminance * 257).all())
+
+    def test_alpha_channel_blends_like_paste(self):
+        array = np.zeros((1, 1, 4), dtype=np.uint16)
+        array[..., 3] = 20000
+        high_bit_depth.composite(array, _sprite((1, 1), (0, 0, 0, 128)), (0, 0))
+
+        a = 128 / 255
+        self.assertLessEqual(abs(int(array[0, 0, 3]) - round(20000 * (1 - a) + 128 * 257 * a)), 1)
+
+
+class ConversionTest(unittest.TestCase):
+    def test_gray_16_bit_png_round_trip(self):
+        array = (np.arange(64, dtype=np.uint16).reshape(8, 8) * 1021) + 3
+        data = high_bit_depth.encode(array, "png")
+
+        image = Image.open(io.BytesIO(data))
+        self.assertTrue(high_bit_depth.is_high_bit_depth(image))
+        self.assertTrue((high_bit_depth.decode(image, data) == array).all())
+
+    def test_encode_rejects_8_bit_formats(self):
+        with self.assertRaises(ValueError):
+            high_bit_depth.encode(np.zeros((2, 2), dtype=np.uint16), "jpeg")
+
+    def test_to_8bit_image_downsamples_gray(self):
+        array = np.full((40, 20), 0x1234, dtype=np.uint16)
+        image = high_bit_depth.to_8bit_image(Image.fromarray(array), max_size=10)
+        self.assertEqual(image.mode, "L")
+        self.assertEqual(image.size, (5, 10))
+        self.assertEqual(image.getpixel((0, 0)), 0x12)
+
+    @unittest.skipIf(cv2 is None, "没有安装 OpenCV")
+    def test_rgb_16_bit_tiff_round_trip(self):
+        array = np.stack([
+            np.arange(16, dtype=np.uint16).reshape(4, 4) * 4001,
+            np.full((4, 4), 258, dtype=np.uint16),
+            np.full((4, 4), 65535, dtype=np.uint16),
+        ], axis=2)
+        data = high_bit_depth.encode(array, "tiff")
+
+        image = Image.open(io.BytesIO(data))
+        self.assertTrue(high_bit_depth.is_high_bit_depth(image))
+        self.assertTrue((high_bit_depth.decode(image, data) == array).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
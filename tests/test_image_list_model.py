@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_image_list_model.py - 图片列表模型测试（紧凑路径存储、按连续区段删除行）
+"""
+
+import unittest
+
+from PyQt5.QtCore import QItemSelectionModel
+
+from image_list_model import ImageListModel, ImagePathStore, REMOVE_RANGES_LIMIT
+from tests import qt_app
+
+
+def setUpModule():
+    global _app
+    _app = qt_app()
+
+
+PATHS = ["/photos/a.jpg", "/照片/二.png", "/photos/\udcff.tif", "/photos/c.jpg", "/photos/d.jpg"]
+
+
+class ImagePathStoreTest(unittest.TestCase):
+    def test_extend_skips_duplicates(self):
+        store = ImagePathStore()
+        self.assertEqual(store.extend(PATHS), PATHS)
+        self.assertEqual(store.extend(["/photos/a.jpg", "/photos/e.jpg", "/photos/e.jpg"]), ["/photos/e.jpg"])
+        self.assertEqual(list(store), PATHS + ["/photos/e.jpg"])
+
+    def test_indexing_and_membership(self):
+        store = ImagePathStore()
+        store.extend(PATHS)
+        self.assertEqual(len(store), len(PATHS))
+        self.assertEqual(store[1], "/照片/二.png")
+        # 无法按UTF-8解码的文件名原样保留
+        self.assertEqual(store[2], "/photos/\udcff.tif")
+        self.assertEqual(store[-1], "/photos/d.jpg")
+        self.assertEqual(store[1:3], PATHS[1:3])
+        self.assertIn("/photos/c.jpg", store)
+        self.assertNotIn("/photos/x.jpg", store)
+        with self.assertRaises(IndexError):
+            store[len(PATHS)]
+
+    def test_remove_rows(self):
+        store = ImagePathStore()
+        store.extend(PATHS)
+        self.assertEqual(store.remove_rows([3, 0, 3, 99]), [PATHS[0], PATHS[3]])
+        self.assertEqual(list(store), [PATHS[1], PATHS[2], PATHS[4]])
+        self.assertNotIn(PATHS[0], store)
+        # 删除后可以重新添加
+        self.assertEqual(store.extend([PATHS[0]]), [PATHS[0]])
+
+    def test_remove_range(self):
+        store = ImagePathStore()
+        store.extend(PATHS)
+        self.assertEqual(store.remove_range(1, 2), PATHS[1:3])
+        self.assertEqual(list(store), [PATHS[0], PATHS[3], PATHS[4]])
+
+    def test_compaction_keeps_contents(self):
+        store = ImagePathStore()
+        paths = [f"/photos/{i:05d}.jpg" for i in range(1000)]
+        store.extend(paths)
+        store.remove_range(0, 699)
+        # 废弃的字节超过一半时已经压缩
+        self.assertLess(len(store._data), 400 * len(paths[0].encode()))
+        self.assertEqual(list(store), paths[700:])
+        store.extend(["/photos/new.jpg"])
+        self.assertEqual(store[-1], "/photos/new.jpg")
+
+
+class ImageListModelRemoveTest(unittest.TestCase):
+    def setUp(self):
+        self.model = ImageListModel(ImagePathStore())
+        self.model.add_paths([f"/photos/{i}.jpg" for i in range(10)])
+        self.removed_ranges = []
+        self.resets = 0
+        self.model.rowsRemoved.connect(lambda parent, first, last: self.removed_ranges.append((first, last)))
+        self.model.modelReset.connect(self.count_reset)
+
+    def count_reset(self):
+        self.resets += 1
+
+    def test_contiguous_ranges_removed_from_the_end(self):
+        removed = self.model.remove_rows([7, 1, 2, 8, 5, 2])
+        self.assertEqual(removed, ["/photos/1.jpg", "/photos/2.jpg", "/photos/5.jpg", "/photos/7.jpg", "/photos/8.jpg"])
+        self.assertEqual(self.removed_ranges, [(7, 8), (5, 5), (1, 2)])
+        self.assertEqual(self.resets, 0)
+        self.assertEqual(list(self.model.store), ["/photos/0.jpg", "/photos/3.jpg", "/photos/4.jpg",
+                                                  "/photos/6.jpg", "/photos/9.jpg"])
+
+    def test_selection_of_remaining_rows_is_kept(self):
+        selection = QItemSelectionModel(self.model)
+        selection.select(self.model.index(6), QItemSelectionModel.Select)
+        selection.setCurrentIndex(self.model.index(9), QItemSelectionModel.NoUpdate)
+
+        self.model.remove_rows([0, 1, 4])
+        self.assertEqual([index.row() for index in selection.selectedIndexes()], [3])
+        self.assertEqual(selection.currentIndex().row(), 6)
+
+    def test_fragmented_removal_resets_model(self):
+        model = ImageListModel(ImagePathStore())
+        model.add_paths([f"/photos/{i}.jpg" for i in range((REMOVE_RANGES_LIMIT + 1) * 2)])
+        resets = []
+        model.modelReset.connect(lambda: resets.append(True))
+
+        removed = model.remove_rows(range(0, len(model.store), 2))
+        self.assertEqual(len(removed), REMOVE_RANGES_LIMIT + 1)
+        self.assertEqual(resets, [True])
+        self.assertEqual(model.rowCount(), REMOVE_RANGES_LIMIT + 1)
+        self.assertEqual(model.store[0], "/photos/1.jpg")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_memory_governor.py - 内存预算测试（淘汰顺序、临时占用、峰值统计）
+"""
+
+import unittest
+
+from memory_governor import MemoryGovernor, estimate_export_bytes, EXPORT_WORKING_COPIES, UNKNOWN_EXPORT_BYTES
+
+
+class FakeCache:
+    """按登记的字节数占用内存、按要求淘汰的缓存"""
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.requests = []
+
+    def usage(self):
+        return self.nbytes
+
+    def shrink(self, excess):
+        self.requests.append(excess)
+        freed = min(excess, self.nbytes)
+        self.nbytes -= freed
+        return freed
+
+
+class MemoryGovernorTest(unittest.TestCase):
+    def test_estimate_export_bytes(self):
+        self.assertEqual(estimate_export_bytes((100, 50)), 100 * 50 * 4 * EXPORT_WORKING_COPIES)
+        self.assertEqual(estimate_export_bytes(None), UNKNOWN_EXPORT_BYTES)
+
+    def test_usage_combines_consumers_and_reservations(self):
+        governor = MemoryGovernor(1000)
+        governor.add_consumer("decoded", lambda: 300)
+        governor.reserve("exports", 200)
+        governor.reserve("exports", 100)
+        self.assertEqual(governor.usage(), {"decoded": 300, "exports": 300})
+        self.assertEqual(governor.current_bytes(), 600)
+
+        governor.release("exports", 250)
+        self.assertEqual(governor.usage()["exports"], 50)
+        # 多释放时不会变成负数
+        governor.release("exports", 500)
+        self.assertEqual(governor.usage()["exports"], 0)
+
+    def test_enforce_shrinks_in_registration_order(self):
+        governor = MemoryGovernor(1000)
+        first, second = FakeCache(300), FakeCache(500)
+        governor.add_consumer("first", first.usage, first.shrink)
+        governor.add_consumer("thumbnails", lambda: 200)
+        governor.add_consumer("second", second.usage, second.shrink)
+
+        self.assertEqual(governor.enforce(), 1000)
+        self.assertEqual(first.requests, [])
+
+        # 先登记的缓存先淘汰，不够时再让后面的缓存淘汰
+        second.nbytes = 1000
+        self.assertEqual(governor.enforce(), 1000)
+        self.assertEqual((first.nbytes, second.nbytes), (0, 800))
+        self.assertEqual(first.requests, [500])
+        self.assertEqual(second.requests, [200])
+
+    def test_enforce_stops_when_under_budget(self):
+        governor = MemoryGovernor(1000)
+        first, second = FakeCache(900), FakeCache(300)
+        governor.add_consumer("first", first.usage, first.shrink)
+        governor.add_consumer("second", second.usage, second.shrink)
+
+        governor.enforce()
+        self.assertEqual(first.nbytes, 700)
+        self.assertEqual(second.requests, [])
+
+    def test_reserve_evicts_caches(self):
+        governor = MemoryGovernor(1000)
+        cache = FakeCache(800)
+        governor.add_consumer("decoded", cache.usage, cache.shrink)
+
+        governor.reserve("exports", 600)
+        self.assertEqual(cache.nbytes, 400)
+        self.assertEqual(governor.current_bytes(), 1000)
+
+    def test_can_reserve_ignores_shrinkable_caches(self):
+        governor = MemoryGovernor(1000)
+        cache = FakeCache(900)
+        governor.add_consumer("decoded", cache.usage, cache.shrink)
+        governor.add_consumer("thumbnails", lambda: 200)
+
+        self.assertTrue(governor.can_reserve(800))
+        self.assertFalse(governor.can_reserve(801))
+        governor.reserve("exports", 500)
+        self.assertTrue(governor.can_reserve(300))
+        self.assertFalse(governor.can_reserve(301))
+
+    def test_peak_tracks_highest_usage(self):
+        governor = MemoryGovernor(10000)
+        governor.reserve("exports", 700)
+        governor.release("exports", 700)
+        governor.reserve("exports", 200)
+        self.assertEqual(governor.peak_bytes, 700)
+
+        governor.reset_peak()
+        self.assertEqual(governor.peak_bytes, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
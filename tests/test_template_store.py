@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_template_store.py - 模板存储测试（旧版INI迁移、写入失败后重试、损坏文件备份）
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from PyQt5.QtCore import QSettings
+
+from template_store import TemplateStore, TEMPLATE_DEFAULTS, read_templates
+from tests import qt_app
+
+
+def setUpModule():
+    # QTimer 需要Qt应用程序对象
+    global _app
+    _app = qt_app()
+
+
+class TemplateStoreMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ini_path = os.path.join(self.work_dir, "watermark_config.ini")
+        self.json_path = os.path.join(self.work_dir, "watermark_templates.json")
+        self.settings = QSettings(self.ini_path, QSettings.IniFormat)
+        self.settings.setValue("templates/签名/text", "© 张三")
+        self.settings.setValue("templates/签名/opacity", "80")
+        self.settings.setValue("templates/签名/font_bold", "true")
+        self.settings.setValue("templates/签名/position_x", "0.25")
+        self.settings.setValue("templates/签名/unknown_field", "x")
+        self.settings.setValue("last_settings/font_size", "48")
+        self.settings.setValue("export/quality", 90)
+        self.settings.sync()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_migrates_templates_and_last_settings(self):
+        store = TemplateStore(self.json_path, self.settings)
+
+        self.assertEqual(store.names(), ["签名"])
+        template = store.get("签名")
+        self.assertEqual(template["text"], "© 张三")
+        self.assertEqual(template["opacity"], 80)
+        self.assertIs(template["font_bold"], True)
+        self.assertEqual(template["position_x"], 0.25)
+        self.assertEqual(template["rotation"], TEMPLATE_DEFAULTS["rotation"])
+        self.assertNotIn("unknown_field", template)
+        self.assertEqual(store.last_settings()["font_size"], 48)
+
+    def test_migration_writes_json_and_removes_ini_keys(self):
+        store = TemplateStore(self.json_path, self.settings)
+
+        self.assertFalse(store.dirty)
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["schema_version"], TemplateStore.SCHEMA_VERSION)
+        self.assertEqual(data["templates"]["签名"]["opacity"], 80)
+
+        self.settings.sync()
+        self.assertEqual(self.settings.allKeys(), ["export/quality"])
+
+    def test_existing_json_is_not_migrated_again(self):
+        TemplateStore(self.json_path, self.settings)
+        settings = QSettings(self.ini_path, QSettings.IniFormat)
+        settings.setValue("templates/新模板/text", "new")
+        settings.sync()
+
+        store = TemplateStore(self.json_path, settings)
+        self.assertEqual(store.names(), ["签名"])
+
+    def test_failed_migration_keeps_ini_keys(self):
+        missing_dir = os.path.join(self.work_dir, "missing")
+        store = TemplateStore(os.path.join(missing_dir, "templates.json"), self.settings)
+
+        self.assertTrue(store.dirty)
+        self.assertEqual(store.names(), ["签名"])
+        self.settings.sync()
+        self.assertIn("templates/签名/text", self.settings.allKeys())
+
+        # 目录可写后下次 flush 重试成功
+        os.mkdir(missing_dir)
+        self.assertTrue(store.flush())
+        self.assertFalse(store.dirty)
+
+
+class TemplateStoreSaveFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_flush_reports_error_and_stays_dirty(self):
+        path = os.path.join(self.work_dir, "missing", "templates.json")
+        store = TemplateStore(path)
+        messages = []
+        store.save_failed.connect(messages.append)
+
+        store.save("a", {"text": "a"})
+        self.assertFalse(store.flush())
+        self.assertTrue(store.dirty)
+        self.assertEqual(len(messages), 1)
+
+    def test_failed_replace_removes_temp_file(self):
+        path = os.path.join(self.work_dir, "templates.json")
+        store = TemplateStore(path)
+        # 目标位置是目录时临时文件能写入，替换失败
+        os.mkdir(path)
+
+        store.save("a", {"text": "a"})
+        self.assertFalse(store.flush())
+        self.assertEqual(os.listdir(self.work_dir), ["templates.json"])
+
+    def test_wrongly_shaped_json_is_backed_up(self):
+        path = os.path.join(self.work_dir, "templates.json")
+        for content in ("[]", "null", '"x"', '{"templates": []}', '{"templates": {"a": 1}}',
+                        '{"last_settings": [1]}', "{not json"):
+            with self.subTest(content=content):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(content)
+                self.assertEqual(read_templates(path), {})
+
+                store = TemplateStore(path)
+                self.assertEqual(store.names(), [])
+                self.assertIsNone(store.last_settings())
+                self.assertFalse(os.path.exists(path))
+                with open(path + ".bak", encoding="utf-8") as f:
+                    self.assertEqual(f.read(), content)
+
+    def test_missing_file_starts_empty_without_backup(self):
+        path = os.path.join(self.work_dir, "templates.json")
+        store = TemplateStore(path)
+        self.assertEqual(store.names(), [])
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_flush_without_changes_does_not_write(self):
+        path = os.path.join(self.work_dir, "templates.json")
+        store = TemplateStore(path)
+        self.assertTrue(store.flush())
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_watermark_renderer.py - 文本水印位置测试（旋转、斜体不改变文字中心）
+"""
+
+import unittest
+
+from PIL import Image, ImageFont
+
+import watermark_renderer
+from template_store import template_to_settings
+from tests.test_glyph_cache import FONT_PATH
+
+
+def _ink_box(image, settings):
+    """文本水印中有笔画的区域在图片中的坐标"""
+    layer, (x, y) = watermark_renderer._text_layer(image, settings)
+    left, top, right, bottom = layer.getchannel("A").getbbox()
+    return x + left, y + top, x + right, y + bottom
+
+
+def _center(box):
+    return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+
+@unittest.skipIf(FONT_PATH is None, "没有找到TrueType字体")
+class TextPlacementTest(unittest.TestCase):
+    def setUp(self):
+        self.image = Image.new("RGBA", (400, 300), (0, 0, 0, 255))
+        self.settings = template_to_settings({
+            "text": "Wave jg", "font_size": 64, "color": "#ffffff", "opacity": 100,
+        })
+        # 直接使用字体文件，不依赖系统字体索引
+        font = ImageFont.truetype(FONT_PATH, 64)
+        self._get_font = watermark_renderer.get_font
+        watermark_renderer.get_font = lambda *args: font
+
+    def tearDown(self):
+        watermark_renderer.get_font = self._get_font
+
+    def assertSameCenter(self, box, expected, delta):
+        for value, reference in zip(_center(box), _center(expected)):
+            self.assertAlmostEqual(value, reference, delta=delta)
+
+    def test_small_rotation_does_not_move_text(self):
+        plain = _ink_box(self.image, self.settings)
+        rotated = _ink_box(self.image, dict(self.settings, rotation=0.1))
+        for value, reference in zip(rotated, plain):
+            self.assertAlmostEqual(value, reference, delta=1)
+
+    def test_rotation_and_italic_keep_center(self):
+        plain = _ink_box(self.image, self.settings)
+        self.assertSameCenter(_ink_box(self.image, dict(self.settings, rotation=90)), plain, 2)
+        # 任意角度时比较变换后位图外接矩形的中心（笔画外接矩形的中心与笔画分布有关）
+        sprite, (x, y) = watermark_renderer._text_layer(self.image, dict(self.settings, rotation=30))
+        self.assertSameCenter((x, y, x + sprite.width, y + sprite.height), plain, 2)
+        # 倾斜后笔画向右上方延伸，水平方向的中心略有偏移
+        self.assertSameCenter(_ink_box(self.image, dict(self.settings, font_italic=True)), plain, 6)
+
+    def test_rotated_text_stays_inside_image(self):
+        settings = dict(self.settings, rotation=30, position=(1.0, 0.0))
+        left, top, right, bottom = _ink_box(self.image, settings)
+        self.assertGreaterEqual(top, 0)
+        self.assertLessEqual(right, self.image.width)
+
+
+if __name__ == "__main__":
+    unittest.main()
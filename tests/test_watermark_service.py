@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_watermark_service.py - HTTP水印服务的请求合并测试
+"""
+
+import io
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import watermark_renderer
+from template_store import template_to_settings
+from watermark_service import RequestBatcher, ServiceStats, render_image_bytes
+
+
+class _RecordingPool:
+    """在线程中执行并记录每次提交的池"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self.batch_sizes = []
+
+    def submit(self, fn, items, settings):
+        self.batch_sizes.append(len(items))
+        return self._executor.submit(fn, items, settings)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def _image_bytes(size=(64, 48), color="navy"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class RequestBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = _RecordingPool()
+        self.stats = ServiceStats()
+        self.settings = template_to_settings({"text": "wm", "font_size": 10, "opacity": 80})
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_requests_with_same_settings_are_batched(self):
+        batcher = RequestBatcher(self.pool, window_ms=200, batch_size=3, stats=self.stats)
+        futures = [batcher.submit(_image_bytes(), self.settings, "png") for _ in range(5)]
+        results = [future.result(timeout=10) for future in futures]
+
+        # 第一批达到数量上限立即提交，剩下的等待时间到后提交
+        self.assertEqual(self.pool.batch_sizes, [3, 2])
+        self.assertEqual(self.stats.snapshot()["batches"], 2)
+        self.assertTrue(all(content_type == "image/png" for _, content_type in results))
+
+    def test_different_settings_are_not_mixed(self):
+        batcher = RequestBatcher(self.pool, window_ms=50, batch_size=8)
+        other = dict(self.settings, text="other")
+        futures = [batcher.submit(_image_bytes(), settings, "png") for settings in (self.settings, other, self.settings)]
+        for future in futures:
+            future.result(timeout=10)
+        self.assertEqual(sorted(self.pool.batch_sizes), [1, 2])
+
+    def test_zero_window_disables_batching(self):
+        batcher = RequestBatcher(self.pool, window_ms=0, batch_size=8)
+        for future in [batcher.submit(_image_bytes(), self.settings, "png") for _ in range(3)]:
+            future.result(timeout=10)
+        self.assertEqual(self.pool.batch_sizes, [1, 1, 1])
+
+    def test_failed_request_does_not_fail_batch(self):
+        batcher = RequestBatcher(self.pool, window_ms=200, batch_size=2)
+        good = batcher.submit(_image_bytes(), self.settings, "png")
+        bad = batcher.submit(b"not an image", self.settings, "png")
+
+        self.assertEqual(good.result(timeout=10)[1], "image/png")
+        with self.assertRaises(ValueError):
+            bad.result(timeout=10)
+
+    def test_batched_result_matches_single_render(self):
+        # 同一批中同尺寸的图片共用预渲染的水印，结果与单独渲染相同
+        self.assertTrue(watermark_renderer.is_content_independent(self.settings))
+        data = _image_bytes((120, 90), "olive")
+        batcher = RequestBatcher(self.pool, window_ms=200, batch_size=2)
+        futures = [batcher.submit(data, self.settings, "png") for _ in range(2)]
+
+        expected = Image.open(io.BytesIO(render_image_bytes(data, self.settings, "png")[0]))
+        for future in futures:
+            actual = Image.open(io.BytesIO(future.result(timeout=10)[0]))
+            self.assertEqual(actual.tobytes(), expected.tobytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+watermark_client.py - 本地HTTP水印服务的测试客户端
+
+示例:
+    python watermark_client.py photo.jpg -t 我的模板 -o photo_wm.jpg
+    python watermark_client.py photo.jpg -s '{"type": "text", "text": "样片"}' -n 200 -c 8
+    python watermark_client.py --stats
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+
+def watermark(base_url, image_bytes, template=None, settings=None, output_format=None, quality=None):
+    """
+    发送一张图片，返回添加水印后的图片数据
+
+    Raises:
+        HTTPError: 服务返回错误时
+    """
+    params = {}
+    if template:
+        params["template"] = template
+    if output_format:
+        params["format"] = output_format
+    if quality is not None:
+        params["quality"] = quality
+
+    headers = {"Content-Type": "application/octet-stream"}
+    if settings:
+        headers["X-Watermark-Settings"] = json.dumps(settings, ensure_ascii=False)
+
+    url = f"{base_url}/watermark"
+    if params:
+        url += "?" + urlencode(params)
+    with urlopen(Request(url, data=image_bytes, headers=headers, method="POST")) as response:
+        return response.read()
+
+
+def fetch_json(base_url, path):
+    """读取服务的JSON接口"""
+    with urlopen(f"{base_url}{path}") as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地HTTP水印服务的测试客户端")
+    parser.add_argument("image", nargs="?", help="要添加水印的图片")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="服务地址")
+    parser.add_argument("-t", "--template", help="模板名称")
+    parser.add_argument("-s", "--settings", help="JSON格式的内联设置（字段与模板相同）")
+    parser.add_argument("-f", "--format", choices=["jpeg", "png"], help="输出格式")
+    parser.add_argument("-q", "--quality", type=int, help="JPEG质量")
+    parser.add_argument("-o", "--output", help="输出文件路径")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="重复发送次数（用于测试吞吐量）")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="并发请求数")
+    parser.add_argument("--stats", action="store_true", help="只显示服务统计")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    if args.stats or not args.image:
+        print(json.dumps(fetch_json(base_url, "/stats"), ensure_ascii=False, indent=2))
+        return 0
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    settings = json.loads(args.settings) if args.settings else None
+
+    def send(_):
+        start = time.perf_counter()
+        data = watermark(base_url, image_bytes, args.template, settings, args.format, args.quality)
+        return data, time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            results = list(executor.map(send, range(args.repeat)))
+    except HTTPError as e:
+        print(f"请求失败: {e.code} {e.read().decode('utf-8', 'replace')}", file=sys.stderr)
+        return 1
+    total = time.perf_counter() - start
+
+    data = results[-1][0]
+    output = args.output
+    if output is None:
+        name, _ = os.path.splitext(args.image)
+        ext = ".png" if data.startswith(b"\x89PNG") else ".jpg"
+        output = f"{name}_watermarked{ext}"
+    with open(output, "wb") as f:
+        f.write(data)
+
+    latencies = sorted(elapsed for _, elapsed in results)
+    print(f"已保存: {output}")
+    print(f"请求数: {len(results)}，总耗时 {total:.2f} 秒，{len(results) / total:.1f} 张/秒")
+    print(f"延迟: 中位数 {latencies[len(latencies) // 2] * 1000:.0f} ms，最大 {latencies[-1] * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
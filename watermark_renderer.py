@@ -0,0 +1,1076 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+watermark_renderer.py - 水印渲染
+
+不依赖界面的水印绘制逻辑。所有函数都只接收PIL图片和一个设置字典，
+这样预览、导出都可以按图片传入各自的有效设置。
+"""
+
+import os
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont, ImageChops
+
+import font_index
+
+
+# 设置字典中可以按图片单独覆盖的字段
+OVERRIDE_FIELDS = ("position", "opacity", "size")
+
+# 自动定位时分析用缩略图的最长边（像素）
+AUTO_POSITION_ANALYSIS_SIZE = 128
+
+# 每个线程最多缓存的字体数量
+FONT_CACHE_LIMIT = 32
+
+# 水印图片金字塔的最小层级边长（像素），以及最多缓存的水印图片数量
+LOGO_PYRAMID_MIN_SIZE = 32
+LOGO_CACHE_LIMIT = 4
+
+# 字体没有斜体字形时的倾斜角度（度）
+SYNTHETIC_ITALIC_ANGLE = 12
+
+# 旋转、倾斜等几何变换可选的插值方式
+RESAMPLE_FILTERS = {"nearest": Image.NEAREST, "bilinear": Image.BILINEAR, "bicubic": Image.BICUBIC}
+DEFAULT_RESAMPLE = "bicubic"
+
+# 变换后的水印位图缓存的内存上限（字节）
+SPRITE_CACHE_BYTES = 64 * 1024 * 1024
+
+# 字形缓存的内存上限（字节），以及最多缓存的相邻字符步进数
+GLYPH_CACHE_BYTES = 64 * 1024 * 1024
+GLYPH_ADVANCE_LIMIT = 65536
+
+
+def settings_with_overrides(base_settings, overrides):
+    """
+    合并全局设置和单张图片的覆盖设置
+
+    Args:
+        base_settings: 全局水印设置字典
+        overrides: 该图片的覆盖字段字典，没有时为None或空字典
+
+    Returns:
+        没有覆盖时直接返回base_settings本身（不复制），否则返回合并后的新字典
+    """
+    if not overrides:
+        return base_settings
+
+    merged = dict(base_settings)
+    merged.update(overrides)
+    return merged
+
+
+def analysis_proxy(image):
+    """
+    生成用于内容分析的小尺寸灰度图
+
+    先按最近邻抽样到分析尺寸的两倍，再2x2平均，成本与原图尺寸几乎无关。
+
+    Returns:
+        float32 的二维 NumPy 数组，最长边约为 AUTO_POSITION_ANALYSIS_SIZE
+    """
+    # NumPy 只在自动定位和自动颜色时用到，首次使用时才导入，不拖慢程序启动
+    import numpy as np
+
+    width, height = image.size
+    scale = min(1.0, AUTO_POSITION_ANALYSIS_SIZE / max(width, height))
+    analysis_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+    sample_size = (analysis_size[0] * 2, analysis_size[1] * 2)
+    small = image.resize(sample_size, Image.NEAREST) if scale < 0.5 else image
+    if small.mode not in ("L", "RGB", "RGBA"):
+        small = small.convert("RGB")
+    small = small.convert("L").resize(analysis_size, Image.BOX)
+    return np.asarray(small, dtype=np.float32)
+
+
+def _proxy_box(gray, image_size, center, box_size):
+    """
+    把原图上以center为中心的水印区域限制在图内，并换算到分析图坐标
+
+    Returns:
+        (归一化的区域中心, (x0, y0, x1, y1) 分析图上的区域)
+    """
+    width, height = image_size
+    small_h, small_w = gray.shape
+    box_w = min(width, max(1, int(box_size[0])))
+    box_h = min(height, max(1, int(box_size[1])))
+
+    left = min(max(0, center[0] * width - box_w / 2), width - box_w)
+    top = min(max(0, center[1] * height - box_h / 2), height - box_h)
+
+    x0 = int(left * small_w / width)
+    y0 = int(top * small_h / height)
+    x1 = max(x0 + 1, min(small_w, int(round((left + box_w) * small_w / width))))
+    y1 = max(y0 + 1, min(small_h, int(round((top + box_h) * small_h / height))))
+
+    clamped_center = ((left + box_w / 2) / width, (top + box_h / 2) / height)
+    return clamped_center, (x0, y0, x1, y1)
+
+
+def find_quiet_position(image, box_size, preferred=(0.5, 0.5), grid=3, gray=None):
+    """
+    在图片中寻找最"安静"（纹理最少）的区域来放置水印
+
+    在缩小到约128像素的灰度图上计算梯度幅值，用积分图求出每个候选区域的
+    平均梯度，取最小者。候选区域为 grid x grid 个锚点（grid=3 即九宫格）。
+
+    Args:
+        image: PIL图片
+        box_size: 水印在原图上的尺寸 (宽, 高)
+        preferred: 得分相同时优先靠近的位置（用户手动设置的位置）
+        grid: 每个方向的锚点数
+        gray: 已经生成的分析图（analysis_proxy的结果），为None时自动生成
+
+    Returns:
+        归一化的水印中心位置 (x, y)，可直接作为设置中的position使用
+    """
+    import numpy as np
+
+    if gray is None:
+        gray = analysis_proxy(image)
+    small_h, small_w = gray.shape
+
+    # 梯度幅值作为"繁杂度"
+    busy = np.zeros_like(gray)
+    busy[:, 1:] += np.abs(np.diff(gray, axis=1))
+    busy[1:, :] += np.abs(np.diff(gray, axis=0))
+
+    # 积分图，任意矩形区域求和为O(1)
+    integral = np.zeros((small_h + 1, small_w + 1), dtype=np.float64)
+    integral[1:, 1:] = busy.cumsum(axis=0).cumsum(axis=1)
+
+    best = None
+    for row in range(grid):
+        for col in range(grid):
+            anchor_x = col / (grid - 1) if grid > 1 else 0.5
+            anchor_y = row / (grid - 1) if grid > 1 else 0.5
+
+            # 水印区域限制在图片内
+            center, (x0, y0, x1, y1) = _proxy_box(gray, image.size, (anchor_x, anchor_y), box_size)
+            total = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            score = total / ((x1 - x0) * (y1 - y0))
+
+            distance = (center[0] - preferred[0]) ** 2 + (center[1] - preferred[1]) ** 2
+            if best is None or (score, distance) < best[:2]:
+                best = (score, distance, center)
+
+    return best[2]
+
+
+def choose_contrast_color(image, position, box_size, opacity, gray=None):
+    """
+    根据水印区域的平均亮度选择浅色或深色，并保证足够的不透明度
+
+    背景越接近中灰，两种颜色的对比都越弱，此时把不透明度提高到至少
+    100%（纯中灰）到 60%（纯黑或纯白）之间的对应值；用户设置更高时保持不变。
+
+    Args:
+        image: PIL图片
+        position: 归一化的水印中心位置
+        box_size: 水印在原图上的尺寸 (宽, 高)
+        opacity: 用户设置的不透明度（0-100）
+        gray: 已经生成的分析图，为None时自动生成
+
+    Returns:
+        ((r, g, b), 不透明度, 区域平均亮度0-255)
+    """
+    if gray is None:
+        gray = analysis_proxy(image)
+
+    _, (x0, y0, x1, y1) = _proxy_box(gray, image.size, position, box_size)
+    luminance = float(gray[y0:y1, x0:x1].mean())
+
+    color = (0, 0, 0) if luminance >= 128 else (255, 255, 255)
+    distance_from_mid = abs(luminance - 128) / 128
+    min_opacity = int(round(100 - 40 * distance_from_mid))
+    return color, max(opacity, min_opacity), luminance
+
+
+def apply_watermark(image, settings, report=None):
+    """
+    应用水印到图片
+
+    Args:
+        image: PIL图片
+        settings: 水印设置字典
+        report: 可选的字典，用于记录本张图片自动选择的位置、颜色和不透明度
+    """
+    # 创建图像副本
+    watermarked = image.copy()
+
+    # 根据水印类型应用不同的处理
+    if settings["type"] == "text":
+        result = apply_text_watermark(watermarked, settings, report)
+        # 确保结果不为空
+        if result is None:
+            return watermarked
+        return result
+    elif settings["type"] == "image" and settings["image_path"]:
+        result = apply_image_watermark(watermarked, settings, report)
+        if result is None:
+            return watermarked
+        return result
+
+    return watermarked
+
+
+def scaled_settings(settings, scale):
+    """
+    换算到缩小图片上使用的设置
+
+    位置和图片水印大小都是相对原图的比例，只有文本字号是绝对像素，需要按比例缩小。
+    """
+    scaled = dict(settings)
+    scaled["font_size"] = max(1, int(round(settings["font_size"] * scale)))
+    return scaled
+
+
+def render_sprite(base_image, settings, scale):
+    """
+    在缩小后的图片尺寸上单独渲染水印，用于拖拽时的快速预览
+
+    Args:
+        base_image: 按 scale 缩小后的原图（只用于确定画布尺寸和自适应颜色）
+        settings: 水印设置字典（原图尺寸下的设置）
+        scale: 缩小比例，用于换算字号
+
+    Returns:
+        (只包含水印的紧凑RGBA图片, 它在缩小图中的左上角坐标)，没有可见水印时返回 (None, (0, 0))
+    """
+    sprite_settings = scaled_settings(settings, scale)
+    sprite_settings["auto_position"] = False
+
+    # 自适应颜色先按当前位置的背景选好，拖拽过程中保持不变
+    if settings.get("adaptive_color"):
+        report = {}
+        apply_watermark(base_image, sprite_settings, report)
+        if "color" in report:
+            color = report["color"]
+            sprite_settings["color"] = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+            sprite_settings["opacity"] = report["opacity"]
+        sprite_settings["adaptive_color"] = False
+
+    canvas = Image.new("RGBA", base_image.size, (0, 0, 0, 0))
+    layer = apply_watermark(canvas, sprite_settings)
+    bbox = layer.getbbox()
+    if bbox is None:
+        return None, (0, 0)
+    return layer.crop(bbox), (bbox[0], bbox[1])
+
+
+def load_font(selected_font_family, font_size, is_bold, is_italic):
+    """根据字体名称和样式查找并加载PIL字体"""
+    font = None
+
+    # 1. 在字体索引中按字体族和样式查找（与界面的字体列表一致）
+    try:
+        face = font_index.default_index().lookup(selected_font_family, is_bold, is_italic)
+        if face is not None:
+            return ImageFont.truetype(face[0], font_size, index=face[1])
+    except Exception:
+        pass
+
+    # 2. 尝试直接使用用户选择的字体名称（字体文件名或路径）
+    try:
+        font = ImageFont.truetype(selected_font_family, font_size)
+    except Exception:
+        # 如果直接使用字体名称失败，尝试查找系统中的字体文件
+        font_paths = []
+
+        # 根据用户选择的字体名称和样式构建可能的字体文件路径
+        font_name_lower = selected_font_family.lower()
+        windows_fonts_dir = r"C:\Windows\Fonts"
+
+        # 构建可能的字体文件名称
+        possible_font_files = []
+        if "微软雅黑" in font_name_lower or "microsoft yahei" in font_name_lower:
+            possible_font_files.extend(["msyh.ttc", "msyhbd.ttc", "msyhl.ttc"])
+        elif "宋体" in font_name_lower or "simsun" in font_name_lower:
+            possible_font_files.extend(["simsun.ttc", "simsunb.ttf"])
+        elif "黑体" in font_name_lower or "heiti" in font_name_lower or "simhei" in font_name_lower:
+            possible_font_files.extend(["simhei.ttf"])
+        elif "楷体" in font_name_lower or "kai" in font_name_lower or "simkai" in font_name_lower:
+            possible_font_files.extend(["simkai.ttf"])
+        elif "arial" in font_name_lower:
+            possible_font_files.extend(["arial.ttf", "arialbd.ttf", "ariali.ttf", "arialbi.ttf"])
+        elif "times" in font_name_lower:
+            possible_font_files.extend(["times.ttf", "timesbd.ttf", "timesi.ttf", "timesbi.ttf"])
+        elif "courier" in font_name_lower:
+            possible_font_files.extend(["cour.ttf", "courbd.ttf", "couri.ttf", "courbi.ttf"])
+
+        # 优化字体文件排序逻辑，确保粗体优先
+        # 首先按样式优先级排序
+        if is_bold and is_italic:
+            # 粗斜体 > 粗体 > 斜体 > 常规
+            priority_order = {
+                3: lambda f: ('bd' in f or 'bold' in f.lower()) and ('i' in f or 'italic' in f.lower()),  # 粗斜体
+                2: lambda f: ('bd' in f or 'bold' in f.lower()) and not ('i' in f or 'italic' in f.lower()),  # 粗体
+                1: lambda f: not ('bd' in f or 'bold' in f.lower()) and ('i' in f or 'italic' in f.lower()),  # 斜体
+                0: lambda f: not ('bd' in f or 'bold' in f.lower()) and not ('i' in f or 'italic' in f.lower())  # 常规
+            }
+        elif is_bold:
+            # 粗体 > 常规
+            priority_order = {
+                2: lambda f: ('bd' in f or 'bold' in f.lower()),  # 粗体
+                0: lambda f: not ('bd' in f or 'bold' in f.lower())  # 常规
+            }
+        elif is_italic:
+            # 斜体 > 常规
+            priority_order = {
+                1: lambda f: ('i' in f or 'italic' in f.lower()),  # 斜体
+                0: lambda f: not ('i' in f or 'italic' in f.lower())  # 常规
+            }
+        else:
+            # 仅常规
+            priority_order = {0: lambda f: True}
+
+        # 为每个字体文件分配优先级
+        prioritized_fonts = []
+        for f in possible_font_files:
+            for priority, condition in sorted(priority_order.items(), reverse=True):
+                if condition(f):
+                    prioritized_fonts.append((-priority, f))  # 使用负优先级以便升序排序时高优先级在前
+                    break
+
+        # 按优先级排序
+        prioritized_fonts.sort()
+        possible_font_files = [f for _, f in prioritized_fonts]
+
+        # 添加完整路径
+        for font_file in possible_font_files:
+            full_path = os.path.join(windows_fonts_dir, font_file)
+            if os.path.exists(full_path):
+                font_paths.append(full_path)
+
+        # 3. 如果找不到匹配的字体，使用默认的中文字体列表
+        if not font_paths:
+            # Windows系统中常见的中文字体路径
+            # 根据是否需要粗体调整默认字体顺序
+            if is_bold:
+                # 粗体优先的默认字体列表
+                chinese_fonts = [
+                    r"C:\Windows\Fonts\msyhbd.ttc",    # 微软雅黑粗体
+                    r"C:\Windows\Fonts\simhei.ttf",    # 黑体（较粗）
+                    r"C:\Windows\Fonts\simsunb.ttf",   # 宋体粗体
+                    r"C:\Windows\Fonts\msyh.ttc",      # 微软雅黑
+                    r"C:\Windows\Fonts\simsun.ttc",     # 宋体
+                    r"C:\Windows\Fonts\simkai.ttf",    # 楷体
+                ]
+            else:
+                # 常规字体列表
+                chinese_fonts = [
+                    r"C:\Windows\Fonts\msyh.ttc",      # 微软雅黑
+                    r"C:\Windows\Fonts\simsun.ttc",     # 宋体
+                    r"C:\Windows\Fonts\simhei.ttf",    # 黑体
+                    r"C:\Windows\Fonts\simkai.ttf",    # 楷体
+                    r"C:\Windows\Fonts\msyhbd.ttc",    # 微软雅黑粗体
+                ]
+            font_paths.extend(chinese_fonts)
+
+        # 尝试加载字体文件 - 增强粗体支持
+        font = None
+        # 先尝试直接使用字体名称并指定粗体样式
+        if is_bold:
+            try:
+                # 对于PIL，可以通过在字体名称后添加样式参数来尝试加载粗体
+                # 注意：这在不同PIL版本和系统上的支持程度不同
+                font = ImageFont.truetype(selected_font_family, font_size, weight='bold')
+            except Exception:
+                pass
+
+        # 如果直接加载粗体失败，再尝试文件路径方式
+        if font is None:
+            for font_path in font_paths:
+                try:
+                    if os.path.exists(font_path):
+                        # 获取文件名和扩展名
+                        file_name = os.path.basename(font_path)
+                        file_ext = os.path.splitext(font_path)[1].lower()
+
+                        # 设置加载参数
+                        font_params = {}
+
+                        # 对于TTC文件，使用index参数选择样式
+                        if file_ext == ".ttc":
+                            # 微软雅黑等字体通常使用index=1作为粗体
+                            if 'bd' in file_name or 'bold' in file_name.lower():
+                                font_params['index'] = 0  # 粗体文件中的第一个索引通常就是粗体
+                            elif is_bold:
+                                font_params['index'] = 1  # 常规文件中的第二个索引可能是粗体
+                            else:
+                                font_params['index'] = 0  # 常规样式
+
+                        # 尝试加载字体，传递相应参数
+                        font = ImageFont.truetype(font_path, font_size, **font_params)
+
+                        # 验证是否成功加载了正确的粗体字体
+                        # 注意：PIL的ImageFont不直接提供检查字体是否为粗体的方法
+                        # 但我们已经通过文件优先级确保了优先尝试粗体文件
+                        break
+                except Exception:
+                    continue
+
+    # 如果找不到中文字体，使用默认字体
+    if font is None:
+        try:
+            # 尝试使用PIL默认字体
+            font = ImageFont.load_default()
+        except Exception:
+            # 如果默认字体也加载失败，使用备用字体大小计算
+            pass
+
+    return font
+
+
+# 按线程缓存已加载的字体（FreeType字体对象不能在多个线程中同时使用）
+_font_cache = threading.local()
+
+
+def get_font(font_family, font_size, is_bold, is_italic):
+    """获取字体，同一线程中相同的字体只查找和加载一次"""
+    fonts = getattr(_font_cache, "fonts", None)
+    if fonts is None:
+        fonts = _font_cache.fonts = {}
+
+    key = (font_family, font_size, is_bold, is_italic)
+    if key not in fonts:
+        if len(fonts) >= FONT_CACHE_LIMIT:
+            fonts.clear()
+        fonts[key] = load_font(font_family, font_size, is_bold, is_italic)
+    return fonts[key]
+
+
+class GlyphCache:
+    """
+    字形缓存（线程安全）
+
+    按 (字体文件, 字体序号, 字号, 字符) 缓存单个字符栅格化后的灰度位图，
+    相邻两个字符之间的步进（包括字距调整）也一并缓存。文字变化时只栅格化新出现的字符，
+    其余字形直接拼接，输入文字时的耗时基本不随字号增大。
+    拼接结果与 ImageDraw.text 的基本排版方式一致（字形位置按步进累加后取整）。
+    """
+
+    def __init__(self, limit_bytes=GLYPH_CACHE_BYTES):
+        self.limit_bytes = limit_bytes
+        self._lock = threading.Lock()
+        # {键: (灰度位图或None, 位图偏移, 字形边界)}
+        self._glyphs = OrderedDict()
+        self._bytes = 0
+        self._advances = {}
+
+    def layout(self, font, text):
+        """
+        排列一行文字的字形（新出现的字符在这里栅格化）
+
+        Returns:
+            ([(字形, 横向位置)], 边界)，边界与 ImageDraw.textbbox((0, 0), ...) 相同；
+            字体或文字不适合逐字拼接时返回None
+        """
+        font_key = self._font_key(font)
+        if font_key is None or not text or "\n" in text:
+            return None
+
+        glyphs = []
+        pen = 0.0
+        for i, char in enumerate(text):
+            glyphs.append((self._glyph(font, font_key, char), int(math.floor(pen + 0.5))))
+            if i + 1 < len(text):
+                pen += self._advance(font, font_key, char, text[i + 1])
+
+        x0 = min(x + bbox[0] for (_, _, bbox), x in glyphs)
+        y0 = min(bbox[1] for (_, _, bbox), _ in glyphs)
+        x1 = max(x + bbox[2] for (_, _, bbox), x in glyphs)
+        y1 = max(bbox[3] for (_, _, bbox), _ in glyphs)
+        return glyphs, (x0, y0, x1, y1)
+
+    @staticmethod
+    def compose(layout, clip=None):
+        """
+        把排列好的字形拼成灰度位图
+
+        Args:
+            layout: layout() 的结果
+            clip: 只拼接这个区域内的部分（相对文字原点的 (左, 上, 右, 下)），为None时拼接全部
+
+        Returns:
+            (灰度位图, 位图左上角相对文字原点的位置)，区域内没有文字时位图为None
+        """
+        glyphs, (x0, y0, x1, y1) = layout
+        if clip is not None:
+            x0, y0 = max(x0, clip[0]), max(y0, clip[1])
+            x1, y1 = min(x1, clip[2]), min(y1, clip[3])
+        if x1 <= x0 or y1 <= y0:
+            return None, (x0, y0)
+
+        mask = Image.new("L", (x1 - x0, y1 - y0), 0)
+        for (glyph, offset, _), x in glyphs:
+            if glyph is None:
+                continue
+            left = x + offset[0] - x0
+            top = offset[1] - y0
+            if left >= mask.width or top >= mask.height or left + glyph.width <= 0 or top + glyph.height <= 0:
+                continue
+            box = (left, top, left + glyph.width, top + glyph.height)
+            # 相邻字形的边界可能重叠，与整行栅格化一样取较大值
+            mask.paste(ImageChops.lighter(mask.crop(box), glyph), box)
+        return mask, (x0, y0)
+
+    def _font_key(self, font):
+        """只有基本排版方式的文件字体可以逐字拼接"""
+        path = getattr(font, "path", None)
+        if not isinstance(path, str) or getattr(font, "layout_engine", None) != ImageFont.Layout.BASIC:
+            return None
+        return (path, font.index, font.size)
+
+    def _glyph(self, font, font_key, char):
+        key = font_key + (char,)
+        with self._lock:
+            entry = self._glyphs.get(key)
+            if entry is not None:
+                self._glyphs.move_to_end(key)
+                return entry
+
+        # 栅格化在锁外进行（字体对象只在当前线程中使用）
+        core_mask, offset = font.getmask2(char, mode="L", anchor="la")
+        width, height = core_mask.size
+        glyph = Image.frombytes("L", (width, height), bytes(core_mask)) if width and height else None
+        entry = (glyph, offset, font.getbbox(char, anchor="la"))
+
+        with self._lock:
+            if key not in self._glyphs:
+                self._glyphs[key] = entry
+                self._bytes += width * height
+                while self._bytes > self.limit_bytes and len(self._glyphs) > 1:
+                    _, (old, _, _) = self._glyphs.popitem(last=False)
+                    if old is not None:
+                        self._bytes -= old.width * old.height
+        return entry
+
+    def _advance(self, font, font_key, char, next_char):
+        """从char到next_char的步进（包括两者之间的字距调整）"""
+        key = font_key + (char, next_char)
+        advance = self._advances.get(key)
+        if advance is None:
+            advance = font.getlength(char + next_char) - font.getlength(next_char)
+            with self._lock:
+                if len(self._advances) >= GLYPH_ADVANCE_LIMIT:
+                    self._advances.clear()
+                self._advances[key] = advance
+        return advance
+
+
+# 进程内共用的字形缓存
+glyph_cache = GlyphCache()
+
+
+def apply_text_watermark(image, settings, report=None):
+    """应用文本水印"""
+    # 确保图像有alpha通道
+    original_mode = image.mode
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    text_sprite = _text_layer(image, settings, report)
+    if text_sprite is None:
+        return image  # 如果文本为空，返回原图
+
+    # 合并水印到原图
+    sprite, offset = text_sprite
+    result = _composite(image, sprite, offset)
+
+    # 转换回原始模式
+    if original_mode == "RGB":
+        result = result.convert("RGB")
+
+    return result
+
+
+def _is_true_italic(font):
+    """字体本身是否为斜体字形（是则不需要再倾斜）"""
+    try:
+        style = font.getname()[1].lower()
+    except Exception:
+        return False
+    return "italic" in style or "oblique" in style
+
+
+def _text_mask(font, text, text_layout, text_bbox):
+    """整行文字的灰度位图，大小与文字边界相同"""
+    if text_layout is not None:
+        return glyph_cache.compose(text_layout)[0]
+    mask = Image.new("L", (max(1, text_bbox[2] - text_bbox[0]), max(1, text_bbox[3] - text_bbox[1])), 0)
+    ImageDraw.Draw(mask).text((-text_bbox[0], -text_bbox[1]), text, font=font, fill=255)
+    return mask
+
+
+def _text_layer(image, settings, report=None):
+    """
+    绘制紧凑的文本水印
+
+    斜体（字体没有斜体字形时）和旋转在紧凑的文字位图上一次完成（见 transform_sprite），
+    变换结果按字体、文字和变换参数缓存，拖动位置、调整颜色时不需要重新变换。
+
+    Args:
+        image: RGBA图片，用于确定水印位置，自动定位和自适应颜色时还用于分析背景
+
+    Returns:
+        (水印图片, 左上角坐标)，文本为空时返回None
+    """
+    # 获取水印文本
+    text = settings["text"]
+    if not text.strip():
+        return None
+
+    # 使用用户在UI中设置的字体大小
+    font_size = max(1, min(1024, settings["font_size"]))  # 限制字体大小范围（缩小的预览会低于界面最小值8）
+
+    # 检查字体设置（加粗和斜体）
+    is_bold = settings["font_bold"]
+    is_italic = settings["font_italic"]
+
+    # 查找可用的字体
+    font = get_font(settings["font_family"], font_size, is_bold, is_italic)
+
+    # 获取用户设置的颜色和透明度
+    r, g, b = settings["color"]
+    # 交换R和B通道，因为PIL和PyQt5可能对RGB通道顺序处理不同
+    r, b = b, r
+
+    # 处理透明度：将用户透明度滑块值(0-100)转换为PIL可用的alpha值(0-255)
+    # 这样可以确保用户选择的颜色RGB值能正确显示，同时透明度由滑块控制
+    opacity_value = settings["opacity"]
+    final_alpha = int(255 * (opacity_value / 100))
+
+    # 确保alpha值在有效范围内
+    final_alpha = max(0, min(255, final_alpha))
+
+    # 为PIL的ImageDraw创建正确的RGBA颜色元组
+    text_color = (r, g, b, final_alpha)
+
+    # 用缓存的字形排列整行文字，同时得到文字边界
+    text_layout = None
+    try:
+        text_layout = glyph_cache.layout(font, text)
+    except Exception:
+        pass
+
+    # 计算文本尺寸和位置
+    try:
+        if text_layout is not None:
+            text_bbox = text_layout[1]
+        else:
+            text_bbox = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+    except Exception:
+        # 如果无法获取文本尺寸，使用估计值
+        text_width = int(font_size * len(text) * 0.7)
+        text_height = int(font_size * 1.2)
+        text_bbox = (0, 0, text_width, text_height)
+
+    # 斜体（字体没有斜体字形时倾斜）和旋转合成一次仿射变换
+    box_size = (text_width, text_height)  # 水印实际占用的区域（变换后为外接矩形），用于自动定位和自适应颜色
+    shear = math.tan(math.radians(SYNTHETIC_ITALIC_ANGLE)) if is_italic and not _is_true_italic(font) else 0.0
+    rotation = settings["rotation"] % 360
+    warped_mask = None
+    if shear or rotation:
+        resample = settings.get("resample", DEFAULT_RESAMPLE)
+        key = (settings["font_family"], font_size, is_bold, is_italic, text, rotation, shear, resample)
+        warped_mask = sprite_cache.get(key)
+        if warped_mask is None:
+            mask = _text_mask(font, text, text_layout, text_bbox)
+            warped_mask = transform_sprite(mask, rotation=rotation, shear=shear, resample=resample)
+            sprite_cache.put(key, warped_mask)
+        box_size = warped_mask.size
+
+    # 自动定位和自适应颜色共用同一张分析图
+    gray = None
+    if settings.get("auto_position") or settings.get("adaptive_color"):
+        gray = analysis_proxy(image)
+
+    # 计算水印位置（基于用户设置的位置，自动模式下选择最空白的区域）
+    position = settings["position"]
+    if settings.get("auto_position"):
+        position = find_quiet_position(image, box_size, position, gray=gray)
+
+    # 自适应颜色：按水印区域的亮度选择浅色或深色
+    if settings.get("adaptive_color"):
+        (r, g, b), opacity_value, luminance = choose_contrast_color(
+            image, position, box_size, opacity_value, gray=gray
+        )
+        text_color = (r, g, b, max(0, min(255, int(255 * (opacity_value / 100)))))
+        if report is not None:
+            report["luminance"] = round(luminance, 1)
+            report["color"] = "#%02x%02x%02x" % (r, g, b)
+
+    if report is not None:
+        report["position"] = (round(position[0], 4), round(position[1], 4))
+        report["opacity"] = opacity_value
+    x = int((position[0] * image.width) - (text_width / 2))
+    y = int((position[1] * image.height) - (text_height / 2))
+
+    # 确保文本在图像范围内
+    x = max(0, min(x, image.width - text_width))
+    y = max(0, min(y, image.height - text_height))
+
+    # 变换后的文字：位图按颜色着色后就是水印。
+    # 变换以位图中心为中心，外接矩形的中心与未变换时文字边界的中心重合，
+    # 很小的旋转角度或斜体不会让水印按边界偏移量跳动
+    if warped_mask is not None:
+        sprite = Image.new("RGBA", warped_mask.size, (0, 0, 0, 0))
+        sprite.paste(text_color, (0, 0), warped_mask)
+        sprite_x = x + text_bbox[0] + (text_width - sprite.width) // 2
+        sprite_y = y + text_bbox[1] + (text_height - sprite.height) // 2
+        sprite_x = max(0, min(sprite_x, image.width - sprite.width))
+        sprite_y = max(0, min(sprite_y, image.height - sprite.height))
+        return sprite, (sprite_x, sprite_y)
+
+    # 没有变换时只拼接落在图片内的部分（(x, y) 是文字原点，边界相对原点偏移）
+    if text_layout is not None:
+        mask, (left, top) = glyph_cache.compose(text_layout, (-x, -y, image.width - x, image.height - y))
+        if mask is None:
+            return Image.new("RGBA", (1, 1), (0, 0, 0, 0)), (0, 0)
+        sprite = Image.new("RGBA", mask.size, (0, 0, 0, 0))
+        sprite.paste(text_color, (0, 0), mask)
+        return sprite, (x + left, y + top)
+
+    # 不能逐字拼接的字体直接在同尺寸图层上绘制
+    watermark_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    try:
+        ImageDraw.Draw(watermark_layer).text((x, y), text, font=font, fill=text_color)
+    except Exception:
+        # 如果使用font参数失败，尝试不使用font参数
+        try:
+            ImageDraw.Draw(watermark_layer).text((x, y), text, fill=text_color)
+        except Exception:
+            # 如果仍然失败，记录错误但继续执行
+            pass
+    return watermark_layer, (0, 0)
+
+
+def transform_sprite(sprite, rotation=0, shear=0.0, scale=1.0, resample=DEFAULT_RESAMPLE):
+    """
+    对紧凑的水印图片做一次仿射变换：先水平倾斜（斜体），再缩放，最后逆时针旋转
+
+    三个变换合成一个矩阵只重采样一次，输出尺寸为变换后的外接矩形，不需要任何中间图层。
+    RGBA图片按预乘alpha插值，透明边缘不会出现黑边。
+
+    Args:
+        sprite: "L" 或 "RGBA" 图片
+        rotation: 逆时针旋转角度（度）
+        shear: 倾斜系数（顶部向右偏移 shear × 高度）
+        scale: 缩放比例
+        resample: 插值方式，RESAMPLE_FILTERS 中的名称
+
+    Returns:
+        变换后的图片，恒等变换时返回原图
+    """
+    if not shear and scale == 1 and rotation % 360 == 0:
+        return sprite
+
+    angle = math.radians(rotation)
+    cos, sin = math.cos(angle), math.sin(angle)
+    # 正向矩阵（y轴向下）：旋转 × 缩放 × 倾斜
+    a, b = scale * cos, scale * (sin - shear * cos)
+    c, d = -scale * sin, scale * (cos + shear * sin)
+
+    width, height = sprite.size
+    corners = [(a * x + b * y, c * x + d * y) for x, y in ((0, 0), (width, 0), (0, height), (width, height))]
+    min_x = min(x for x, _ in corners)
+    min_y = min(y for _, y in corners)
+    out_size = (
+        max(1, int(math.ceil(max(x for x, _ in corners) - min_x))),
+        max(1, int(math.ceil(max(y for _, y in corners) - min_y))),
+    )
+
+    # 输出像素到输入像素的逆变换
+    det = a * d - b * c
+    ia, ib, ic, id_ = d / det, -b / det, -c / det, a / det
+    data = (ia, ib, ia * min_x + ib * min_y, ic, id_, ic * min_x + id_ * min_y)
+
+    method = RESAMPLE_FILTERS.get(resample, RESAMPLE_FILTERS[DEFAULT_RESAMPLE])
+    if sprite.mode == "RGBA":
+        warped = sprite.convert("RGBa").transform(out_size, Image.AFFINE, data, resample=method)
+        return warped.convert("RGBA")
+    return sprite.transform(out_size, Image.AFFINE, data, resample=method)
+
+
+class SpriteCache:
+    """变换后的水印位图缓存（线程安全，按内存上限淘汰最久未使用的）"""
+
+    def __init__(self, limit_bytes=SPRITE_CACHE_BYTES):
+        self.limit_bytes = limit_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        if size > self.limit_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.width * old.height * len(old.getbands())
+            self._entries[key] = image
+            self._bytes += size
+            while self._bytes > self.limit_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.width * old.height * len(old.getbands())
+
+
+# 进程内共用的变换结果缓存
+sprite_cache = SpriteCache()
+
+
+class LogoCache:
+    """
+    水印图片缓存（线程安全）
+
+    每个水印图片只解码一次，并预先生成逐级缩小一半的金字塔。
+    缩放时从不小于目标尺寸的最小层级开始，避免每次都从印刷级大图做LANCZOS缩放。
+    文件修改时间或大小变化时自动重新加载。
+    """
+
+    def __init__(self, limit=LOGO_CACHE_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        # {路径: (文件标记, [RGBA层级，从原图开始逐级减半])}
+        self._entries = OrderedDict()
+
+    def pyramid(self, path):
+        """获取水印图片的金字塔层级列表（第0层为原图）"""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        # 解码在锁外进行，不阻塞其他线程使用已缓存的水印
+        with Image.open(path) as source:
+            level = source.convert("RGBA") if source.mode != "RGBA" else source.copy()
+        levels = [level]
+        while min(level.size) >= LOGO_PYRAMID_MIN_SIZE * 2:
+            level = level.reduce(2)
+            levels.append(level)
+
+        with self._lock:
+            self._entries[path] = (stamp, levels)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.limit:
+                self._entries.popitem(last=False)
+        return levels
+
+    def level(self, path, scale_factor):
+        """
+        选择宽高都不小于目标尺寸的最小金字塔层级
+
+        Returns:
+            (层级图片（共享对象，不能修改）, 目标尺寸)
+        """
+        levels = self.pyramid(path)
+        original = levels[0]
+        new_size = (max(1, int(original.width * scale_factor)), max(1, int(original.height * scale_factor)))
+
+        source = original
+        for level in levels[1:]:
+            if level.width < new_size[0] or level.height < new_size[1]:
+                break
+            source = level
+        return source, new_size
+
+    def resized(self, path, scale_factor):
+        """
+        获取按原图尺寸缩放 scale_factor 倍后的水印图片
+
+        Returns:
+            RGBA图片（新对象，可以直接修改）
+        """
+        source, new_size = self.level(path, scale_factor)
+        if source.size == new_size:
+            return source.copy()
+        return source.resize(new_size, Image.LANCZOS)
+
+    def invalidate(self, path=None):
+        """删除某个水印图片（path为None时删除全部）的缓存"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+# 预览和导出共用的水印图片缓存
+logo_cache = LogoCache()
+
+
+def apply_image_watermark(image, settings, report=None):
+    """
+    应用图片水印
+
+    出错时直接抛出异常，由调用方决定如何提示用户。
+    """
+    # 确保原图有alpha通道
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    watermark, offset = _logo_layer(image, settings, report)
+
+    # 创建结果图片并合并
+    result = _composite(image, watermark, offset)
+
+    # 转换回原始模式
+    if image.mode == "RGB":
+        result = result.convert("RGB")
+
+    return result
+
+
+def _logo_layer(image, settings, report=None):
+    """
+    缩放、调整透明度并旋转水印图片
+
+    Args:
+        image: RGBA图片，用于确定水印尺寸，自动定位时还用于分析背景
+
+    Returns:
+        (水印图片, 左上角坐标)
+    """
+    # 从缓存的金字塔中取得水印图片原始尺寸
+    original = logo_cache.pyramid(settings["image_path"])[0]
+
+    # 计算水印大小
+    base_size = min(image.width, image.height) * (settings["size"] / 100)
+    scale_factor = base_size / max(original.width, original.height)
+
+    rotation = settings["rotation"] % 360
+    if rotation == 0:
+        # 从最接近的金字塔层级缩放
+        watermark = logo_cache.resized(settings["image_path"], scale_factor)
+    else:
+        # 缩放和旋转合成一次仿射变换，从最接近的金字塔层级开始
+        source, new_size = logo_cache.level(settings["image_path"], scale_factor)
+        watermark = transform_sprite(
+            source, rotation=rotation, scale=new_size[0] / source.width,
+            resample=settings.get("resample", DEFAULT_RESAMPLE)
+        )
+
+    # 应用透明度
+    opacity = settings["opacity"]
+    if opacity != 100:
+        # 获取水印的alpha通道
+        r, g, b, a = watermark.split()
+        # 调整alpha通道
+        a = a.point(lambda x: int(x * opacity / 100))
+        # 合并回水印图片
+        watermark = Image.merge("RGBA", (r, g, b, a))
+
+    # 计算水印位置（自动模式下选择最空白的区域）
+    position = settings["position"]
+    if settings.get("auto_position"):
+        position = find_quiet_position(image, watermark.size, position)
+    if report is not None:
+        report["position"] = (round(position[0], 4), round(position[1], 4))
+        report["opacity"] = opacity
+    x = int((position[0] * image.width) - (watermark.width / 2))
+    y = int((position[1] * image.height) - (watermark.height / 2))
+
+    return watermark, (x, y)
+
+
+def _composite(image, layer, offset):
+    """把水印层按自身alpha合并到RGBA图片上，返回新图片"""
+    result = Image.new("RGBA", image.size)
+    result.paste(image, (0, 0))
+    result.paste(layer, offset, layer)
+    return result
+
+
+def settings_key(settings):
+    """设置字典的可哈希表示，用于缓存按设置区分的结果"""
+    return tuple(sorted(settings.items()))
+
+
+def is_content_independent(settings):
+    """水印外观是否只取决于图片尺寸（与像素内容无关），此时同尺寸的图片可以共用预渲染的水印"""
+    if settings.get("auto_position") or settings.get("adaptive_color"):
+        return False
+    if settings["type"] == "text":
+        return bool(settings["text"].strip())
+    return settings["type"] == "image" and bool(settings["image_path"])
+
+
+def watermark_layer(image, settings, report=None):
+    """
+    只渲染水印本身，不合成到图片上
+
+    Args:
+        image: 用于确定水印位置的图片，自动定位和自适应颜色时还用于分析背景
+
+    Returns:
+        (裁剪到可见区域的RGBA水印，或没有可见水印时为None, 左上角坐标)
+    """
+    if settings["type"] == "text":
+        text_sprite = _text_layer(image, settings, report)
+        if text_sprite is None:
+            return None, (0, 0)
+        layer, offset = text_sprite
+    elif settings["type"] == "image" and settings["image_path"]:
+        layer, offset = _logo_layer(image, settings, report)
+    else:
+        return None, (0, 0)
+
+    bbox = layer.getbbox()
+    if bbox is None:
+        return None, (0, 0)
+    return layer.crop(bbox), (offset[0] + bbox[0], offset[1] + bbox[1])
+
+
+def prepare_watermark(image_size, settings):
+    """
+    为指定尺寸的图片预先渲染水印，供同尺寸的图片共用
+
+    只能用于 is_content_independent(settings) 为真的设置。
+
+    Returns:
+        (裁剪到可见区域的RGBA水印，或没有可见水印时为None, 左上角坐标)
+    """
+    canvas = Image.new("RGBA", image_size, (0, 0, 0, 0))
+    return watermark_layer(canvas, settings)
+
+
+def apply_prepared_watermark(image, settings, prepared):
+    """
+    使用 prepare_watermark 的结果给图片加水印，结果与 apply_watermark 相同
+
+    Args:
+        image: PIL图片，尺寸必须与预渲染时相同
+        settings: 预渲染时使用的设置
+        prepared: prepare_watermark 的返回值
+    """
+    original_mode = image.mode
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    sprite, offset = prepared
+    result = _composite(image, sprite, offset) if sprite is not None else image.copy()
+
+    # 与两种水印各自的模式处理保持一致：文本水印还原RGB，图片水印保持RGBA
+    if settings["type"] == "text" and original_mode == "RGB":
+        result = result.convert("RGB")
+    return result
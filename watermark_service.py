@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+watermark_service.py - 本地HTTP水印服务
+
+让其他程序（例如网站后台处理上传图片时）调用与界面相同的水印逻辑。
+基于标准库 http.server，每个请求的图片只在内存中处理，
+实际渲染在预先启动并加载好字体和水印图片的进程池中进行（见 worker_pool.py），
+并统计吞吐量和延迟。
+
+短时间内到达的、水印设置相同的请求合并为一批（最多等待 --batch-window-ms 毫秒，
+每批最多 --batch-size 个），一批只向进程池提交一次，同尺寸的图片共用预渲染的水印。
+--batch-window-ms 0 时每个请求单独提交。
+
+启动:
+    python watermark_service.py --port 8765 --workers 4
+
+接口:
+    POST /watermark?template=模板名&format=jpeg&quality=90
+        请求体为原始图片数据，返回添加水印后的图片数据。
+        可以用 X-Watermark-Settings 请求头传入JSON格式的模板字段（与模板文件中的字段相同），
+        与 template 同时使用时覆盖模板中的对应字段。
+    GET /templates    模板名称列表
+    GET /stats        请求数、错误数、吞吐量和延迟统计
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+import high_bit_depth
+import watermark_renderer
+from template_store import read_templates, template_to_settings
+from worker_pool import WarmWorkerPool, warm_worker
+
+
+# 默认监听地址和端口（只监听本机）
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 单个请求允许的最大图片大小（字节）
+MAX_REQUEST_BYTES = 200 * 1024 * 1024
+
+# 延迟统计保留的最近请求数
+LATENCY_WINDOW = 1000
+
+# 请求合并：同一设置的请求最多等待的时间（毫秒）和每批最多的请求数
+# （每批在一个工作进程中依次处理，批次太大时其他工作进程会空闲）
+DEFAULT_BATCH_WINDOW_MS = 5
+DEFAULT_BATCH_SIZE = 4
+
+
+def render_image_bytes(image_bytes, settings, output_format=None, quality=90, prepared_cache=None):
+    """
+    在工作进程中为内存中的图片添加水印
+
+    Args:
+        image_bytes: 原始图片数据
+        settings: 水印设置字典
+        output_format: 输出格式（"jpeg" 或 "png"），为None时JPEG输入输出JPEG，其他输出PNG（16位图片输出16位PNG）
+        quality: JPEG质量
+        prepared_cache: 同一批请求共用的预渲染水印 {图片尺寸: prepare_watermark 的结果}，为None时不共用
+
+    Returns:
+        (输出图片数据, MIME类型)
+    """
+    warm_worker(settings)
+    image = Image.open(io.BytesIO(image_bytes))
+    if output_format is None:
+        output_format = "jpeg" if image.format == "JPEG" else "png"
+
+    prepared = None
+    if prepared_cache is not None and watermark_renderer.is_content_independent(settings):
+        prepared = prepared_cache.get(image.size)
+        if prepared is None:
+            prepared = prepared_cache[image.size] = watermark_renderer.prepare_watermark(image.size, settings)
+
+    # 16位图片输出PNG时按16位合成和保存，输出JPEG时明确缩减为8位
+    if high_bit_depth.is_high_bit_depth(image):
+        if output_format == "png":
+            array = high_bit_depth.decode(image, image_bytes)
+            array = high_bit_depth.apply_watermark(array, settings, prepared=prepared)
+            return high_bit_depth.encode(array, "png"), "image/png"
+        image = high_bit_depth.to_8bit_image(image)
+
+    if prepared is not None:
+        watermarked = watermark_renderer.apply_prepared_watermark(image, settings, prepared)
+    else:
+        watermarked = watermark_renderer.apply_watermark(image, settings)
+
+    buffer = io.BytesIO()
+    if output_format == "jpeg":
+        if watermarked.mode != "RGB":
+            background = Image.new("RGB", watermarked.size, (255, 255, 255))
+            if watermarked.mode == "RGBA":
+                background.paste(watermarked, mask=watermarked.split()[3])
+            else:
+                background.paste(watermarked.convert("RGB"))
+            watermarked = background
+        watermarked.save(buffer, "JPEG", quality=quality)
+        return buffer.getvalue(), "image/jpeg"
+
+    watermarked.save(buffer, "PNG")
+    return buffer.getvalue(), "image/png"
+
+
+def render_batch(items, settings):
+    """
+    在工作进程中依次处理同一设置的一批请求
+
+    Args:
+        items: [(原始图片数据, 输出格式, JPEG质量)]
+
+    Returns:
+        每个请求的结果 [(True, (输出图片数据, MIME类型)) 或 (False, 错误信息)]，单个请求失败不影响其他请求
+    """
+    prepared_cache = {}
+    results = []
+    for image_bytes, output_format, quality in items:
+        try:
+            results.append((True, render_image_bytes(image_bytes, settings, output_format, quality, prepared_cache)))
+        except Exception as e:
+            results.append((False, str(e) or type(e).__name__))
+    return results
+
+
+class RequestBatcher:
+    """把短时间内到达的、设置相同的请求合并为一次进程池任务（线程安全）"""
+
+    def __init__(self, pool, window_ms=DEFAULT_BATCH_WINDOW_MS, batch_size=DEFAULT_BATCH_SIZE, stats=None):
+        """
+        初始化请求合并器
+
+        Args:
+            pool: WarmWorkerPool
+            window_ms: 第一个请求到达后最多等待的时间（毫秒），为0时每个请求单独提交
+            batch_size: 每批最多的请求数，达到后立即提交
+            stats: ServiceStats，记录批次数
+        """
+        self.pool = pool
+        self.window = max(0.0, window_ms / 1000)
+        self.batch_size = max(1, batch_size)
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._batches = {}  # {设置键: (设置, [(请求, Future)])}，正在收集的批次
+
+    def submit(self, image_bytes, settings, output_format=None, quality=90):
+        """
+        提交一个请求
+
+        Returns:
+            Future，结果为 (输出图片数据, MIME类型)，处理失败时抛出 ValueError
+        """
+        future = Future()
+        entry = ((image_bytes, output_format, quality), future)
+        if self.window == 0 or self.batch_size == 1:
+            self._dispatch(settings, [entry])
+            return future
+
+        key = watermark_renderer.settings_key(settings)
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = (settings, [])
+                timer = threading.Timer(self.window, self._flush, (key, batch))
+                timer.daemon = True
+                timer.start()
+            batch[1].append(entry)
+            full = len(batch[1]) >= self.batch_size
+            if full:
+                del self._batches[key]
+        if full:
+            self._dispatch(*batch)
+        return future
+
+    def _flush(self, key, batch):
+        """等待时间到，提交尚未提交的批次"""
+        with self._lock:
+            if self._batches.get(key) is not batch:
+                # 已经因为达到数量上限而提交
+                return
+            del self._batches[key]
+        self._dispatch(*batch)
+
+    def _dispatch(self, settings, entries):
+        """把一批请求提交到进程池，完成后分发各自的结果"""
+        if self.stats is not None:
+            self.stats.record_batch(len(entries))
+        futures = [future for _, future in entries]
+        try:
+            batch_future = self.pool.submit(render_batch, [item for item, _ in entries], settings)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def deliver(batch_future):
+            try:
+                results = batch_future.result()
+            except Exception as e:
+                # 工作进程崩溃等，整批失败
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, (ok, value) in zip(futures, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(ValueError(value))
+
+        batch_future.add_done_callback(deliver)
+
+
+class ServiceStats:
+    """请求计数和延迟统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def begin(self, nbytes):
+        with self._lock:
+            self.in_flight += 1
+            self.bytes_in += nbytes
+
+    def end(self, elapsed, nbytes_out=0, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.bytes_out += nbytes_out
+            if failed:
+                self.errors += 1
+            else:
+                self._latencies.append(elapsed)
+
+    def record_batch(self, count):
+        """记录一次进程池提交及其中的请求数"""
+        with self._lock:
+            self.batches += 1
+            self.batched_requests += count
+
+    def snapshot(self):
+        """当前统计数据"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            uptime = time.time() - self.started_at
+            data = {
+                "uptime_seconds": round(uptime, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "requests_per_second": round(self.requests / uptime, 2) if uptime > 0 else 0.0,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            }
+        if latencies:
+            data["latency_ms"] = {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 1),
+                "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1),
+            }
+        return data
+
+
+class TemplateSource:
+    """按需重新读取模板文件（文件修改后自动生效）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._templates = {}
+
+    def templates(self):
+        """{模板名称: 模板记录}"""
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        with self._lock:
+            if stamp != self._stamp:
+                self._templates = read_templates(self.path) if stamp is not None else {}
+                self._stamp = stamp
+            return self._templates
+
+
+class WatermarkRequestHandler(BaseHTTPRequestHandler):
+    """处理水印服务的HTTP请求"""
+
+    server_version = "WatermarkService/1.0"
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        elif path == "/templates":
+            self._send_json(200, sorted(self.server.template_source.templates()))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/watermark":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_REQUEST_BYTES:
+            self._send_json(413 if length > 0 else 400, {"error": "invalid request size"})
+            return
+
+        try:
+            params = parse_qs(url.query)
+            settings = self._request_settings(params)
+            output_format = params.get("format", [None])[0]
+            if output_format is not None:
+                output_format = output_format.lower().replace("jpg", "jpeg")
+                if output_format not in ("jpeg", "png"):
+                    raise ValueError(f"unsupported format: {output_format}")
+            quality = int(params.get("quality", [90])[0])
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        image_bytes = self.rfile.read(length)
+        stats = self.server.stats
+        stats.begin(length)
+        start = time.perf_counter()
+        try:
+            future = self.server.batcher.submit(image_bytes, settings, output_format, quality)
+            data, content_type = future.result()
+        except Exception as e:
+            stats.end(time.perf_counter() - start, failed=True)
+            self._send_json(422, {"error": str(e)})
+            return
+
+        elapsed = time.perf_counter() - start
+        stats.end(elapsed, len(data))
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Render-Time-Ms", f"{elapsed * 1000:.1f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _request_settings(self, params):
+        """根据模板名和内联设置得到本次请求的水印设置"""
+        record = {}
+        name = params.get("template", [None])[0]
+        if name is not None:
+            templates = self.server.template_source.templates()
+            if name not in templates:
+                raise ValueError(f"template not found: {name}")
+            record.update(templates[name])
+
+        inline = self.headers.get("X-Watermark-Settings")
+        if inline:
+            parsed = json.loads(inline)
+            if not isinstance(parsed, dict):
+                raise ValueError("X-Watermark-Settings must be a JSON object")
+            record.update(parsed)
+
+        if not record:
+            raise ValueError("either template or X-Watermark-Settings is required")
+        return template_to_settings(record)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 统计数据通过 /stats 查看，不逐条打印请求日志
+        pass
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, templates_path=None,
+                  batch_window_ms=DEFAULT_BATCH_WINDOW_MS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    创建水印服务（尚未开始监听循环）
+
+    Args:
+        workers: 工作进程数，为None时使用 worker_pool.DEFAULT_POOL_WORKERS（CPU核心数的一半，1到4个）
+        templates_path: 模板文件路径，为None时使用当前目录下的 watermark_templates.json
+        batch_window_ms: 合并请求时最多等待的时间（毫秒），为0时不合并
+        batch_size: 每批最多合并的请求数
+    """
+    if templates_path is None:
+        templates_path = os.path.join(os.getcwd(), "watermark_templates.json")
+
+    template_source = TemplateSource(templates_path)
+    warm_settings = [template_to_settings(record) for record in template_source.templates().values()]
+
+    server = ThreadingHTTPServer((host, port), WatermarkRequestHandler)
+    server.daemon_threads = True
+    server.stats = ServiceStats()
+    server.template_source = template_source
+    # 工作进程启动时预先加载所有模板的字体和水印图片
+    server.pool = WarmWorkerPool(workers, warm_settings)
+    server.pool.warm(warm_settings[0] if warm_settings else template_to_settings({}))
+    server.batcher = RequestBatcher(server.pool, batch_window_ms, batch_size, server.stats)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地HTTP水印服务")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址（默认只监听本机）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数（默认为CPU核心数的一半，1到4个）")
+    parser.add_argument("--templates", default=None, help="模板文件路径")
+    parser.add_argument("--batch-window-ms", type=float, default=DEFAULT_BATCH_WINDOW_MS,
+                        help="合并相同设置的请求时最多等待的毫秒数（0表示不合并）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批最多合并的请求数")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.workers, args.templates,
+                           args.batch_window_ms, args.batch_size)
+    print(f"水印服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
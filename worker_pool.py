@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+worker_pool.py - 常驻的渲染进程池
+
+进程池在第一次使用时启动，之后在多次导出、反复修改设置的过程中一直保留。
+每个工作进程在初始化时加载当前设置用到的字体和水印图片，
+之后只在设置的哈希值变化时才重新加载，导出第一张图片的耗时接近稳定状态。
+"""
+
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import watermark_renderer
+
+
+# 默认工作进程数（每个进程同时处理一张大图，进程过多会占用大量内存）
+DEFAULT_POOL_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# 工作进程中已预热的设置哈希值
+_warm_keys = set()
+
+
+def settings_hash(settings):
+    """影响字体和水印图片加载的设置的哈希值"""
+    fields = (
+        settings.get("type"), settings.get("image_path"), settings.get("font_family"),
+        settings.get("font_size"), settings.get("font_bold"), settings.get("font_italic"),
+    )
+    return hashlib.sha1(repr(fields).encode("utf-8")).hexdigest()
+
+
+def warm_worker(settings):
+    """
+    在当前进程中预先加载设置用到的字体和水印图片
+
+    同一设置（按 settings_hash）只加载一次，可以在每个任务开始时调用。
+    """
+    key = settings_hash(settings)
+    if key in _warm_keys:
+        return
+    try:
+        if settings["type"] == "text":
+            font_size = max(1, min(1024, settings["font_size"]))
+            watermark_renderer.get_font(
+                settings["font_family"], font_size, settings["font_bold"], settings["font_italic"]
+            )
+        elif settings["type"] == "image" and settings["image_path"]:
+            watermark_renderer.logo_cache.pyramid(settings["image_path"])
+    except Exception:
+        # 预热失败时由实际渲染报告错误
+        return
+    _warm_keys.add(key)
+
+
+def _init_worker(settings_list):
+    """工作进程初始化"""
+    for settings in settings_list:
+        warm_worker(settings)
+
+
+class WarmWorkerPool:
+    """常驻进程池，工作进程预先加载字体和水印图片"""
+
+    def __init__(self, workers=DEFAULT_POOL_WORKERS, warm_settings=()):
+        """
+        初始化进程池（工作进程在第一次使用时才启动）
+
+        Args:
+            workers: 工作进程数
+            warm_settings: 工作进程初始化时预热的设置列表
+        """
+        self.workers = workers or DEFAULT_POOL_WORKERS
+        self._executor = None
+        self._warm_settings = list(warm_settings)
+        self._warm_key = None
+
+    def _ensure_executor(self):
+        if self._executor is None:
+            # 使用spawn启动，避免在带有界面线程的进程中fork
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context,
+                initializer=_init_worker, initargs=(list(self._warm_settings),)
+            )
+        return self._executor
+
+    def warm(self, settings):
+        """
+        按设置预热工作进程（进程池尚未启动时随之启动）
+
+        设置的哈希值没有变化时不做任何事。
+        """
+        key = settings_hash(settings)
+        if self._executor is not None and key == self._warm_key:
+            return
+        self._warm_key = key
+
+        if self._executor is None:
+            # 新启动的进程在初始化时就加载好
+            self._warm_settings.append(settings)
+        # 提交预热任务让进程立即启动（进程池按需启动进程），
+        # 每个进程大约分到一个；进程内已加载过时立即返回
+        for _ in range(self.workers):
+            self.submit(warm_worker, settings)
+
+    def submit(self, fn, *args):
+        """提交任务，进程池因工作进程崩溃而失效时自动重建"""
+        try:
+            return self._ensure_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            return self._ensure_executor().submit(fn, *args)
+
+    def reset(self):
+        """丢弃已失效的进程池，下次提交任务时重新启动"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def shutdown(self, wait=True):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None